@@ -1,4 +1,5 @@
-from .workflow import run_workflow
+from .workflow import run_workflow, stream_workflow
+from .jobs import get_job_queue, submit_workflow_job
 from .preference_parser import PreferenceParserAgent
 from .educator import EducatorAgent
 from .strategist import StrategistAgent
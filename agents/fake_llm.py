@@ -0,0 +1,226 @@
+from langchain_core.messages import AIMessage, AIMessageChunk
+from agents.prompt_encoding import estimate_tokens
+from utils.logger import logger
+from types import SimpleNamespace
+from typing import Any, Callable, Dict, Iterator, List, Optional
+import hashlib
+import json
+import math
+import random
+import re
+import threading
+import time
+
+# Time to first token (seconds) and generation speed per model, roughly as served by Groq
+MODEL_LATENCY = {
+    "deepseek-r1-distill-llama-70b": {"ttft": 0.6, "tokens_per_second": 250},
+    "llama-3.1-8b-instant": {"ttft": 0.15, "tokens_per_second": 750},
+    "gemma2-9b-it": {"ttft": 0.2, "tokens_per_second": 500},
+    "mixtral-8x7b-32768": {"ttft": 0.25, "tokens_per_second": 450},
+    "llama-guard-3-8b": {"ttft": 0.1, "tokens_per_second": 750}
+}
+DEFAULT_LATENCY = {"ttft": 0.3, "tokens_per_second": 400}
+# Log-normal spread of time to first token; 0 makes every call take exactly the profile's latency
+LATENCY_JITTER = 0.35
+# Tokens per streamed chunk
+CHUNK_TOKENS = 8
+
+_ALLOWED = re.compile(r"Allowed Stocks: ([A-Z][A-Z, ]*)")
+_ONLY = re.compile(r"Only these stocks: ([A-Z][A-Z, ]*)")
+_EVERY_SYMBOL = re.compile(r"mapping every symbol \(([A-Z][A-Z, ]*)\)")
+_HEADLINE_SYMBOL = re.compile(r"news headlines for ([A-Z]+):")
+_RECOMMENDATION_OBJECT = re.compile(r"\{[^{}]*\"Symbol\"[^{}]*\}")
+_AMOUNT = re.compile(r"\$\s?([\d,]+(?:\.\d+)?)")
+
+
+class FakeLLMError(RuntimeError):
+    """Failure injected by FakeChatModel."""
+
+
+class FakeRateLimitError(FakeLLMError):
+    """Injected 429, shaped like the SDK's error so the shared rate limiter handles it."""
+
+    status_code = 429
+
+    def __init__(self, retry_after: float):
+        super().__init__(f"Error code: 429 - injected rate limit, retry after {retry_after:.1f}s")
+        self.response = SimpleNamespace(headers={"retry-after": str(retry_after)})
+
+
+def _symbols(pattern: re.Pattern, text: str) -> List[str]:
+    match = pattern.search(text)
+    return [s.strip() for s in match.group(1).split(",") if s.strip()] if match else []
+
+
+def _seed(*parts: Any) -> int:
+    return int(hashlib.sha256("|".join(str(p) for p in parts).encode("utf-8")).hexdigest()[:12], 16)
+
+
+def _sentiment(seed: int) -> Dict[str, Any]:
+    score = round((seed % 2001) / 1000 - 1.0, 2)
+    label = "Positive" if score >= 0.3 else "Negative" if score <= -0.3 else "Neutral"
+    return {"sentiment": label, "score": score}
+
+
+def _recommendation(symbol: str, seed: int) -> Dict[str, Any]:
+    return {
+        "Symbol": symbol,
+        "Company": f"{symbol} Inc.",
+        "Action": "Buy",
+        "Quantity": 0,
+        "CurrentPrice": 0.0,
+        "TotalCost": 0.0,
+        "Reason": f"{symbol} shows steady revenue growth, healthy margins and a reasonable valuation for the stated goals.",
+        "Caution": f"{symbol} is exposed to sector volatility and valuation risk.",
+        "NewsSentiment": _sentiment(seed)["sentiment"],
+        "Score": 55 + seed % 40
+    }
+
+
+def _pick(symbols: List[str], count: int, seed: int) -> List[str]:
+    if not symbols:
+        symbols = ["AAPL", "MSFT", "NVDA"]
+    start = seed % len(symbols)
+    return [symbols[(start + i * 7) % len(symbols)] for i in range(min(count, len(symbols)))]
+
+
+def fake_response(prompt: str) -> str:
+    """
+    A schema-valid answer for the prompts the agents send, chosen by markers in the prompt and
+    derived from a hash of it, so the same prompt always gets the same answer.
+    """
+    seed = _seed(prompt)
+    if "Task 2 - Trade Validation" in prompt:
+        is_valid = seed % 10 < 8
+        return json.dumps({
+            "analysis": {"risk_assessment": {"score": 30 + seed % 50, "factors": ["Sector volatility"]}},
+            "validation": {"validation_result": {
+                "is_valid": is_valid,
+                "confidence": 60 + seed % 35,
+                "primary_reasons": ["Position fits the stated risk appetite and budget"],
+                "concerns": [] if is_valid else ["Concentration in a volatile sector"],
+                "modifications": {}
+            }},
+            "execution": {"execution_strategy": {"entry_points": ["Market open"], "exit_points": ["15% stop-loss"]}}
+        })
+    if "Return ONLY the list of thoughts" in prompt:
+        return "\n".join(
+            f"🤔 Inner Monologue: Step {i + 1}\n- Projected return: {4 + (seed >> i) % 9}% per year\n"
+            f"- Allocation check: {20 + (seed >> i) % 30}% of the budget in the top pick\n"
+            "Conclusion: the scenario is consistent with the stated preferences."
+            for i in range(3)
+        )
+    if "Required JSON Structure" in prompt and '"recommendations"' in prompt:
+        symbols = _pick(_symbols(_ALLOWED, prompt), 3, seed)
+        return json.dumps({
+            "market_analysis": {"market_summary": {"current_state": "Mixed, with large caps leading"}},
+            "investment_strategy": {"approach": "Diversified core positions"},
+            "recommendations": [_recommendation(s, _seed(prompt, s)) for s in symbols],
+            "insights": "Markets are mixed; favour quality balance sheets and keep position sizes moderate."
+        })
+    if "SelectedRecommendation" in prompt:
+        found = _RECOMMENDATION_OBJECT.findall(prompt)
+        selected = json.loads(found[0]) if found else _recommendation("AAPL", seed)
+        return json.dumps({"SelectedRecommendation": selected,
+                           "SelectionReason": "Highest score with the best fit to the stated preferences."})
+    if "Enhance these stock recommendations" in prompt or '"recommendations" key holds the list' in prompt:
+        symbols = _symbols(_ONLY, prompt)
+        if not symbols:
+            symbols = [json.loads(obj).get("Symbol", "AAPL") for obj in _RECOMMENDATION_OBJECT.findall(prompt)]
+        return json.dumps({"recommendations": [_recommendation(s, _seed(prompt, s)) for s in _pick(symbols, 3, seed)]})
+    if "Each line is `SYMBOL: headline`" in prompt:
+        return json.dumps({s: _sentiment(_seed(prompt, s)) for s in _symbols(_EVERY_SYMBOL, prompt)})
+    if "Analyze the sentiment of these news headlines" in prompt:
+        return json.dumps(_sentiment(seed))
+    if "Some of its fields are invalid" in prompt:
+        return "{}"
+    if "Convert the following answer into valid JSON" in prompt:
+        return prompt[prompt.find("{"):prompt.rfind("}") + 1] or "{}"
+    if "investment persona" in prompt:
+        amount = _AMOUNT.search(prompt.split("**User Input**")[-1])
+        return json.dumps({"risk_appetite": "medium", "investment_goals": "growth", "time_horizon": "medium",
+                           "investment_amount": float(amount.group(1).replace(",", "")) if amount else 10000.0,
+                           "investment_style": "index"})
+    if "is safe and compliant" in prompt:
+        return "Safe"
+    if "Analyze current market conditions" in prompt:
+        return json.dumps({"market_sentiment": {"overall": "Neutral", "factors": ["Rates"], "sector_outlook": {}},
+                           "risk_factors": ["Inflation"], "opportunities": ["Quality large caps"],
+                           "recommendations": ["Stay diversified"]})
+    return "Diversify across sectors, keep costs low and match risk to your time horizon."
+
+
+class FakeChatModel:
+    """
+    Offline stand-in for ChatGroq with the invoke/stream interface ManagedLLM uses. Answers come
+    from fake_response; latency is a log-normal time to first token plus generation at the model's
+    token rate; failures and 429s can be injected at given rates.
+    """
+
+    def __init__(self, model_name: str, latency_scale: float = 1.0, jitter: float = LATENCY_JITTER,
+                 error_rate: float = 0.0, rate_limit_rate: float = 0.0, retry_after: float = 1.0,
+                 seed: int = 0, profile: Optional[Dict[str, float]] = None):
+        self.model_name = model_name
+        self.profile = profile or MODEL_LATENCY.get(model_name, DEFAULT_LATENCY)
+        self.latency_scale = latency_scale
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.retry_after = retry_after
+        self._random = random.Random(_seed(model_name, seed))
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.injected_errors = 0
+
+    def _start(self) -> float:
+        """Count the call, maybe raise an injected failure, and return the time to first token."""
+        with self._lock:
+            self.calls += 1
+            roll = self._random.random()
+            ttft = self.profile["ttft"] * math.exp(self._random.gauss(0.0, self.jitter)) if self.jitter else self.profile["ttft"]
+            if roll < self.rate_limit_rate + self.error_rate:
+                self.injected_errors += 1
+        time.sleep(ttft * self.latency_scale)
+        if roll < self.rate_limit_rate:
+            raise FakeRateLimitError(self.retry_after)
+        if roll < self.rate_limit_rate + self.error_rate:
+            raise FakeLLMError("Injected fake LLM failure")
+        return ttft
+
+    def _usage(self, prompt: str, content: str) -> Dict[str, int]:
+        prompt_tokens = estimate_tokens(prompt)
+        completion_tokens = estimate_tokens(content)
+        return {"input_tokens": prompt_tokens, "output_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens}
+
+    def invoke(self, prompt: Any, **kwargs) -> AIMessage:
+        text = prompt.to_string() if hasattr(prompt, "to_string") else str(prompt)
+        self._start()
+        content = fake_response(text)
+        time.sleep(estimate_tokens(content) / self.profile["tokens_per_second"] * self.latency_scale)
+        return AIMessage(content=content, usage_metadata=self._usage(text, content),
+                         response_metadata={"model_name": self.model_name, "fake": True})
+
+    def stream(self, prompt: Any, **kwargs) -> Iterator[AIMessageChunk]:
+        text = prompt.to_string() if hasattr(prompt, "to_string") else str(prompt)
+        self._start()
+        content = fake_response(text)
+        step = CHUNK_TOKENS * 4
+        pause = CHUNK_TOKENS / self.profile["tokens_per_second"] * self.latency_scale
+        for offset in range(0, len(content), step):
+            if offset:
+                time.sleep(pause)
+            yield AIMessageChunk(content=content[offset:offset + step])
+        yield AIMessageChunk(content="", usage_metadata=self._usage(text, content),
+                             response_metadata={"model_name": self.model_name, "fake": True})
+
+
+def fake_llm_factory(**options) -> Callable[[str], FakeChatModel]:
+    """
+    Client factory for llm_registry.set_llm_factory: every model gets a FakeChatModel built with
+    `options` (latency_scale, jitter, error_rate, rate_limit_rate, retry_after, seed).
+    """
+    def fake_llm_factory(model_name: str) -> FakeChatModel:
+        logger.info(f"Using offline fake chat model for {model_name}")
+        return FakeChatModel(model_name, **options)
+    return fake_llm_factory
@@ -1,12 +1,12 @@
-from langchain_groq import ChatGroq
-from utils.config import GROQ_API_KEY
+from agents.llm_registry import get_llm
+from agents.prompt_encoding import compact_json, compact_preferences
+from agents.structured_output import invoke_structured, StockRecommendation, StructuredOutputError
 from utils.logger import logger
 from typing import List, Dict
-import json
 
 class GroqEnhancerAgent:
     def __init__(self):
-        self.llm = ChatGroq(model_name="mixtral-8x7b-32768", api_key=GROQ_API_KEY)  # Using mixtral model as compound-beta might not be available
+        self.llm = get_llm("mixtral-8x7b-32768", agent="GroqEnhancerAgent")  # Using mixtral model as compound-beta might not be available
 
     def enhance_recommendations(self, recommendations: List[Dict], preferences: Dict) -> List[Dict]:
         """Enhance stock recommendations using Groq's model based on user preferences and additional details."""
@@ -24,10 +24,10 @@ class GroqEnhancerAgent:
             prompt = f"""You are an expert investment advisor. Enhance these stock recommendations based on the user's preferences and additional details.
 
 User Preferences:
-{json.dumps(preferences, indent=2)}
+{compact_preferences(preferences)}
 
 Current Recommendations:
-{json.dumps(recommendations, indent=2)}
+{compact_json(recommendations)}
 
 Task:
 1. Analyze the additional details provided by the user
@@ -37,26 +37,23 @@ Task:
    - Adjust the "Score" if needed based on alignment with additional details
 3. Keep the same format but make recommendations more personalized
 
-Return the enhanced recommendations as a JSON array with the same structure.
+Return only a JSON object whose "recommendations" key holds the enhanced list with the same structure.
 Each recommendation should have: Symbol, Company, Action, Quantity, Reason, Caution, NewsSentiment, Score.
 """
 
-            response = self.llm.invoke(prompt)
-            enhanced_recs = json.loads(response.content)
+            valid_symbols = {str(rec.get("Symbol", "")).upper() for rec in recommendations}
+            enhanced = invoke_structured(
+                self.llm, prompt, StockRecommendation, many=True, key="recommendations",
+                context={"valid_symbols": valid_symbols}
+            )
             logger.info("Successfully enhanced recommendations with Groq")
-            
-            # Validate enhanced recommendations
-            for rec in enhanced_recs:
-                required_keys = ["Symbol", "Company", "Action", "Quantity", "Reason", "Caution", "NewsSentiment", "Score"]
-                if not all(key in rec for key in required_keys):
-                    logger.error(f"Invalid enhanced recommendation format: {rec}")
-                    return recommendations
-                
-                # Ensure Score is within bounds
-                rec["Score"] = max(0, min(100, rec["Score"]))
-
-            return enhanced_recs
+            # Keep fields the schema doesn't cover (e.g. CurrentPrice, TotalCost) from the originals
+            originals = {str(rec.get("Symbol", "")).upper(): rec for rec in recommendations}
+            return [{**originals.get(rec.Symbol, {}), **rec.model_dump()} for rec in enhanced]
 
+        except StructuredOutputError as e:
+            logger.error(f"Groq returned invalid enhanced recommendations, keeping originals: {str(e)}")
+            return recommendations
         except Exception as e:
             logger.error(f"Failed to enhance recommendations with Groq: {str(e)}")
             return recommendations
@@ -68,7 +65,7 @@ Each recommendation should have: Symbol, Company, Action, Quantity, Reason, Caut
             prompt = f"""As an investment advisor, provide brief but valuable market insights based on these preferences:
 
 User Preferences:
-{json.dumps(preferences, indent=2)}
+{compact_preferences(preferences)}
 
 Generate 2-3 concise paragraphs covering:
 1. Market conditions relevant to the user's interests
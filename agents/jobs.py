@@ -0,0 +1,248 @@
+from agents.rate_limiter import request_priority, INTERACTIVE
+from agents.workflow import stream_workflow
+from utils.disk_cache import CACHE_DIR
+from utils.logger import logger
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+import zlib
+
+JOB_DB = CACHE_DIR / "jobs.sqlite3"
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "4"))
+# Finished jobs (and their results) are kept this long so reruns and page switches can pick them up
+JOB_RESULT_TTL = 3600
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+WORKFLOW_JOB = "workflow"
+
+
+class JobStore:
+    """SQLite table of jobs: status, JSON payload and zlib-compressed JSON result."""
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY,
+                kind TEXT NOT NULL,
+                status TEXT NOT NULL,
+                payload TEXT NOT NULL,
+                result BLOB,
+                error TEXT,
+                created REAL NOT NULL,
+                started REAL,
+                finished REAL,
+                expires REAL NOT NULL
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status)")
+        self._conn.commit()
+
+    def create(self, kind: str, payload: Dict) -> str:
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO jobs (id, kind, status, payload, created, expires) VALUES (?, ?, ?, ?, ?, ?)",
+                (job_id, kind, QUEUED, json.dumps(payload, default=str), now, now + JOB_RESULT_TTL)
+            )
+            self._conn.commit()
+        return job_id
+
+    def mark_running(self, job_id: str):
+        with self._lock:
+            self._conn.execute("UPDATE jobs SET status = ?, started = ? WHERE id = ?", (RUNNING, time.time(), job_id))
+            self._conn.commit()
+
+    def finish(self, job_id: str, result: Any = None, error: Optional[str] = None):
+        now = time.time()
+        blob = zlib.compress(json.dumps(result, default=str).encode("utf-8")) if error is None else None
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET status = ?, result = ?, error = ?, finished = ?, expires = ? WHERE id = ?",
+                (FAILED if error else DONE, blob, error, now, now + JOB_RESULT_TTL, job_id)
+            )
+            self._conn.commit()
+
+    def get(self, job_id: str) -> Optional[Dict]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT kind, status, payload, result, error, created, started, finished, expires FROM jobs WHERE id = ?",
+                (job_id,)
+            ).fetchone()
+        if row is None or row[8] < time.time():
+            return None
+        kind, status, payload, result, error, created, started, finished, _ = row
+        return {
+            "id": job_id,
+            "kind": kind,
+            "status": status,
+            "payload": json.loads(payload),
+            "result": json.loads(zlib.decompress(result)) if result else None,
+            "error": error,
+            "created": created,
+            "started": started,
+            "finished": finished
+        }
+
+    def unfinished(self) -> List[Tuple[str, str, Dict]]:
+        """(id, kind, payload) of jobs left queued or running, e.g. by a restart."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id, kind, payload FROM jobs WHERE status IN (?, ?) AND expires >= ? ORDER BY created",
+                (QUEUED, RUNNING, time.time())
+            ).fetchall()
+        return [(job_id, kind, json.loads(payload)) for job_id, kind, payload in rows]
+
+    def purge_expired(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM jobs WHERE expires < ? AND status IN (?, ?)", (time.time(), DONE, FAILED))
+            self._conn.commit()
+
+    def counts(self) -> Dict[str, int]:
+        with self._lock:
+            rows = self._conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall()
+        return dict(rows)
+
+
+class JobQueue:
+    """
+    In-process worker pool over a JobStore. Handlers receive the job payload and an `emit`
+    callback for progress events; events are held in memory for polling while the job's
+    status and final result are persisted, so a finished job outlives the page that started it.
+    """
+
+    def __init__(self, store: JobStore, workers: int = JOB_WORKERS):
+        self.store = store
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="job")
+        self._handlers: Dict[str, Callable[[Dict, Callable[[Dict], None]], Any]] = {}
+        self._events: Dict[str, List[Dict]] = {}
+        # When each finished job's persisted record expires, so its events can go with it
+        self._expires: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def register(self, kind: str, handler: Callable[[Dict, Callable[[Dict], None]], Any]):
+        self._handlers[kind] = handler
+
+    def submit(self, kind: str, payload: Dict) -> str:
+        """Queue a job and return its id immediately."""
+        if kind not in self._handlers:
+            raise ValueError(f"No handler registered for job kind '{kind}'")
+        self.store.purge_expired()
+        job_id = self.store.create(kind, payload)
+        self._enqueue(job_id, kind, payload)
+        logger.info(f"Queued {kind} job {job_id}")
+        return job_id
+
+    def _enqueue(self, job_id: str, kind: str, payload: Dict):
+        with self._lock:
+            self._events[job_id] = []
+        self._pool.submit(self._run, job_id, kind, payload)
+
+    def resume_unfinished(self):
+        """
+        Re-queue jobs a previous process left queued or running. Interrupted trade workflows are marked
+        failed instead: their session is gone, and a trade should only run while its user is waiting on it.
+        """
+        for job_id, kind, payload in self.store.unfinished():
+            if kind not in self._handlers or job_id in self._events:
+                continue
+            if payload.get("is_trade"):
+                logger.info(f"Not resuming interrupted trade {kind} job {job_id}")
+                self.store.finish(job_id, error="Interrupted by a restart; trades are not resumed")
+                continue
+            logger.info(f"Re-queuing interrupted {kind} job {job_id}")
+            self._enqueue(job_id, kind, payload)
+
+    def _emit(self, job_id: str, event: Dict):
+        with self._lock:
+            self._events.setdefault(job_id, []).append(event)
+
+    def _run(self, job_id: str, kind: str, payload: Dict):
+        self.store.mark_running(job_id)
+        started = time.perf_counter()
+        try:
+            with request_priority(payload.get("priority", INTERACTIVE)):
+                result = self._handlers[kind](payload, lambda event: self._emit(job_id, event))
+            self.store.finish(job_id, result)
+            logger.info(f"{kind} job {job_id} finished in {time.perf_counter() - started:.2f}s")
+        except Exception as e:
+            logger.error(f"{kind} job {job_id} failed: {str(e)}")
+            self.store.finish(job_id, error=str(e))
+        finally:
+            with self._lock:
+                self._expires[job_id] = time.time() + JOB_RESULT_TTL
+            self._drop_old_events()
+
+    def _drop_old_events(self):
+        """Forget in-memory events of finished jobs whose persisted record has expired."""
+        now = time.time()
+        with self._lock:
+            for job_id in [job_id for job_id, expires in self._expires.items() if expires < now]:
+                del self._expires[job_id]
+                self._events.pop(job_id, None)
+
+    def get(self, job_id: str) -> Optional[Dict]:
+        """Persisted job record (status, payload, result, error), or None if unknown or expired."""
+        return self.store.get(job_id)
+
+    def events(self, job_id: str, since: int = 0) -> List[Dict]:
+        """Progress events emitted after the first `since`; empty once the process that ran the job is gone."""
+        with self._lock:
+            return list(self._events.get(job_id, [])[since:])
+
+    def stats(self) -> Dict[str, int]:
+        return self.store.counts()
+
+
+def _run_workflow_job(payload: Dict, emit: Callable[[Dict], None]) -> Dict:
+    """Checkpointed under the job's run id, so a job re-queued after a restart resumes where it stopped."""
+    result = None
+    for event in stream_workflow(payload["preferences"], payload["user_id"], is_trade=payload.get("is_trade", False),
+                                 run_id=payload.get("run_id")):
+        if event["type"] == "result":
+            result = event["result"]
+        else:
+            emit(event)
+    if result is None:
+        raise RuntimeError("Workflow finished without a result")
+    return result
+
+
+_queue: Optional[JobQueue] = None
+_queue_lock = threading.Lock()
+
+
+def get_job_queue() -> JobQueue:
+    """Process-wide job queue, created (and any interrupted jobs re-queued) on first use."""
+    global _queue
+    if _queue is None:
+        with _queue_lock:
+            if _queue is None:
+                queue = JobQueue(JobStore(JOB_DB))
+                queue.register(WORKFLOW_JOB, _run_workflow_job)
+                queue.resume_unfinished()
+                _queue = queue
+    return _queue
+
+
+def submit_workflow_job(preferences: Dict, user_id: str, is_trade: bool = False, priority: int = INTERACTIVE) -> str:
+    """Queue a recommendation workflow and return the job id to poll. Each job checkpoints under its own run id."""
+    return get_job_queue().submit(WORKFLOW_JOB, {
+        "preferences": preferences, "user_id": user_id, "is_trade": is_trade, "priority": priority,
+        "run_id": uuid.uuid4().hex
+    })
@@ -0,0 +1,110 @@
+from langchain_core.messages import AIMessage
+from utils.disk_cache import DiskCache, CACHE_DIR
+from utils.logger import logger
+from typing import Any, Dict, Optional
+import hashlib
+import json
+import os
+import re
+import threading
+
+LLM_CACHE_ENABLED = os.getenv("LLM_CACHE_ENABLED", "1") != "0"
+LLM_CACHE_TTL = int(os.getenv("LLM_CACHE_TTL", "3600"))
+LLM_CACHE_MAX_ENTRIES = 5000
+LLM_CACHE_MAX_BYTES = 100 * 1024 * 1024
+NAMESPACE = "llm"
+# Agents whose answers depend only on the prompt, with their cache TTL in seconds. Every other agent
+# (trade validation, guardrail verdicts, analyses tied to live holdings) is uncached unless get_llm
+# is given a cache_ttl.
+CACHED_AGENTS = {
+    "EducatorAgent": 24 * 3600,
+    "MarketAnalystAgent": LLM_CACHE_TTL,
+    "PreferenceParserAgent": LLM_CACHE_TTL
+}
+
+
+def normalize_prompt(prompt: Any) -> str:
+    """Prompt text with whitespace runs collapsed, so formatting-only differences share a key."""
+    if hasattr(prompt, "to_string"):
+        text = prompt.to_string()
+    elif isinstance(prompt, (list, tuple)):
+        text = "\n".join(f"{getattr(m, 'type', 'human')}: {getattr(m, 'content', m)}" for m in prompt)
+    else:
+        text = str(prompt)
+    return re.sub(r"\s+", " ", text).strip()
+
+
+def cache_key(model_name: str, prompt: Any, kwargs: Optional[Dict] = None) -> str:
+    payload = "\n".join([model_name, json.dumps(kwargs or {}, sort_keys=True, default=str), normalize_prompt(prompt)])
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class LLMCache:
+    """Disk-backed cache of LLM completions keyed by model, call options and normalized prompt."""
+
+    def __init__(self, store: DiskCache, ttl: int = LLM_CACHE_TTL):
+        self.store = store
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.saved_seconds = 0.0
+
+    def get(self, model_name: str, prompt: Any, kwargs: Optional[Dict] = None) -> Optional[AIMessage]:
+        entry = self.store.get(NAMESPACE, cache_key(model_name, prompt, kwargs))
+        with self._lock:
+            if entry is None:
+                self.misses += 1
+                return None
+            content, meta = entry
+            self.hits += 1
+            self.saved_seconds += meta.get("latency", 0.0)
+        logger.info(f"LLM cache hit for {model_name}, saved {meta.get('latency', 0.0):.2f}s")
+        return AIMessage(content=content, response_metadata={"cache_hit": True, "model_name": model_name})
+
+    def put(self, model_name: str, prompt: Any, kwargs: Optional[Dict], content: str, latency: float,
+            ttl: Optional[int] = None):
+        if not content or not content.strip():
+            return
+        try:
+            self.store.set(NAMESPACE, cache_key(model_name, prompt, kwargs), content, ttl or self.ttl,
+                           {"latency": latency, "model": model_name})
+        except Exception as e:
+            logger.error(f"Failed to write LLM cache entry: {str(e)}")
+
+    def stats(self) -> Dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "saved_seconds": round(self.saved_seconds, 2),
+                "stored": self.store.stats().get(NAMESPACE, {"entries": 0, "bytes": 0})
+            }
+
+
+_cache: Optional[LLMCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_llm_cache() -> Optional[LLMCache]:
+    """Process-wide LLM cache, or None when disabled or the cache file can't be opened."""
+    global _cache, LLM_CACHE_ENABLED
+    if not LLM_CACHE_ENABLED:
+        return None
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                try:
+                    _cache = LLMCache(DiskCache(CACHE_DIR / "llm_cache.sqlite3", LLM_CACHE_MAX_ENTRIES, LLM_CACHE_MAX_BYTES))
+                except Exception as e:
+                    logger.error(f"Failed to open LLM cache, continuing without it: {str(e)}")
+                    LLM_CACHE_ENABLED = False
+                    return None
+    return _cache
+
+
+def llm_cache_stats() -> Dict:
+    cache = get_llm_cache()
+    return cache.stats() if cache else {"hits": 0, "misses": 0, "hit_rate": 0.0, "saved_seconds": 0.0, "stored": {}}
@@ -0,0 +1,223 @@
+from langchain_groq import ChatGroq
+from langchain_core.messages import AIMessage, AIMessageChunk
+from agents.llm_cache import get_llm_cache, CACHED_AGENTS
+from agents.telemetry import telemetry, call_site
+from agents.token_budget import token_ledger, usage_from_response
+from agents.rate_limiter import (
+    get_rate_limiter, is_rate_limit_error, observe_response, retry_after_from, MAX_RATE_LIMIT_RETRIES
+)
+from utils.config import GROQ_API_KEY
+from utils.logger import logger
+from typing import Any, Callable, Dict, Optional
+import threading
+import time
+import httpx
+
+# Maximum concurrent in-flight requests per model
+MODEL_CONCURRENCY = {
+    "deepseek-r1-distill-llama-70b": 4,
+    "llama-3.1-8b-instant": 8,
+    "gemma2-9b-it": 4,
+    "mixtral-8x7b-32768": 4,
+    "llama-guard-3-8b": 8
+}
+DEFAULT_CONCURRENCY = 4
+
+
+class _ModelSlot:
+    """One shared client per model plus the semaphore that bounds its concurrency."""
+
+    def __init__(self, model_name: str, client: Any, limit: int):
+        self.model_name = model_name
+        self.client = client
+        self.limit = limit
+        self.semaphore = threading.BoundedSemaphore(limit)
+        self.in_flight = 0
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        self.semaphore.acquire()
+        with self._lock:
+            self.in_flight += 1
+
+    def release(self):
+        with self._lock:
+            self.in_flight -= 1
+        self.semaphore.release()
+
+
+class ManagedLLM:
+    """
+    Per-agent handle onto a shared chat client. Exposes the invoke/stream interface the agents
+    already use, so every LLM call goes through one place.
+    """
+
+    def __init__(self, slot: _ModelSlot, agent: str, bound_kwargs: Optional[Dict] = None,
+                 cache_ttl: Optional[int] = None):
+        self._slot = slot
+        self.agent = agent
+        self._bound_kwargs = bound_kwargs or {}
+        # Seconds responses are cached for; 0 (or None) disables caching for this handle
+        self.cache_ttl = cache_ttl
+
+    @property
+    def model_name(self) -> str:
+        return self._slot.model_name
+
+    def bind(self, **kwargs) -> "ManagedLLM":
+        """Return a handle that passes extra keyword arguments (e.g. response_format) on every call."""
+        return ManagedLLM(self._slot, self.agent, {**self._bound_kwargs, **kwargs}, self.cache_ttl)
+
+    def _cache(self):
+        return get_llm_cache() if self.cache_ttl else None
+
+    def invoke(self, prompt, **kwargs):
+        call_kwargs = {**self._bound_kwargs, **kwargs}
+        method = call_site()
+        called = time.perf_counter()
+        cache = self._cache()
+        if cache is not None:
+            cached = cache.get(self.model_name, prompt, call_kwargs)
+            if cached is not None:
+                telemetry.record(self.model_name, self.agent, method, "invoke", cache_hit=True,
+                                 total=time.perf_counter() - called)
+                return cached
+
+        prompt_tokens = token_ledger.check(self.agent, prompt)
+        limiter = get_rate_limiter(self.model_name)
+        for attempt in range(MAX_RATE_LIMIT_RETRIES + 1):
+            limiter.acquire(prompt_tokens)
+            self._slot.acquire()
+            try:
+                started = time.perf_counter()
+                response = self._slot.client.invoke(prompt, **call_kwargs)
+                latency = time.perf_counter() - started
+                break
+            except Exception as e:
+                if not is_rate_limit_error(e) or attempt == MAX_RATE_LIMIT_RETRIES:
+                    telemetry.record(self.model_name, self.agent, method, "invoke", prompt_tokens=prompt_tokens,
+                                     total=time.perf_counter() - called, retries=attempt, error=type(e).__name__)
+                    raise
+                limiter.on_rate_limited(retry_after_from(e))
+            finally:
+                self._slot.release()
+        limiter.on_success()
+
+        usage = usage_from_response(response, prompt)
+        token_ledger.record(self.agent, self.model_name, usage["prompt_tokens"], usage["completion_tokens"])
+        telemetry.record(self.model_name, self.agent, method, "invoke", usage["prompt_tokens"],
+                         usage["completion_tokens"], latency, time.perf_counter() - called, attempt)
+        if cache is not None:
+            cache.put(self.model_name, prompt, call_kwargs, getattr(response, "content", ""), latency, self.cache_ttl)
+        return response
+
+    def stream(self, prompt, **kwargs):
+        call_kwargs = {**self._bound_kwargs, **kwargs}
+        method = call_site()
+        called = time.perf_counter()
+        cache = self._cache()
+        if cache is not None:
+            cached = cache.get(self.model_name, prompt, call_kwargs)
+            if cached is not None:
+                telemetry.record(self.model_name, self.agent, method, "stream", cache_hit=True,
+                                 total=time.perf_counter() - called)
+                yield AIMessageChunk(content=cached.content, response_metadata=cached.response_metadata)
+                return
+
+        prompt_tokens = token_ledger.check(self.agent, prompt)
+        limiter = get_rate_limiter(self.model_name)
+        parts = []
+        usage_metadata = None
+        first_token = None
+        for attempt in range(MAX_RATE_LIMIT_RETRIES + 1):
+            limiter.acquire(prompt_tokens)
+            self._slot.acquire()
+            try:
+                started = time.perf_counter()
+                for chunk in self._slot.client.stream(prompt, **call_kwargs):
+                    if first_token is None:
+                        first_token = time.perf_counter() - started
+                    parts.append(getattr(chunk, "content", "") or "")
+                    usage_metadata = getattr(chunk, "usage_metadata", None) or usage_metadata
+                    yield chunk
+                latency = time.perf_counter() - started
+                break
+            except Exception as e:
+                # Only retry if nothing has been streamed to the caller yet
+                if parts or not is_rate_limit_error(e) or attempt == MAX_RATE_LIMIT_RETRIES:
+                    telemetry.record(self.model_name, self.agent, method, "stream", prompt_tokens=prompt_tokens,
+                                     total=time.perf_counter() - called, retries=attempt, first_token=first_token,
+                                     error=type(e).__name__)
+                    raise
+                limiter.on_rate_limited(retry_after_from(e))
+            finally:
+                self._slot.release()
+        limiter.on_success()
+
+        usage = usage_from_response(AIMessage(content="".join(parts), usage_metadata=usage_metadata), prompt)
+        token_ledger.record(self.agent, self.model_name, usage["prompt_tokens"], usage["completion_tokens"])
+        telemetry.record(self.model_name, self.agent, method, "stream", usage["prompt_tokens"],
+                         usage["completion_tokens"], latency, time.perf_counter() - called, attempt, first_token=first_token)
+        if cache is not None:
+            cache.put(self.model_name, prompt, call_kwargs, "".join(parts), latency, self.cache_ttl)
+
+
+_lock = threading.Lock()
+_slots: Dict[str, _ModelSlot] = {}
+_http_client: Optional[httpx.Client] = None
+_factory: Optional[Callable[[str], Any]] = None
+
+
+def _shared_http_client() -> httpx.Client:
+    """Keep-alive HTTP pool shared by every Groq client in the process."""
+    global _http_client
+    if _http_client is None:
+        _http_client = httpx.Client(
+            limits=httpx.Limits(max_connections=32, max_keepalive_connections=16),
+            timeout=httpx.Timeout(120.0, connect=10.0),
+            event_hooks={"response": [observe_response]}
+        )
+    return _http_client
+
+
+def _default_factory(model_name: str) -> Any:
+    # Retries are scheduled by the shared rate limiter rather than the SDK's own blocking back-off
+    return ChatGroq(model_name=model_name, api_key=GROQ_API_KEY, http_client=_shared_http_client(), max_retries=0)
+
+
+def set_llm_factory(factory: Optional[Callable[[str], Any]]):
+    """
+    Swap the function that builds a chat client for a model name (e.g. an offline stand-in).
+    Pass None to restore ChatGroq. Existing clients are dropped.
+    """
+    global _factory
+    with _lock:
+        _factory = factory
+        _slots.clear()
+    logger.info(f"LLM factory set to {'ChatGroq' if factory is None else getattr(factory, '__name__', repr(factory))}")
+
+
+def get_llm(model_name: str, agent: str = "default", cache_ttl: Optional[int] = None) -> ManagedLLM:
+    """
+    Return a handle on the process-wide client for `model_name`, creating it on first use.
+    Responses are cached on disk for `cache_ttl` seconds (the agent's CACHED_AGENTS entry if None;
+    agents not listed there are uncached).
+    """
+    slot = _slots.get(model_name)
+    if slot is None:
+        with _lock:
+            slot = _slots.get(model_name)
+            if slot is None:
+                client = (_factory or _default_factory)(model_name)
+                slot = _ModelSlot(model_name, client, MODEL_CONCURRENCY.get(model_name, DEFAULT_CONCURRENCY))
+                _slots[model_name] = slot
+                logger.info(f"Created shared LLM client for {model_name} (concurrency {slot.limit})")
+    return ManagedLLM(slot, agent, cache_ttl=CACHED_AGENTS.get(agent, 0) if cache_ttl is None else cache_ttl)
+
+
+def registry_stats() -> Dict[str, Dict]:
+    """In-flight requests, concurrency limit and rate-limiter state per model."""
+    return {
+        name: {"in_flight": slot.in_flight, "limit": slot.limit, **get_rate_limiter(name).stats()}
+        for name, slot in list(_slots.items())
+    }
@@ -1,20 +1,41 @@
-from langchain_groq import ChatGroq
-from utils.config import GROQ_API_KEY, NEWSAPI_KEY, FINNHUB_API_KEY
+from agents.llm_registry import get_llm
+from agents.prompt_encoding import financials_line
+from agents.structured_output import json_mode
+from analytics.sentiment_lexicon import get_lexicon_scorer, record_llm_labels
+from utils.json_extraction import extract_json
+from utils.config import NEWSAPI_KEY, FINNHUB_API_KEY
 from utils.logger import logger
 import finnhub
-import mysql.connector
-from data.mysql_db import get_db_connection
 from newsapi import NewsApiClient
+import contextvars
+import os
+import random
 import time
 from datetime import datetime, timedelta
 from cachetools import TTLCache
 from typing import Dict, List
-import json
+from concurrent.futures import ThreadPoolExecutor
+
+# Symbols scored per batched sentiment call, and headlines considered per symbol
+SENTIMENT_BATCH_SIZE = 10
+HEADLINES_PER_SYMBOL = 5
+
+# "llm": every symbol goes to the LLM; "lexicon": offline scorer only;
+# "hybrid": offline scorer first, LLM for symbols below SENTIMENT_MIN_CONFIDENCE.
+# Stays "llm" until scripts/calibrate_sentiment.py shows the lexicon agrees at the chosen confidence.
+SENTIMENT_MODE = os.getenv("SENTIMENT_MODE", "llm")
+SENTIMENT_MIN_CONFIDENCE = float(os.getenv("SENTIMENT_MIN_CONFIDENCE", "0.5"))
+# Share of symbols the lexicon settles confidently in hybrid mode that still go to the LLM, so their
+# labels are recorded and calibration keeps measuring agreement where the lexicon is trusted
+SENTIMENT_AUDIT_RATE = float(os.getenv("SENTIMENT_AUDIT_RATE", "0.1"))
+
+# NewsAPI requests and batched sentiment calls run here
+_news_pool = ThreadPoolExecutor(max_workers=8, thread_name_prefix="news")
 
 
 class MarketAnalystAgent:
     def __init__(self):
-        self.llm = ChatGroq(model_name="llama-3.1-8b-instant", api_key=GROQ_API_KEY)
+        self.llm = get_llm("llama-3.1-8b-instant", agent="MarketAnalystAgent")
         self.finnhub_client = finnhub.Client(api_key=FINNHUB_API_KEY)
         self.newsapi_client = NewsApiClient(api_key=NEWSAPI_KEY)
         self.cache = TTLCache(maxsize=100, ttl=3600)
@@ -27,6 +48,7 @@ class MarketAnalystAgent:
 
         try:
             logger.info(f"Fetching MySQL financials for CIK {cik}")
+            from data.mysql_db import get_db_connection  # initializes the schema on first import
             conn = get_db_connection()
             cursor = conn.cursor(dictionary=True)
 
@@ -74,36 +96,93 @@ class MarketAnalystAgent:
             logger.error(f"Failed to fetch financials for CIK {cik}: {str(e)}")
             return {}
 
-    def fetch_news_sentiment(self, symbols: List[str]) -> Dict[str, str]:
-        sentiments = {}
-        to_date = datetime.now()
-        from_date = to_date - timedelta(days=7)
-
+    def fetch_fundamentals(self, symbols: List[str]) -> Dict[str, Dict]:
+        """
+        Company name, CIK and five years of financial statements for each symbol in the stocks table.
+        CIKs come from the table rather than Finnhub, and each statement table is read once for all
+        symbols instead of once per company.
+        """
+        fundamentals = {}
+        pending = []
         for symbol in symbols:
-            cache_key = f"news_{symbol}"
-            if cache_key in self.cache:
-                logger.info(f"Returning cached news sentiment for {symbol}")
-                sentiments[symbol] = self.cache[cache_key]
-                continue
+            cached = self.cache.get(f"fundamentals_{symbol}")
+            if cached is not None:
+                fundamentals[symbol] = cached
+            else:
+                pending.append(symbol)
+        if not pending:
+            return fundamentals
 
-            try:
-                logger.info(f"Fetching news for {symbol}")
-                response = self.newsapi_client.get_everything(
-                    q=symbol,
-                    from_param=from_date.strftime('%Y-%m-%d'),
-                    to=to_date.strftime('%Y-%m-%d'),
-                    language='en',
-                    sort_by='relevancy'
-                )
-                articles = response.get('articles', [])
-                if not articles:
-                    logger.info(f"No news articles found for {symbol}")
-                    sentiments[symbol] = "Neutral"
-                    self.cache[cache_key] = "Neutral"
-                    continue
+        try:
+            logger.info(f"Fetching MySQL fundamentals for {len(pending)} symbols")
+            from data.mysql_db import get_db_connection  # initializes the schema on first import
+            conn = get_db_connection()
+            cursor = conn.cursor(dictionary=True)
+            cursor.execute(
+                f"SELECT cik, symbol, company_name FROM stocks WHERE symbol IN ({', '.join(['%s'] * len(pending))})",
+                tuple(pending)
+            )
+            companies = {row["cik"]: row for row in cursor.fetchall() or []}
+            statements = {cik: {"income": [], "balance": [], "cash_flow": []} for cik in companies}
+
+            if companies:
+                five_years_ago = datetime.now() - timedelta(days=5*365)
+                cik_list = ", ".join(["%s"] * len(companies))
+                for key, table, columns in (
+                    ("income", "income_statements", "revenue, net_income, fiscal_date_ending"),
+                    ("balance", "balance_sheets", "total_assets, total_liabilities, total_equity"),
+                    ("cash_flow", "cash_flows", "operating_cash_flow, capital_expenditure")
+                ):
+                    cursor.execute(f"""
+                        SELECT cik, {columns}
+                        FROM {table}
+                        WHERE cik IN ({cik_list}) AND fiscal_date_ending >= %s
+                        ORDER BY fiscal_date_ending DESC
+                    """, tuple(companies) + (five_years_ago,))
+                    for row in cursor.fetchall() or []:
+                        statements[row.pop("cik")][key].append(row)
 
-                headlines = [article['title'] for article in articles[:5]]
-                prompt = f"""
+            cursor.close()
+            conn.close()
+        except Exception as e:
+            logger.error(f"Failed to fetch fundamentals: {str(e)}")
+            return fundamentals
+
+        for cik, company in companies.items():
+            entry = {"company": company["company_name"], "cik": cik, "financials": statements[cik]}
+            self.cache[f"fundamentals_{company['symbol']}"] = entry
+            self.cache[f"financials_{cik}"] = entry["financials"]
+            fundamentals[company["symbol"]] = entry
+        logger.info(f"Fundamentals found for {len(companies)} of {len(pending)} symbols")
+        return fundamentals
+
+    def _fetch_headlines(self, symbol: str, from_date: datetime, to_date: datetime) -> List[str]:
+        logger.info(f"Fetching news for {symbol}")
+        response = self.newsapi_client.get_everything(
+            q=symbol,
+            from_param=from_date.strftime('%Y-%m-%d'),
+            to=to_date.strftime('%Y-%m-%d'),
+            language='en',
+            sort_by='relevancy'
+        )
+        articles = response.get('articles', [])
+        return [article['title'] for article in articles[:HEADLINES_PER_SYMBOL] if article.get('title')]
+
+    @staticmethod
+    def _sentiment_label(result: Dict) -> str:
+        """Label from an LLM result, falling back to the ±0.3 score thresholds when the label is invalid."""
+        sentiment = result.get("sentiment")
+        if sentiment in ("Positive", "Negative", "Neutral"):
+            return sentiment
+        try:
+            score = float(result.get("score"))
+        except (TypeError, ValueError):
+            return "Neutral"
+        return "Positive" if score >= 0.3 else "Negative" if score <= -0.3 else "Neutral"
+
+    def _score_headlines(self, symbol: str, headlines: List[str]) -> str:
+        """Score one symbol's headlines with a single LLM call."""
+        prompt = f"""
 Analyze the sentiment of these news headlines for {symbol}:
 {headlines}
 Score sentiment from -1 (negative) to 1 (positive). Return a JSON object:
@@ -114,26 +193,134 @@ Score sentiment from -1 (negative) to 1 (positive). Return a JSON object:
 }}
 Where sentiment is 'Positive' (>=0.3), 'Negative' (<= -0.3), or 'Neutral' (else).
 """
-                response = self.llm.invoke(prompt)
-                result = json.loads(response.content.strip())
-                sentiment = result.get("sentiment", "Neutral")
-
-                if sentiment not in ["Positive", "Negative", "Neutral"]:
-                    logger.warning(f"Invalid sentiment for {symbol}: {sentiment}")
-                    sentiment = "Neutral"
+        response = self.llm.invoke(prompt)
+        return self._sentiment_label(extract_json(response.content, dict))
+
+    def _score_headline_batch(self, headlines: Dict[str, List[str]]) -> Dict[str, str]:
+        """
+        Score several symbols' headlines in one JSON-mode LLM call returning a per-symbol map.
+        Symbols missing from the answer are left out, for the caller to score individually.
+        """
+        lines = "\n".join(f"{symbol}: {title}" for symbol, titles in headlines.items() for title in titles)
+        prompt = f"""
+Analyze the sentiment of recent news headlines for each stock. Each line is `SYMBOL: headline`.
+{lines}
+
+Score each stock's overall sentiment from -1 (negative) to 1 (positive).
+Return only a JSON object mapping every symbol ({", ".join(headlines)}) to {{"sentiment": ..., "score": ...}},
+e.g. {{"AAPL": {{"sentiment": "Positive", "score": 0.8}}}}.
+Where sentiment is 'Positive' (>=0.3), 'Negative' (<= -0.3), or 'Neutral' (else).
+"""
+        try:
+            response = json_mode(self.llm).invoke(prompt)
+            result = extract_json(response.content, dict)
+        except Exception as e:
+            logger.error(f"Batched sentiment scoring failed for {', '.join(headlines)}: {str(e)}")
+            return {}
+        result = {str(symbol).upper(): value for symbol, value in result.items()}
+        return {
+            symbol: self._sentiment_label(result[symbol])
+            for symbol in headlines if isinstance(result.get(symbol), dict)
+        }
+
+    def _apply_lexicon(self, headlines: Dict[str, List[str]], sentiments: Dict[str, str]) -> Dict[str, List[str]]:
+        """
+        Score headlines with the offline lexicon, filling `sentiments` (and the cache) for every symbol
+        it settles. In hybrid mode only confident scores are kept, and a SENTIMENT_AUDIT_RATE sample of
+        those is also sent to the LLM for calibration; returns the symbols left for the LLM.
+        """
+        scorer = get_lexicon_scorer()
+        remaining = {}
+        audited = 0
+        for symbol, titles in headlines.items():
+            result = scorer.score_symbol(titles)
+            if SENTIMENT_MODE == "hybrid" and result["confidence"] < SENTIMENT_MIN_CONFIDENCE:
+                remaining[symbol] = titles
+                continue
+            if SENTIMENT_MODE == "hybrid" and random.random() < SENTIMENT_AUDIT_RATE:
+                remaining[symbol] = titles
+                audited += 1
+                continue
+            logger.info(f"Lexicon news sentiment for {symbol}: {result['sentiment']} "
+                        f"(score {result['score']}, confidence {result['confidence']})")
+            sentiments[symbol] = result["sentiment"]
+            self.cache[f"news_{symbol}"] = result["sentiment"]
+        if SENTIMENT_MODE == "hybrid":
+            logger.info(f"Lexicon settled {len(headlines) - len(remaining)} of {len(headlines)} symbols, "
+                        f"escalating {len(remaining) - audited} to the LLM and auditing {audited} confident ones")
+        return remaining
 
-                logger.info(f"News sentiment for {symbol}: {sentiment}")
-                sentiments[symbol] = sentiment
-                self.cache[cache_key] = sentiment
+    def fetch_news_sentiment(self, symbols: List[str]) -> Dict[str, str]:
+        """
+        News sentiment per symbol. Headlines are fetched concurrently; depending on SENTIMENT_MODE
+        they're scored by the offline lexicon, by the LLM, or by the lexicon with low-confidence
+        symbols escalated to the LLM. LLM scoring handles SENTIMENT_BATCH_SIZE symbols per call and
+        retries symbols a batch fails to score one at a time.
+        """
+        sentiments = {}
+        to_date = datetime.now()
+        from_date = to_date - timedelta(days=7)
 
+        pending = []
+        for symbol in symbols:
+            cache_key = f"news_{symbol}"
+            if cache_key in self.cache:
+                logger.info(f"Returning cached news sentiment for {symbol}")
+                sentiments[symbol] = self.cache[cache_key]
+            else:
+                pending.append(symbol)
+        if not pending:
+            return sentiments
+
+        headlines = {}
+        futures = {symbol: _news_pool.submit(self._fetch_headlines, symbol, from_date, to_date) for symbol in pending}
+        for symbol, future in futures.items():
+            try:
+                titles = future.result()
             except Exception as e:
                 logger.error(f"Failed to fetch news for {symbol}: {str(e)}")
-                if "429" in str(e):
-                    time.sleep(10)
                 sentiments[symbol] = "Neutral"
-                self.cache[cache_key] = "Neutral"
+                continue
+            if titles:
+                headlines[symbol] = titles
+            else:
+                logger.info(f"No news articles found for {symbol}")
+                sentiments[symbol] = "Neutral"
+                self.cache[f"news_{symbol}"] = "Neutral"
+
+        if SENTIMENT_MODE in ("lexicon", "hybrid") and headlines:
+            headlines = self._apply_lexicon(headlines, sentiments)
+
+        batches = [dict(list(headlines.items())[i:i + SENTIMENT_BATCH_SIZE])
+                   for i in range(0, len(headlines), SENTIMENT_BATCH_SIZE)]
+        scored = {}
+        if len(headlines) > 1:
+            # copy_context keeps the caller's request priority for the LLM calls
+            for batch_result in _news_pool.map(
+                lambda batch, ctx: ctx.run(self._score_headline_batch, batch),
+                batches,
+                [contextvars.copy_context() for _ in batches]
+            ):
+                scored.update(batch_result)
+            logger.info(f"Scored {len(scored)} of {len(headlines)} symbols in {len(batches)} batched sentiment call(s)")
+
+        llm_labels = {}
+        for symbol, titles in headlines.items():
+            sentiment = scored.get(symbol)
+            if sentiment is None:
+                try:
+                    sentiment = self._score_headlines(symbol, titles)
+                except Exception as e:
+                    logger.error(f"Failed to score news for {symbol}: {str(e)}")
+                    sentiments[symbol] = "Neutral"
+                    continue
+            logger.info(f"News sentiment for {symbol}: {sentiment}")
+            sentiments[symbol] = sentiment
+            llm_labels[symbol] = sentiment
+            self.cache[f"news_{symbol}"] = sentiment
+        record_llm_labels(headlines, llm_labels)
 
-        return sentiments
+        return {symbol: sentiments[symbol] for symbol in symbols if symbol in sentiments}
 
     def calculate_ratios(self, financials: dict, current_price: float, shares_outstanding: float) -> dict:
         try:
@@ -206,7 +393,7 @@ Low: ${stock_data['low']:.2f}
 P/E Ratio: {stock_data['pe_ratio'] or 'N/A'}
 Debt-to-Equity: {stock_data['debt_to_equity'] or 'N/A'}
 Company: {stock_data['company']}
-Financials (5 years): {stock_data['financials']}
+Financials (5-year summary): {financials_line(stock_data['financials'])}
 News Sentiment: {news_sentiment}
 Provide a brief analysis (3-4 sentences) covering market trends, financial health, and risks.
 Return the analysis as a string.
@@ -216,10 +403,10 @@ Return the analysis as a string.
                 analysis = response.content.strip()
                 logger.info(f"LLM analysis for {symbol}: {analysis}")
             except Exception as e:
+                # 429s are retried by the shared rate limiter; reaching here means it gave up
                 if "429" in str(e):
                     logger.error(f"Rate limit for LLM analysis of {symbol}")
                     analysis = "Error: Rate limit exceeded"
-                    time.sleep(10)
                 else:
                     logger.error(f"LLM analysis failed for {symbol}: {str(e)}")
                     analysis = f"Error: Unable to analyze {symbol}"
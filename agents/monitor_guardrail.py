@@ -1,15 +1,227 @@
-from langchain_groq import ChatGroq
 from langchain.prompts import PromptTemplate
-from utils.config import GROQ_API_KEY
+from agents.llm_registry import get_llm
+from agents.telemetry import llm_method
+from agents.trade_rules import TRADED_SYMBOLS
+from utils.logger import logger
+from cachetools import TTLCache
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeout
+from typing import Any, Dict, List, Optional, Tuple
+import contextvars
+import os
+import re
+import threading
+import time
+
+# Hard limits: anything beyond these is blocked without asking the model
+MAX_TRADE_QUANTITY = 10_000
+MAX_TRADE_VALUE = 100_000.0
+# Trades above this value (or without a known price) are unusual enough to get the LLM check
+UNUSUAL_TRADE_VALUE = 25_000.0
+# Most actions one user may take per rolling minute
+MAX_ACTIONS_PER_MINUTE = 10
+# Seconds the LLM check may take; past that the fallback verdict applies
+GUARDRAIL_LLM_BUDGET = float(os.getenv("GUARDRAIL_LLM_BUDGET", "2.0"))
+# Verdict when the LLM check times out or fails: blocked unless GUARDRAIL_FAIL_OPEN=1
+FAIL_OPEN = os.getenv("GUARDRAIL_FAIL_OPEN", "0") == "1"
+VERDICT_TTL = 3600
+# Trade verdicts are cached per side, symbol and trade value rounded down to this many dollars
+VERDICT_VALUE_BUCKET = 5_000.0
+# Guard model calls in flight at once; a check that finds them all busy gets the fallback verdict at once
+GUARDRAIL_LLM_WORKERS = int(os.getenv("GUARDRAIL_LLM_WORKERS", "4"))
+
+_TRADE_TEXT = re.compile(
+    r"^(buy|sell)\s+(\d+(?:\.\d+)?)\s+(?:shares?\s+(?:of\s+)?)?([a-z]{1,5})(?:\s+at\s+\$?([\d,]+(?:\.\d+)?))?$", re.IGNORECASE
+)
+# Runs LLM checks so a slow model call can be abandoned at the latency budget. An abandoned call keeps
+# its worker until it returns, so submissions are capped by _llm_slots and never queue behind it
+_llm_pool = ThreadPoolExecutor(max_workers=GUARDRAIL_LLM_WORKERS, thread_name_prefix="guardrail")
+_llm_slots = threading.BoundedSemaphore(GUARDRAIL_LLM_WORKERS)
+
+
+def normalize_action(action: Any) -> Dict[str, Any]:
+    """
+    A trade as {"kind": "trade", side, symbol, quantity, price} from a recommendation dict or text
+    like "buy 10 AAPL at $190"; anything else as {"kind": "text", "text": lowercased, whitespace collapsed}.
+    """
+    if isinstance(action, dict):
+        side = str(action.get("Action") or action.get("trade_type") or action.get("action") or "").strip().lower()
+        symbol = str(action.get("Symbol") or action.get("symbol") or "").strip().upper()
+        quantity = action.get("Quantity", action.get("quantity"))
+        price = action.get("CurrentPrice", action.get("price"))
+        try:
+            quantity = float(quantity)
+            price = float(price) if price not in (None, "") else None
+        except (TypeError, ValueError):
+            return {"kind": "text", "text": re.sub(r"\s+", " ", str(action)).strip().lower()}
+        return {"kind": "trade", "side": side, "symbol": symbol, "quantity": quantity, "price": price}
+    text = re.sub(r"\s+", " ", str(action)).strip()
+    match = _TRADE_TEXT.match(text)
+    if match:
+        side, quantity, symbol, price = match.groups()
+        return {"kind": "trade", "side": side.lower(), "symbol": symbol.upper(), "quantity": float(quantity),
+                "price": float(price.replace(",", "")) if price else None}
+    return {"kind": "text", "text": text.lower()}
+
+
+def describe(normalized: Dict[str, Any]) -> str:
+    """Canonical text of a normalized action, as logged and shown to the guard model."""
+    if normalized["kind"] == "text":
+        return normalized["text"]
+    price = f" at ${normalized['price']:.2f}" if normalized["price"] is not None else ""
+    return f"{normalized['side']} {normalized['quantity']:g} {normalized['symbol']}{price}"
+
+
+def verdict_key(normalized: Dict[str, Any]) -> str:
+    """
+    Verdict cache key of a normalized action. Priced trades are keyed by their value bucket, so the same
+    large trade a few cents or shares apart reuses the verdict; text and unpriced trades by their description.
+    """
+    if normalized["kind"] == "text" or normalized["price"] is None:
+        return describe(normalized)
+    low = normalized["quantity"] * normalized["price"] // VERDICT_VALUE_BUCKET * VERDICT_VALUE_BUCKET
+    return f"{normalized['side']} {normalized['symbol']} worth ${low:,.0f}-${low + VERDICT_VALUE_BUCKET:,.0f}"
+
+
+class _GuardrailStats:
+    """Process-wide counts of where guardrail verdicts came from."""
 
-class MonitorGuardrailAgent:
     def __init__(self):
-        self.llm = ChatGroq(model_name="llama-guard-3-8b", api_key=GROQ_API_KEY)  # Specialized for guardrails
+        self._lock = threading.Lock()
+        self.stages = {"rules_blocked": 0, "rules_passed": 0, "cache": 0, "llm": 0, "timeout": 0, "busy": 0, "error": 0}
+
+    def record(self, stage: str):
+        with self._lock:
+            self.stages[stage] += 1
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            total = sum(self.stages.values())
+            return {
+                **self.stages,
+                "checked": total,
+                "llm_free_ratio": (total - self.stages["llm"] - self.stages["timeout"] - self.stages["busy"]
+                                   - self.stages["error"]) / total if total else 0.0
+            }
+
 
-    def monitor(self, action, user_id):
-        prompt = PromptTemplate(
-            input_variables=["action", "user_id"],
-            template="Check if {action} is safe and compliant for user {user_id}."
+guard_stats = _GuardrailStats()
+
+
+class MonitorGuardrailAgent:
+    """
+    Rules-first action guardrail. Deterministic checks (allowed symbols, quantity and value limits,
+    per-user velocity) settle ordinary trades in microseconds; only free-text or unusually large
+    actions go to the guard model, whose verdicts are cached by normalized action and bounded by
+    GUARDRAIL_LLM_BUDGET.
+    """
+
+    def __init__(self, allowed_symbols: Optional[List[str]] = None):
+        self.llm = get_llm("llama-guard-3-8b", agent="MonitorGuardrailAgent")  # Specialized for guardrails
+        self.allowed_symbols = {s.upper() for s in (allowed_symbols or TRADED_SYMBOLS)}
+        self.prompt = PromptTemplate(
+            input_variables=["action"],
+            template="Check if {action} is safe and compliant for a retail investing simulator user."
         )
-        response = self.llm(prompt.format(action=action, user_id=user_id))
-        return response.content == "Safe"
\ No newline at end of file
+        self._verdicts = TTLCache(maxsize=1000, ttl=VERDICT_TTL)
+        # Guard model calls still running by verdict key, including ones a check has stopped waiting for
+        self._pending: Dict[str, Future] = {}
+        self._actions: Dict[str, deque] = {}
+        self._lock = threading.Lock()
+
+    def monitor(self, action, user_id) -> bool:
+        """True if `action` (a recommendation dict or text) is safe for `user_id` to take."""
+        return self.check(action, user_id)[0]
+
+    def check(self, action, user_id) -> Tuple[bool, str, List[str]]:
+        """Return (safe, stage, reasons); stage is where the verdict came from (rules, cache, llm, timeout, busy or error)."""
+        started = time.perf_counter()
+        normalized = normalize_action(action)
+        safe, stage, reasons = self._check(normalized, str(user_id))
+        guard_stats.record(stage if stage != "rules" else ("rules_passed" if safe else "rules_blocked"))
+        logger.info(f"Guardrail {'passed' if safe else 'blocked'} '{describe(normalized)}' for {user_id} via {stage} "
+                    f"in {(time.perf_counter() - started) * 1000:.2f}ms: {'; '.join(reasons)}")
+        return safe, stage, reasons
+
+    def _check(self, normalized: Dict[str, Any], user_id: str) -> Tuple[bool, str, List[str]]:
+        recent = self._record_action(user_id)
+        if recent > MAX_ACTIONS_PER_MINUTE:
+            return False, "rules", [f"{recent} actions in the last minute, above the limit of {MAX_ACTIONS_PER_MINUTE}"]
+        if normalized["kind"] == "text":
+            return self._llm_check(normalized, ["Free-text action needs interpretation"])
+
+        side, symbol, quantity, price = normalized["side"], normalized["symbol"], normalized["quantity"], normalized["price"]
+        if side not in ("buy", "sell"):
+            return False, "rules", [f"Unsupported action '{side}'"]
+        if symbol not in self.allowed_symbols:
+            return False, "rules", [f"{symbol} is not in the allowed stock list"]
+        if quantity <= 0 or quantity > MAX_TRADE_QUANTITY:
+            return False, "rules", [f"Quantity {quantity:g} is outside 0-{MAX_TRADE_QUANTITY}"]
+        if price is not None and price <= 0:
+            return False, "rules", [f"No valid price for {symbol}"]
+        if price is None:
+            return self._llm_check(normalized, ["Trade value unknown without a price"])
+        value = quantity * price
+        if value > MAX_TRADE_VALUE:
+            return False, "rules", [f"Trade value ${value:,.2f} exceeds the ${MAX_TRADE_VALUE:,.0f} limit"]
+        if value > UNUSUAL_TRADE_VALUE:
+            return self._llm_check(normalized, [f"Trade value ${value:,.2f} is above ${UNUSUAL_TRADE_VALUE:,.0f}"])
+        return True, "rules", [f"{side.capitalize()} {quantity:g} {symbol} (${value:,.2f}) is within limits"]
+
+    def _record_action(self, user_id: str) -> int:
+        """Note an action by `user_id` and return how many they took in the last minute."""
+        now = time.monotonic()
+        with self._lock:
+            window = self._actions.setdefault(user_id, deque())
+            window.append(now)
+            while window and window[0] < now - 60:
+                window.popleft()
+            return len(window)
+
+    def _llm_check(self, normalized: Dict[str, Any], reasons: List[str]) -> Tuple[bool, str, List[str]]:
+        key = verdict_key(normalized)
+        with self._lock:
+            cached = self._verdicts.get(key)
+            future = self._pending.get(key)
+            # A check already running for this action is joined rather than asked again
+            if cached is None and future is None and _llm_slots.acquire(blocking=False):
+                # The pool thread's stack doesn't reach this method, so telemetry takes its name from the context
+                with llm_method("_llm_check"):
+                    future = _llm_pool.submit(contextvars.copy_context().run, self._ask, key, describe(normalized))
+                future.add_done_callback(lambda _: _llm_slots.release())
+                self._pending[key] = future
+        if cached is not None:
+            return cached, "cache", reasons + ["Cached guard model verdict"]
+        if future is None:
+            logger.warning(f"Guard model workers busy; no check for '{key}'")
+            return FAIL_OPEN, "busy", reasons + [f"All {GUARDRAIL_LLM_WORKERS} guard model workers are busy"]
+
+        try:
+            safe, verdict = future.result(timeout=GUARDRAIL_LLM_BUDGET)
+        except FutureTimeout:
+            # The call keeps running; its verdict is cached for the next check of this action
+            logger.warning(f"Guard model check for '{key}' exceeded {GUARDRAIL_LLM_BUDGET:.1f}s")
+            return FAIL_OPEN, "timeout", reasons + [f"Guard model exceeded the {GUARDRAIL_LLM_BUDGET:.1f}s budget"]
+        except Exception as e:
+            logger.error(f"Guard model check failed for '{key}': {str(e)}")
+            return FAIL_OPEN, "error", reasons + ["Guard model check failed"]
+        return safe, "llm", reasons + [f"Guard model verdict: {verdict.splitlines()[0] if verdict else 'empty'}"]
+
+    def _ask(self, key: str, action: str) -> Tuple[bool, str]:
+        """Guard model verdict on `action`, cached under `key` even if the check that asked has given up."""
+        try:
+            response = self.llm.invoke(self.prompt.format(action=action))
+            # Llama Guard answers "safe" or "unsafe" followed by the violated categories
+            verdict = str(getattr(response, "content", "")).strip().lower()
+            safe = verdict.startswith("safe")
+            with self._lock:
+                self._verdicts[key] = safe
+            return safe, verdict
+        finally:
+            with self._lock:
+                self._pending.pop(key, None)
+
+
+def get_guardrail_stats() -> Dict:
+    """How many guardrail verdicts came from rules, the verdict cache and the guard model."""
+    return guard_stats.snapshot()
@@ -1,9 +1,10 @@
-from langchain_groq import ChatGroq
 from langchain.prompts import PromptTemplate
 from pydantic import BaseModel, Field
-from utils.config import GROQ_API_KEY
+from agents.llm_registry import get_llm
+from typing import Dict, List, Tuple
 import json
 import re
+import threading
 from utils.logger import logger
 from langchain_core.exceptions import LangChainException
 import time
@@ -15,18 +16,135 @@ class InvestmentPersona(BaseModel):
     investment_amount: float = Field(..., description="Investment amount")
     investment_style: str = Field(..., description="Investment style (value, growth, index)")
 
+DEFAULT_PREFERENCES = {
+    "risk_appetite": "medium",
+    "investment_goals": "growth",
+    "time_horizon": "medium",
+    "investment_amount": 10000.0,
+    "investment_style": "index"
+}
+
+# The keyword mapping spelled out in the LLM prompt, as (field, option, pattern)
+_KEYWORDS = [
+    ("risk_appetite", "low", r"\b(?:safe|safely|secure|cautious|cautiously|conservative|low[- ]risk)\b"),
+    ("risk_appetite", "medium", r"\b(?:moderate|moderately|balanced|medium[- ]risk)\b"),
+    ("risk_appetite", "high", r"\b(?:aggressive|aggressively|risky|high[- ]risk)\b"),
+    ("investment_goals", "retirement", r"\b(?:retire|retirement|retiring|long[- ]term savings)\b"),
+    ("investment_goals", "growth", r"\b(?:wealth|expansion|grow)\b"),
+    ("investment_goals", "income", r"\b(?:dividends?|passive|income)\b"),
+    ("time_horizon", "short", r"\bshort[- ]term\b"),
+    ("time_horizon", "medium", r"\b(?:medium|mid)[- ]term\b"),
+    ("time_horizon", "long", r"\blong[- ]term\b"),
+    ("investment_style", "value", r"\bvalue\b"),
+    ("investment_style", "growth", r"\bgrowth\b"),
+    ("investment_style", "index", r"\b(?:index|passive|etfs?)\b")
+]
+_KEYWORD_PATTERNS = [(field, option, re.compile(pattern)) for field, option, pattern in _KEYWORDS]
+# "1-3 years", "7+ years", "10 years": horizon from the upper bound
+_YEARS = re.compile(r"\b(?:(\d+(?:\.\d+)?)\s*(?:-|to)\s*)?(\d+(?:\.\d+)?)\s*(\+)?\s*(?:years?|yrs?)\b")
+# "$5,000", "$5k", "5000 dollars"
+_AMOUNT = re.compile(r"\$\s?(\d[\d,]*(?:\.\d+)?)\s*(k|m)?\b|\b(\d[\d,]*(?:\.\d+)?)\s*(k|m)?\s*(?:dollars|usd)\b")
+_TOKENS = re.compile(r"[a-z]+|\d[\d,.]*")
+# Negations flip or void the keywords they qualify ("nothing risky", "not for retirement"), which the
+# mapping can't tell apart, so negated text always goes to the LLM
+_NEGATION = re.compile(r"\b(?:no|not|nothing|none|never|neither|nor|without|avoid|avoiding|"
+                       r"don'?t|doesn'?t|won'?t|can'?t|isn'?t|aren'?t|dislike|hate)\b")
+# Words that say nothing about any field; anything else left unmatched means the text needs the LLM
+_FILLER = {
+    "i", "m", "im", "ve", "d", "ll", "me", "my", "we", "our", "want", "wants", "would", "like", "to", "invest",
+    "investing", "investment", "put", "in", "into", "for", "of", "the", "a", "an", "and", "with", "over", "about",
+    "around", "approximately", "roughly", "some", "money", "plan", "planning", "looking", "am", "is", "it",
+    "be", "have", "has", "on", "at", "least", "next", "so", "focus", "focused", "prefer", "portfolio", "stocks",
+    "stock", "strategy", "approach", "style", "goal", "goals", "horizon", "term", "risk", "appetite", "years",
+    "year", "please", "can", "could", "should", "that", "this", "total", "amount", "dollars", "usd"
+}
+
+
+def _to_amount(number: str, suffix: str) -> float:
+    return float(number.replace(",", "")) * {"k": 1_000, "m": 1_000_000}.get(suffix or "", 1)
+
+
+def _horizon(years: float) -> str:
+    return "short" if years <= 3 else "medium" if years <= 7 else "long"
+
+
+def fast_parse(text: str) -> Tuple[Dict, List[str], List[str], List[str]]:
+    """
+    Apply the prompt's keyword mapping with regexes. Returns (values, unresolved, conflicts, unexplained):
+    fields matched to exactly one option, fields with no match, fields matched to several options, and
+    words the mapping did not account for. `text` is expected lowercased.
+    """
+    matches: Dict[str, set] = {}
+    spans = []
+    for field, option, pattern in _KEYWORD_PATTERNS:
+        for match in pattern.finditer(text):
+            matches.setdefault(field, set()).add(option)
+            spans.append(match.span())
+    for match in _YEARS.finditer(text):
+        # "7+ years" is more than seven
+        years = float(match.group(2)) + (0.5 if match.group(3) else 0.0)
+        matches.setdefault("time_horizon", set()).add(_horizon(years))
+        spans.append(match.span())
+    for match in _AMOUNT.finditer(text):
+        number, suffix = (match.group(1), match.group(2)) if match.group(1) else (match.group(3), match.group(4))
+        matches.setdefault("investment_amount", set()).add(_to_amount(number, suffix))
+        spans.append(match.span())
+
+    values = {field: next(iter(options)) for field, options in matches.items() if len(options) == 1}
+    conflicts = [field for field, options in matches.items() if len(options) > 1]
+    unresolved = [field for field in DEFAULT_PREFERENCES if field not in matches]
+    remaining = list(text)
+    for start, end in spans:
+        remaining[start:end] = " " * (end - start)
+    unexplained = [token for token in _TOKENS.findall("".join(remaining)) if token not in _FILLER]
+    return values, unresolved, conflicts, unexplained
+
+
+class _ParserStats:
+    """Process-wide counts of preferences parsed without and with the LLM."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.fast_path = 0
+        self.llm = 0
+        self.fast_latencies_us: List[float] = []
+
+    def record(self, fast: bool, elapsed_us: float):
+        with self._lock:
+            if fast:
+                self.fast_path += 1
+            else:
+                self.llm += 1
+            self.fast_latencies_us.append(elapsed_us)
+            del self.fast_latencies_us[:-1000]
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            total = self.fast_path + self.llm
+            latencies = sorted(self.fast_latencies_us)
+            return {
+                "parsed": total,
+                "fast_path": self.fast_path,
+                "llm": self.llm,
+                "hit_rate": self.fast_path / total if total else 0.0,
+                "median_fast_parse_us": latencies[len(latencies) // 2] if latencies else 0.0
+            }
+
+
+parser_stats = _ParserStats()
+
+
 class PreferenceParserAgent:
     def __init__(self):
         try:
-            self.llm = ChatGroq(model_name="llama-3.1-8b-instant", api_key=GROQ_API_KEY)
+            self.llm = get_llm("llama-3.1-8b-instant", agent="PreferenceParserAgent")
         except Exception as e:
-            logger.error(f"Failed to initialize ChatGroq: {str(e)}")
+            logger.error(f"Failed to initialize LLM client: {str(e)}")
             raise
 
     def parse_preferences(self, text: str) -> dict:
-        logger.debug()
         prompt = PromptTemplate(
-            input_variables=text,
+            input_variables=["text"],
             template="""
 You are an expert investment advisor tasked with generating a complete investment persona based on user input. The persona must include exactly the following fields:
 - risk_appetite: Must be one of 'low', 'medium', 'high'.
@@ -55,34 +173,28 @@ You are an expert investment advisor tasked with generating a complete investmen
 
 **Examples**:
 - Input: "I want to invest $5000 safely for retirement."
-  Output: {
+  Output: {{
     "risk_appetite": "low",
     "investment_goals": "retirement",
     "time_horizon": "medium",
     "investment_amount": 5000.0,
     "investment_style": "index"
-  }
+  }}
 - Input: "Invest $10000 aggressively for 10 years."
-  Output: {
+  Output: {{
     "risk_appetite": "high",
     "investment_goals": "growth",
     "time_horizon": "long",
     "investment_amount": 10000.0,
     "investment_style": "growth"
-  }
+  }}
 
 **User Input**: {text}
 
 Output the investment persona as a valid JSON object.
 """
         )
-        defaults = {
-            "risk_appetite": "medium",
-            "investment_goals": "growth",
-            "time_horizon": "medium",
-            "investment_amount": 10000.0,
-            "investment_style": "index"
-        }
+        defaults = DEFAULT_PREFERENCES.copy()
         raw_response = None
         try:
             if not text or text.isspace():
@@ -93,6 +205,24 @@ Output the investment persona as a valid JSON object.
             text = text.strip().lower()
             logger.info(f"Normalized input: {text}")
 
+            # Keyword fast path; the LLM only settles what it leaves open
+            started = time.perf_counter()
+            values, unresolved, conflicts, unexplained = fast_parse(text)
+            negated = bool(_NEGATION.search(text))
+            elapsed_us = (time.perf_counter() - started) * 1e6
+            # Only text the mapping fully explains is answered here; any other word might change a field
+            if not conflicts and not unexplained and not negated:
+                parser_stats.record(True, elapsed_us)
+                preferences = {**defaults, **values}
+                logger.info(f"Fast-path preferences in {elapsed_us:.0f}us: {preferences}")
+                return preferences
+            parser_stats.record(False, elapsed_us)
+            logger.info(f"Fast path left {unresolved + conflicts} open (unmatched words: {unexplained}, "
+                        f"negated: {negated}); asking the LLM")
+            if not negated:
+                # Fallback if the LLM fails; under a negation the matched keywords may mean the opposite
+                defaults = {**defaults, **values}
+
             # Call LLM with retry
             for attempt in range(3):
                 try:
@@ -117,38 +247,8 @@ Output the investment persona as a valid JSON object.
             json_match = re.search(r'\{[\s\S]*\}', raw_response)
             if not json_match:
                 logger.error(f"No valid JSON found in response: {raw_response}")
-                # Fallback: Manual parsing
-                preferences = defaults.copy()
-                if "safe" in text or "secure" in text or "cautious" in text:
-                    preferences["risk_appetite"] = "low"
-                elif "aggressive" in text or "risky" in text:
-                    preferences["risk_appetite"] = "high"
-                if "retirement" in text or "long-term savings" in text:
-                    preferences["investment_goals"] = "retirement"
-                elif "wealth" in text or "expansion" in text:
-                    preferences["investment_goals"] = "growth"
-                elif "dividends" in text or "passive" in text:
-                    preferences["investment_goals"] = "income"
-                if "1-3 years" in text or "short-term" in text:
-                    preferences["time_horizon"] = "short"
-                elif "3-7 years" in text:
-                    preferences["time_horizon"] = "medium"
-                elif "7+ years" in text or "long-term" in text:
-                    preferences["time_horizon"] = "long"
-                amount_match = re.search(r'\$?(\d+\.?\d*)', text)
-                if amount_match:
-                    try:
-                        preferences["investment_amount"] = float(amount_match.group(1))
-                    except ValueError:
-                        pass
-                if "value" in text:
-                    preferences["investment_style"] = "value"
-                elif "growth" in text:
-                    preferences["investment_style"] = "growth"
-                elif "index" in text or "passive" in text:
-                    preferences["investment_style"] = "index"
-                logger.info(f"Fallback preferences: {preferences}")
-                return preferences
+                logger.info(f"Fallback preferences: {defaults}")
+                return defaults
 
             cleaned_response = json_match.group(0)
             logger.debug(f"Extracted JSON: {cleaned_response}")
@@ -172,4 +272,9 @@ Output the investment persona as a valid JSON object.
 
         except Exception as e:
             logger.error(f"Unexpected error parsing preferences: {str(e)}, Raw response: {raw_response or 'No response'}")
-            return defaults
\ No newline at end of file
+            return defaults
+
+
+def get_parser_stats() -> Dict:
+    """How many preference texts the keyword fast path answered without the LLM."""
+    return parser_stats.snapshot()
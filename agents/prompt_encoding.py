@@ -0,0 +1,163 @@
+from decimal import Decimal
+from typing import Any, Dict, Iterable, List, Optional
+import json
+import math
+
+# Preference keys in the order they're rendered, with short labels
+PREFERENCE_LABELS = [
+    ("risk_appetite", "risk"),
+    ("investment_goals", "goals"),
+    ("time_horizon", "horizon"),
+    ("investment_style", "style"),
+    ("investment_amount", "amount"),
+    ("additional_details", "notes"),
+    ("additional_preferences", "notes")
+]
+
+
+def _number(value: Any) -> Optional[float]:
+    try:
+        if value is None:
+            return None
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _money(value: Optional[float]) -> str:
+    """Short dollar figure: 394.3B, 12.1M, 950.0K, 12.34."""
+    if value is None:
+        return "NA"
+    for scale, suffix in ((1e12, "T"), (1e9, "B"), (1e6, "M"), (1e3, "K")):
+        if abs(value) >= scale:
+            return f"{value / scale:.1f}{suffix}"
+    return f"{value:.2f}"
+
+
+def _csv_cell(value: Any) -> str:
+    text = "NA" if value is None else str(value)
+    if any(ch in text for ch in ',"\n'):
+        text = '"' + text.replace('"', '""').replace("\n", " ") + '"'
+    return text
+
+
+def csv_table(header: List[str], rows: Iterable[List[Any]]) -> str:
+    """Header line plus one comma-separated line per row."""
+    return "\n".join([",".join(header)] + [",".join(_csv_cell(cell) for cell in row) for row in rows])
+
+
+def compact_json(value: Any) -> str:
+    """JSON without indentation or spaces after separators."""
+    return json.dumps(value, separators=(",", ":"), default=lambda v: float(v) if isinstance(v, Decimal) else str(v))
+
+
+def compact_preferences(preferences: Dict) -> str:
+    """One line such as `risk=medium; goals=growth; horizon=long; style=value; amount=500.00`."""
+    parts = []
+    for key, label in PREFERENCE_LABELS:
+        value = preferences.get(key)
+        if value is None or (isinstance(value, str) and not value.strip()):
+            continue
+        if key == "investment_amount":
+            value = f"{_number(value) or 0.0:.2f}"
+        parts.append(f"{label}={str(value).strip()}")
+    return "; ".join(parts)
+
+
+def price_table(stock_data: Dict[str, Dict], with_range: bool = False) -> str:
+    """CSV of the price snapshot; `with_range` adds day high/low and previous close."""
+    header = ["symbol", "price"] + (["high", "low", "prev_close"] if with_range else [])
+    rows = []
+    for symbol in sorted(stock_data):
+        data = stock_data[symbol]
+        row = [symbol, f"{_number(data.get('current_price')) or 0.0:.2f}"]
+        if with_range:
+            row += [f"{_number(data.get(field)) or 0.0:.2f}" for field in ("high_price", "low_price", "previous_close")]
+        rows.append(row)
+    return csv_table(header, rows)
+
+
+def summarize_financials(financials: Dict) -> Dict[str, Any]:
+    """
+    Reduce multi-year income, balance sheet and cash flow rows (newest first) to a few features:
+    latest revenue and net income, revenue CAGR, net margin, debt-to-equity and free cash flow.
+    """
+    income = financials.get("income") or []
+    balance = financials.get("balance") or []
+    cash_flow = financials.get("cash_flow") or []
+    features: Dict[str, Any] = {"years": len(income)}
+
+    revenues = [_number(row.get("revenue")) for row in income]
+    revenues = [r for r in revenues if r]
+    latest_income = income[0] if income else {}
+    revenue = _number(latest_income.get("revenue"))
+    net_income = _number(latest_income.get("net_income"))
+    features["revenue"] = _money(revenue)
+    features["net_income"] = _money(net_income)
+    features["net_margin"] = f"{net_income / revenue:.1%}" if revenue and net_income is not None else "NA"
+    if len(revenues) >= 2 and revenues[-1] > 0 and revenues[0] > 0:
+        cagr = (revenues[0] / revenues[-1]) ** (1 / (len(revenues) - 1)) - 1
+        features["revenue_cagr"] = f"{cagr:.1%}"
+    else:
+        features["revenue_cagr"] = "NA"
+
+    latest_balance = balance[0] if balance else {}
+    liabilities = _number(latest_balance.get("total_liabilities"))
+    equity = _number(latest_balance.get("total_equity"))
+    features["debt_to_equity"] = f"{liabilities / equity:.2f}" if liabilities is not None and equity else "NA"
+
+    latest_cash = cash_flow[0] if cash_flow else {}
+    operating = _number(latest_cash.get("operating_cash_flow"))
+    capex = _number(latest_cash.get("capital_expenditure"))
+    if operating is not None:
+        # Capital expenditure is reported as either a positive outflow or a negative number
+        features["free_cash_flow"] = _money(operating - abs(capex or 0.0))
+    else:
+        features["free_cash_flow"] = "NA"
+    return features
+
+
+def financials_line(financials: Dict) -> str:
+    """Summarized financial features as `key=value` pairs on one line."""
+    if not financials:
+        return "no financial statements available"
+    return ", ".join(f"{key}={value}" for key, value in summarize_financials(financials).items())
+
+
+def market_data_table(market_data: List[Dict], note_chars: int = 240) -> str:
+    """
+    CSV of analyzed stocks (price, ratios, sentiment and summarized financials),
+    followed by each stock's analysis note truncated to `note_chars`.
+    """
+    header = ["symbol", "company", "price", "pe", "debt_to_equity", "sentiment",
+              "revenue", "revenue_cagr", "net_margin", "free_cash_flow"]
+    rows = []
+    notes = []
+    for item in market_data:
+        if "symbol" not in item:
+            continue
+        features = summarize_financials(item.get("financials") or {})
+        rows.append([
+            item["symbol"].upper(),
+            item.get("company", item["symbol"]),
+            f"{_number(item.get('price')) or 0.0:.2f}",
+            item.get("pe_ratio") if item.get("pe_ratio") is not None else "NA",
+            item.get("debt_to_equity") if item.get("debt_to_equity") is not None else features["debt_to_equity"],
+            item.get("news_sentiment", "Neutral"),
+            features["revenue"],
+            features["revenue_cagr"],
+            features["net_margin"],
+            features["free_cash_flow"]
+        ])
+        analysis = str(item.get("analysis") or "").strip()
+        if analysis and not analysis.startswith("Error"):
+            notes.append(f"{item['symbol'].upper()}: {analysis[:note_chars]}")
+    table = csv_table(header, rows)
+    return table + ("\nNotes:\n" + "\n".join(notes) if notes else "")
+
+
+def estimate_tokens(text: Any) -> int:
+    """Rough token count (about 4 characters per token) for when the API doesn't report usage."""
+    if hasattr(text, "to_string"):
+        text = text.to_string()
+    return int(math.ceil(len(str(text)) / 4))
@@ -0,0 +1,241 @@
+from utils.logger import logger
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Optional
+import heapq
+import itertools
+import json
+import random
+import re
+import threading
+import time
+
+# Lower values are served first
+INTERACTIVE = 0
+BACKGROUND = 10
+
+# Starting limits per model until the API's rate-limit headers report the real ones
+MODEL_RATE_LIMITS = {
+    "deepseek-r1-distill-llama-70b": {"rpm": 30, "tpm": 6000},
+    "llama-3.1-8b-instant": {"rpm": 30, "tpm": 6000},
+    "gemma2-9b-it": {"rpm": 30, "tpm": 15000},
+    "mixtral-8x7b-32768": {"rpm": 30, "tpm": 5000},
+    "llama-guard-3-8b": {"rpm": 30, "tpm": 15000}
+}
+DEFAULT_RATE_LIMIT = {"rpm": 30, "tpm": 6000}
+# Lowest request rate the limiter backs off to after repeated 429s
+MIN_RPM = 2
+# Back-off after a 429 without a retry-after header: BASE * 2**strikes, capped
+BASE_BACKOFF = 2.0
+MAX_BACKOFF = 60.0
+# Retries ManagedLLM makes after a 429 before giving up
+MAX_RATE_LIMIT_RETRIES = 4
+
+_priority: ContextVar[int] = ContextVar("llm_priority", default=INTERACTIVE)
+_DURATION_PART = re.compile(r"([\d.]+)(ms|h|m|s)")
+
+
+@contextmanager
+def request_priority(priority: int):
+    """Run LLM calls made inside the block (in this thread or context) at `priority`."""
+    token = _priority.set(priority)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+def current_priority() -> int:
+    return _priority.get()
+
+
+def parse_duration(value: Any) -> Optional[float]:
+    """Seconds from a retry-after value or a Groq reset header such as `7.66s`, `2m59.56s` or `120ms`."""
+    if value is None:
+        return None
+    text = str(value).strip()
+    try:
+        return float(text)
+    except ValueError:
+        pass
+    parts = _DURATION_PART.findall(text)
+    if not parts:
+        return None
+    scale = {"ms": 0.001, "s": 1.0, "m": 60.0, "h": 3600.0}
+    return sum(float(amount) * scale[unit] for amount, unit in parts)
+
+
+def is_rate_limit_error(error: Exception) -> bool:
+    return getattr(error, "status_code", None) == 429 or "429" in str(error)
+
+
+def retry_after_from(error: Exception) -> Optional[float]:
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    return parse_duration(headers.get("retry-after"))
+
+
+class ModelRateLimiter:
+    """
+    Request and token buckets for one model, shared by every caller in the process.
+    The request rate grows by one request/minute after each success and halves after a 429
+    (additive increase, multiplicative decrease); token capacity and remaining budget are synced
+    from the x-ratelimit-* response headers. Waiters are served in priority order.
+    """
+
+    def __init__(self, model_name: str, rpm: int, tpm: int):
+        self.model_name = model_name
+        self.rpm_limit = rpm
+        self.tpm_limit = tpm
+        self.rate = float(rpm)
+        self._requests = float(rpm)
+        self._tokens = float(tpm)
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._strikes = 0
+        self._cond = threading.Condition()
+        self._queue = []
+        self._seq = itertools.count()
+        self.acquired = 0
+        self.rate_limited = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    def _refill(self, now: float):
+        elapsed = now - self._updated
+        self._updated = now
+        self._requests = min(self.rate, self._requests + elapsed * self.rate / 60.0)
+        self._tokens = min(self.tpm_limit, self._tokens + elapsed * self.tpm_limit / 60.0)
+
+    def _delay(self, now: float, tokens: int) -> float:
+        """Seconds until one request of `tokens` fits in both buckets."""
+        delay = self._paused_until - now
+        if self._requests < 1:
+            delay = max(delay, (1 - self._requests) * 60.0 / self.rate)
+        needed = min(tokens, self.tpm_limit)
+        if self._tokens < needed:
+            delay = max(delay, (needed - self._tokens) * 60.0 / self.tpm_limit)
+        return delay
+
+    def acquire(self, tokens: int = 0, priority: Optional[int] = None) -> float:
+        """Block until the request may be sent; returns the seconds spent waiting."""
+        priority = current_priority() if priority is None else priority
+        ticket = (priority, next(self._seq))
+        started = time.monotonic()
+        with self._cond:
+            heapq.heappush(self._queue, ticket)
+            try:
+                while True:
+                    now = time.monotonic()
+                    self._refill(now)
+                    if self._queue[0] == ticket:
+                        delay = self._delay(now, tokens)
+                        if delay <= 0:
+                            self._requests -= 1
+                            self._tokens -= min(tokens, self.tpm_limit)
+                            break
+                        self._cond.wait(min(delay, 1.0))
+                    else:
+                        # Not at the head; woken when the head is served or a higher priority arrives
+                        self._cond.wait(1.0)
+            finally:
+                self._queue.remove(ticket)
+                heapq.heapify(self._queue)
+                self._cond.notify_all()
+            waited = time.monotonic() - started
+            self.acquired += 1
+            self.total_wait += waited
+            self.max_wait = max(self.max_wait, waited)
+        if waited > 1.0:
+            logger.info(f"{self.model_name} request waited {waited:.1f}s for rate limit (priority {priority})")
+        return waited
+
+    def on_success(self):
+        with self._cond:
+            self._strikes = 0
+            self.rate = min(float(self.rpm_limit), self.rate + 1.0)
+
+    def on_rate_limited(self, retry_after: Optional[float] = None) -> float:
+        """Halve the request rate and pause the model; returns the pause in seconds."""
+        with self._cond:
+            self.rate_limited += 1
+            self._strikes += 1
+            self.rate = max(float(MIN_RPM), self.rate / 2)
+            self._requests = min(self._requests, 0.0)
+            backoff = retry_after if retry_after is not None else min(MAX_BACKOFF, BASE_BACKOFF * 2 ** (self._strikes - 1))
+            # Jitter so other processes sharing the API key don't all retry at the same instant
+            pause = backoff * random.uniform(1.0, 1.5)
+            self._paused_until = max(self._paused_until, time.monotonic() + pause)
+            self._cond.notify_all()
+        logger.warning(f"{self.model_name} rate limited; pausing {pause:.1f}s, rate now {self.rate:.0f} rpm")
+        return pause
+
+    def update_from_headers(self, headers: Any):
+        """Sync token capacity and remaining budget from x-ratelimit-* headers."""
+        limit_tokens = headers.get("x-ratelimit-limit-tokens")
+        remaining_tokens = headers.get("x-ratelimit-remaining-tokens")
+        remaining_requests = headers.get("x-ratelimit-remaining-requests")
+        with self._cond:
+            now = time.monotonic()
+            self._refill(now)
+            if limit_tokens and str(limit_tokens).isdigit():
+                self.tpm_limit = max(1, int(limit_tokens))
+            if remaining_tokens and str(remaining_tokens).isdigit():
+                # The server's count is authoritative, in either direction
+                self._tokens = min(float(self.tpm_limit), float(remaining_tokens))
+            if remaining_requests is not None and str(remaining_requests) == "0":
+                reset = parse_duration(headers.get("x-ratelimit-reset-requests"))
+                if reset:
+                    self._paused_until = max(self._paused_until, now + reset)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            now = time.monotonic()
+            self._refill(now)
+            return {
+                "queue_depth": len(self._queue),
+                "waiting_background": sum(1 for priority, _ in self._queue if priority >= BACKGROUND),
+                "rate_rpm": round(self.rate, 1),
+                "rpm_limit": self.rpm_limit,
+                "tpm_limit": self.tpm_limit,
+                "tokens_available": int(self._tokens),
+                "paused_for": round(max(0.0, self._paused_until - now), 1),
+                "acquired": self.acquired,
+                "rate_limited": self.rate_limited,
+                "avg_wait": round(self.total_wait / self.acquired, 3) if self.acquired else 0.0,
+                "max_wait": round(self.max_wait, 3)
+            }
+
+
+_lock = threading.Lock()
+_limiters: Dict[str, ModelRateLimiter] = {}
+
+
+def get_rate_limiter(model_name: str) -> ModelRateLimiter:
+    limiter = _limiters.get(model_name)
+    if limiter is None:
+        with _lock:
+            limiter = _limiters.get(model_name)
+            if limiter is None:
+                limits = MODEL_RATE_LIMITS.get(model_name, DEFAULT_RATE_LIMIT)
+                limiter = ModelRateLimiter(model_name, limits["rpm"], limits["tpm"])
+                _limiters[model_name] = limiter
+    return limiter
+
+
+def observe_response(response: Any):
+    """httpx response hook: feed rate-limit headers from every Groq response to that model's limiter."""
+    headers = response.headers
+    if "x-ratelimit-remaining-tokens" not in headers and "x-ratelimit-remaining-requests" not in headers:
+        return
+    try:
+        model_name = json.loads(response.request.content or b"{}").get("model")
+    except (ValueError, AttributeError):
+        return
+    if model_name:
+        get_rate_limiter(model_name).update_from_headers(headers)
+
+
+def rate_limiter_stats() -> Dict[str, Dict]:
+    """Queue depth, wait times, learned limits and 429 counts per model."""
+    return {name: limiter.stats() for name, limiter in list(_limiters.items())}
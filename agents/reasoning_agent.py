@@ -1,23 +1,82 @@
 from decimal import Decimal
-from langchain_groq import ChatGroq
-from utils.config import GROQ_API_KEY
+from agents.llm_registry import get_llm
 from utils.logger import logger
-from typing import List, Dict, Tuple
+from analytics.covariance import get_universe_risk
+from analytics.position_sizer import PositionSizer, universe_covariance
+from agents.trade_rules import TradeRuleEngine, TRADED_SYMBOLS, ACCEPT, ESCALATE, RULE_SETTLED_STEP
+from agents.prompt_encoding import compact_json, compact_preferences, price_table
+from agents.structured_output import invoke_structured, TradeValidationReport
+from utils.json_extraction import extract_json, JSONExtractionError
+from datetime import datetime, timezone
+from typing import Iterator, List, Dict, Tuple
 import json
 import time
 import decimal
-import math
 import re
 
+
+class _PartialRecommendationScanner:
+    """Pull complete recommendation objects out of a streamed analysis as soon as each one closes."""
+
+    _ARRAY_START = re.compile(r'"recommendations"\s*:\s*\[')
+
+    def __init__(self):
+        self.buffer = ""
+        self.pos = None
+        self.done = False
+        self._decoder = json.JSONDecoder()
+
+    def feed(self, text: str) -> List[Dict]:
+        self.buffer += text
+        if self.done:
+            return []
+        if self.pos is None:
+            # Skip a reasoning preamble; it can mention the key before the real answer starts
+            start = 0
+            if "<think>" in self.buffer:
+                end = self.buffer.find("</think>")
+                if end < 0:
+                    return []
+                start = end + len("</think>")
+            match = self._ARRAY_START.search(self.buffer, start)
+            if not match:
+                return []
+            self.pos = match.end()
+
+        found = []
+        while self.pos < len(self.buffer):
+            char = self.buffer[self.pos]
+            if char in " \t\r\n,":
+                self.pos += 1
+            elif char == "]":
+                self.done = True
+                break
+            elif char == "{":
+                try:
+                    obj, end = self._decoder.raw_decode(self.buffer, self.pos)
+                except json.JSONDecodeError:
+                    break  # object not complete yet
+                if isinstance(obj, dict):
+                    found.append(obj)
+                self.pos = end
+            else:
+                self.done = True
+                break
+        return found
+
 class ReasoningAgent:
+    # Shown in place of the thinking process when its LLM call fails
+    THINKING_FALLBACK = (
+        "🤔 Inner Monologue:\n    Unable to generate detailed thinking process due to technical error.",
+        "🤔 Inner Monologue:\n    Proceeding with basic analysis based on available data."
+    )
+
     def __init__(self):
         # Using deepseek-coder for better reasoning capabilities
-        self.llm = ChatGroq(model_name="deepseek-r1-distill-llama-70b", api_key=GROQ_API_KEY)
+        self.llm = get_llm("deepseek-r1-distill-llama-70b", agent="ReasoningAgent")
         # Define allowed stocks
-        self.ALLOWED_STOCKS = [
-            "UNH", "TSLA", "QCOM", "ORCL", "NVDA", "NFLX", "MSFT", "META", "LLY", "JNJ",
-            "INTC", "IBM", "GOOGL", "GM", "F", "CSCO", "AMZN", "AMD", "ADBE", "AAPL"
-        ]
+        self.ALLOWED_STOCKS = TRADED_SYMBOLS
+        self.trade_rules = TradeRuleEngine(self.ALLOWED_STOCKS)
 
     def _convert_to_float(self, value) -> float:
         """Safely convert a value to float, handling Decimal types."""
@@ -54,11 +113,12 @@ class ReasoningAgent:
             logger.error(f"Error in numeric operation: {str(e)}")
             return 0.0
 
-    def _get_current_price(self, symbol: str) -> float:
-        """Get current price for a symbol, handling different data types."""
+    def _get_current_price(self, symbol: str, stock_data: Dict = None) -> float:
+        """Get current price for a symbol from the given snapshot (or a fresh one), handling different data types."""
         try:
-            from scripts.fetch_stock_prices import fetch_stock_prices
-            stock_data = fetch_stock_prices()
+            if stock_data is None:
+                from scripts.fetch_stock_prices import fetch_stock_prices
+                stock_data = fetch_stock_prices()
             price_data = stock_data.get(symbol, {})
             current_price = price_data.get("current_price", 0.0)
             return self._convert_to_float(current_price)
@@ -66,105 +126,83 @@ class ReasoningAgent:
             logger.error(f"Error fetching price for {symbol}: {str(e)}")
             return 0.0
 
+    def _record_price_bar(self, stock_data: Dict):
+        """Feed today's price snapshot into the shared rolling covariance model."""
+        try:
+            get_universe_risk(self.ALLOWED_STOCKS).on_snapshot(datetime.now(timezone.utc).date(), stock_data)
+        except Exception as e:
+            logger.error(f"Failed to update rolling covariance: {str(e)}")
+
+    def _size_positions(self, recommendations: List[Dict], preferences: Dict, investment_amount: float) -> List[Dict]:
+        """Replace model-suggested quantities with a mean-variance allocation of the budget across Buy recommendations."""
+        buys = [rec for rec in recommendations if rec["Action"] == "Buy"]
+        if not buys:
+            return recommendations
+        symbols = [rec["Symbol"] for rec in buys]
+        cov = universe_covariance(symbols, get_universe_risk(self.ALLOWED_STOCKS))
+        allocation = PositionSizer.for_preferences(preferences).allocate(
+            symbols,
+            [rec["Score"] for rec in buys],
+            [rec["CurrentPrice"] for rec in buys],
+            investment_amount,
+            cov
+        )
+        sized = []
+        for rec in recommendations:
+            if rec["Action"] == "Buy":
+                position = allocation.get(rec["Symbol"])
+                if not position or position["quantity"] <= 0:
+                    logger.info(f"Dropping {rec['Symbol']}: no allocation within ${investment_amount:.2f}")
+                    continue
+                rec.update({
+                    "Quantity": position["quantity"],
+                    "TotalCost": position["total_cost"],
+                    "Allocation": round(position["weight"] * 100, 1)
+                })
+            else:
+                quantity = self._convert_to_float(rec["Quantity"])
+                if quantity <= 0:
+                    logger.error(f"Invalid quantity for {rec['Symbol']}: {quantity}")
+                    continue
+                rec.update({"Quantity": quantity, "TotalCost": round(quantity * rec["CurrentPrice"], 2)})
+            sized.append(rec)
+        return sized
+
+    def format_recommendation(self, rec: Dict) -> str:
+        """Render one recommendation as a reasoning step."""
+        return (
+            f"🎯 {rec['Company']} ({rec['Symbol']})\n"
+            f"{'='*50}\n"
+            f"  📈 Action: {rec['Action']}\n"
+            f"  💰 Current Price: ${rec['CurrentPrice']:.2f}\n"
+            f"  📊 Quantity: {rec['Quantity']}\n"
+            f"  💵 Total Cost: ${rec['TotalCost']:.2f}\n"
+            f"  📐 Allocation: {rec.get('Allocation', 0.0)}% of budget\n"
+            f"  📝 Reason: {rec['Reason']}\n"
+            f"  ⚠️ Caution: {rec['Caution']}\n"
+            f"  📰 News Sentiment: {rec['NewsSentiment']}\n"
+            f"  ⭐ Score: {rec['Score']}/100\n"
+            f"{'='*50}"
+        )
+
     def _parse_json_response(self, response: str) -> Dict:
         """Safely parse JSON response from the model."""
         try:
-            # First try direct JSON parsing
-            return json.loads(response)
-        except json.JSONDecodeError:
-            try:
-                # Clean up common issues in the response
-                cleaned_response = response
-                
-                # Remove any markdown code block markers
-                cleaned_response = re.sub(r'```json\s*|\s*```', '', cleaned_response)
-                
-                # Try to find the first complete JSON object
-                start_idx = cleaned_response.find('{')
-                if start_idx != -1:
-                    # Track brackets to find matching end
-                    stack = []
-                    in_string = False
-                    escape_char = False
-                    
-                    for i in range(start_idx, len(cleaned_response)):
-                        char = cleaned_response[i]
-                        
-                        # Handle escape characters
-                        if char == '\\' and not escape_char:
-                            escape_char = True
-                            continue
-                        
-                        # Handle strings
-                        if char == '"' and not escape_char:
-                            in_string = not in_string
-                        
-                        # Track brackets only when not in a string
-                        if not in_string:
-                            if char == '{':
-                                stack.append(char)
-                            elif char == '}':
-                                if stack:
-                                    stack.pop()
-                                    # If we've found the matching end brace
-                                    if not stack:
-                                        try:
-                                            json_str = cleaned_response[start_idx:i+1]
-                                            parsed = json.loads(json_str)
-                                            logger.info("Successfully parsed JSON after cleanup")
-                                            return parsed
-                                        except json.JSONDecodeError:
-                                            logger.warning("Failed to parse extracted JSON object")
-                                            # Continue searching in case there are more JSON objects
-                                            continue
-                        
-                        escape_char = False
-                
-                # If we haven't found a valid JSON object yet, try a more aggressive cleanup
-                # Remove all whitespace and newlines outside of strings
-                cleaned_response = re.sub(r'\s+(?=(?:[^"]*"[^"]*")*[^"]*$)', '', cleaned_response)
-                
-                # Try one more time with the aggressively cleaned response
-                try:
-                    start_idx = cleaned_response.find('{')
-                    end_idx = cleaned_response.rfind('}')
-                    if start_idx != -1 and end_idx != -1:
-                        json_str = cleaned_response[start_idx:end_idx + 1]
-                        return json.loads(json_str)
-                except:
-                    pass
-                
-                # If all else fails, create a basic structure
-                logger.warning("Could not parse JSON response, creating basic structure")
-                return {
-                    "error": "Failed to parse response",
-                    "raw_response": response,
-                    "recommendations": [],
-                    "insights": "Analysis failed to generate valid insights.",
-                    "market_analysis": {},
-                    "investment_strategy": {}
-                }
-            except Exception as e:
-                logger.error(f"Failed to parse JSON response: {str(e)}")
-                return {
-                    "error": "Failed to parse response",
-                    "raw_response": response,
-                    "recommendations": [],
-                    "insights": "Analysis failed to generate valid insights.",
-                    "market_analysis": {},
-                    "investment_strategy": {}
-                }
-
-    def _get_thinking_process(self, preferences: Dict) -> List[str]:
-        """Capture the model's inner thought process with detailed numerical analysis."""
-        # Get current price data for calculations
-        try:
-            from scripts.fetch_stock_prices import fetch_stock_prices
-            stock_data = fetch_stock_prices()
-        except Exception as e:
-            logger.error(f"Failed to fetch stock prices for thinking process: {str(e)}")
-            stock_data = {}
+            return extract_json(response, dict)
+        except JSONExtractionError:
+            # If all else fails, create a basic structure
+            logger.warning("Could not parse JSON response, creating basic structure")
+            return {
+                "error": "Failed to parse response",
+                "raw_response": response,
+                "recommendations": [],
+                "insights": "Analysis failed to generate valid insights.",
+                "market_analysis": {},
+                "investment_strategy": {}
+            }
 
+    def _build_thinking_prompt(self, preferences: Dict, stock_data: Dict) -> str:
+        """Prompt for the inner-monologue pass, with the scenario's projections precomputed."""
         # Convert and validate investment amount
         investment_amount = self._convert_to_float(preferences.get('investment_amount', 0.0))
         
@@ -258,12 +296,12 @@ class ReasoningAgent:
         
         thinking_prompt = f"""You are an expert investment advisor. Think through this investment scenario step by step, sharing your detailed inner monologue with specific numerical analysis.
 
-User Preferences: {json.dumps(preferences, indent=2)}
+User Preferences: {compact_preferences(preferences)}
 Available Investment Amount: ${investment_amount:.2f}
 Time Horizon: {time_horizon} years ({time_horizon_input})
 
-Current Market Data:
-{json.dumps({symbol: {"price": data.get("current_price", 0.0)} for symbol, data in stock_data.items()}, indent=2)}
+Current Market Data (CSV):
+{price_table(stock_data)}
 
 I want you to think through this investment scenario in great detail, sharing your complete thought process with specific numerical calculations and practical considerations. Format your response as a detailed stream of consciousness, with each thought starting with "🤔 Inner Monologue: ".
 
@@ -322,76 +360,63 @@ Make each thought extremely detailed and show your mathematical reasoning. Inclu
 
 Return ONLY the list of thoughts, with each starting with "🤔 Inner Monologue: " and containing detailed numerical analysis.
 """
+        return thinking_prompt
 
-        try:
-            response = self.llm.invoke(thinking_prompt)
-            # Split response into individual thoughts and clean them up
-            thoughts = [t.strip() for t in response.content.split('🤔 Inner Monologue:') if t.strip()]
+    def _format_thoughts(self, content: str) -> List[str]:
+        """Split the model's monologue into individual, formatted thoughts."""
+        # Split response into individual thoughts and clean them up
+        thoughts = [t.strip() for t in content.split('🤔 Inner Monologue:') if t.strip()]
+        
+        # Format each thought with proper indentation and line breaks
+        formatted_thoughts = []
+        for thought in thoughts:
+            # Clean up any extra whitespace and normalize line breaks
+            lines = [line.strip() for line in thought.split('\n')]
+            lines = [line for line in lines if line]  # Remove empty lines
             
-            # Format each thought with proper indentation and line breaks
-            formatted_thoughts = []
-            for thought in thoughts:
-                # Clean up any extra whitespace and normalize line breaks
-                lines = [line.strip() for line in thought.split('\n')]
-                lines = [line for line in lines if line]  # Remove empty lines
-                
-                # Format calculations and lists with proper indentation
-                formatted_lines = []
-                for line in lines:
-                    if line.startswith('-') or line.startswith('•'):
-                        # Enhanced indentation for list items with better alignment
-                        formatted_lines.append(f"    ➤ {line[1:].strip()}")
-                    elif ':' in line and not line.startswith('http'):
-                        # Enhanced formatting for key-value pairs
-                        key, value = line.split(':', 1)
-                        formatted_lines.append(f"📊 {key.strip()}: {value.strip()}")
-                    else:
-                        formatted_lines.append(line)
-                
-                # Join lines with proper spacing and add decorative elements
-                formatted_thought = '\n'.join(formatted_lines)
-                
-                # Add the thought prefix with enhanced formatting
-                formatted_thoughts.append(f"🤔 Inner Monologue:\n{'='*50}\n{formatted_thought}\n{'='*50}")
+            # Format calculations and lists with proper indentation
+            formatted_lines = []
+            for line in lines:
+                if line.startswith('-') or line.startswith('•'):
+                    # Enhanced indentation for list items with better alignment
+                    formatted_lines.append(f"    ➤ {line[1:].strip()}")
+                elif ':' in line and not line.startswith('http'):
+                    # Enhanced formatting for key-value pairs
+                    key, value = line.split(':', 1)
+                    formatted_lines.append(f"📊 {key.strip()}: {value.strip()}")
+                else:
+                    formatted_lines.append(line)
             
-            # Add extra line break between thoughts for better readability
-            return formatted_thoughts
-        except Exception as e:
-            logger.error(f"Failed to generate thinking process: {str(e)}")
-            return [
-                "🤔 Inner Monologue:\n    Unable to generate detailed thinking process due to technical error.",
-                "🤔 Inner Monologue:\n    Proceeding with basic analysis based on available data."
-            ]
+            # Join lines with proper spacing and add decorative elements
+            formatted_thought = '\n'.join(formatted_lines)
+            
+            # Add the thought prefix with enhanced formatting
+            formatted_thoughts.append(f"🤔 Inner Monologue:\n{'='*50}\n{formatted_thought}\n{'='*50}")
+        
+        # Add extra line break between thoughts for better readability
+        return formatted_thoughts
 
-    def analyze_investment_scenario(self, preferences: Dict, is_trade: bool = False) -> Tuple[List[Dict], str, List[str], List[str]]:
+    def _build_analysis_prompt(self, preferences: Dict, stock_data: Dict, investment_amount: float,
+                               market_context: str = "") -> str:
         """
-        Perform a detailed analysis of the investment scenario with step-by-step reasoning.
-        Returns: (recommendations, insights, reasoning_steps, thinking_process)
+        Prompt for the comprehensive analysis that produces recommendations and insights.
+        `market_context` is an optional CSV of fundamentals and news sentiment for the allowed stocks.
         """
-        reasoning_steps = []
-        thinking_process = self._get_thinking_process(preferences)
-        
-        try:
-            # Fetch current stock data
-            from scripts.fetch_stock_prices import fetch_stock_prices
-            stock_data = fetch_stock_prices()
-            
-            # Add investment amount to prompt for better quantity calculation
-            investment_amount = self._convert_to_float(preferences.get('investment_amount', 0.0))
-            reasoning_steps.append(f"Investment amount specified: ${investment_amount:.2f}")
-            
-            # Combined analysis prompt that includes initial analysis, market context, and recommendations
-            comprehensive_prompt = f"""You are an expert investment advisor performing a detailed market analysis and generating recommendations.
+        market_section = (f"- Fundamentals and News Sentiment (CSV; use this sentiment for NewsSentiment):\n{market_context}\n"
+                          if market_context else "")
+        # Combined analysis prompt that includes initial analysis, market context, and recommendations
+        comprehensive_prompt = f"""You are an expert investment advisor performing a detailed market analysis and generating recommendations.
 
 IMPORTANT: You must return ONLY a valid JSON object with no additional text, comments, or explanations.
 ANY TEXT OUTSIDE THE JSON OBJECT WILL CAUSE ERRORS.
 
 Input Parameters:
-- User Preferences: {json.dumps(preferences, indent=2)}
+- User Preferences: {compact_preferences(preferences)}
 - Investment Budget: ${investment_amount:.2f}
-- Current Market Data: {json.dumps({symbol: {"price": data.get("current_price", 0.0)} for symbol, data in stock_data.items()}, indent=2)}
-- Allowed Stocks: {json.dumps(self.ALLOWED_STOCKS)}
-
+- Allowed Stocks: {", ".join(self.ALLOWED_STOCKS)}
+- Current Market Data (CSV):
+{price_table(stock_data)}
+{market_section}
 Required JSON Structure:
 {{
     "market_analysis": {{
@@ -500,9 +525,9 @@ Required JSON Structure:
             "Symbol": "string (must be from allowed list)",
             "Company": "string",
             "Action": "Buy or Sell",
-            "Quantity": "number",
+            "Quantity": "number (0 for Buy)",
             "CurrentPrice": "number",
-            "TotalCost": "number",
+            "TotalCost": 0,
             "Reason": "string",
             "Caution": "string",
             "NewsSentiment": "Positive/Negative/Neutral",
@@ -551,182 +576,203 @@ REQUIREMENTS:
 6. Ensure all objects have matching braces
 7. Use only the allowed stock symbols
 8. Include exactly 3 recommendations
+   (for Buy recommendations leave Quantity and TotalCost at 0, share quantities are computed by the allocation engine from your Scores;
+   for Sell recommendations set Quantity to the number of shares to sell)
 9. Format all currency values as numbers without $ signs
 10. Use proper JSON syntax with double quotes for strings
 
 The response must be a single, valid JSON object that can be parsed by json.loads().
 """
+        return comprehensive_prompt
 
-            response = self.llm.invoke(comprehensive_prompt)
-            complete_analysis = self._parse_json_response(response.content)
+    def _finalize_analysis(self, content: str, preferences: Dict, stock_data: Dict, investment_amount: float,
+                           reasoning_steps: List[str]) -> Tuple[List[Dict], str]:
+        """Validate and size the recommendations in a comprehensive analysis response, recording the steps taken."""
+        complete_analysis = self._parse_json_response(content)
 
-            # Extract components from the comprehensive analysis
-            recommendations = complete_analysis.get("recommendations", [])
-            insights = complete_analysis.get("insights", "Analysis failed to generate insights.")
-            
-            # Validate recommendations
-            validated_recommendations = []
-            required_fields = {
-                "Symbol": "",
-                "Company": "Unknown Company",
+        # Extract components from the comprehensive analysis
+        recommendations = complete_analysis.get("recommendations", [])
+        insights = complete_analysis.get("insights", "Analysis failed to generate insights.")
+        
+        # Validate recommendations
+        validated_recommendations = []
+        required_fields = {
+            "Symbol": "",
+            "Company": "Unknown Company",
+            "Action": "None",
+            "Quantity": 0,
+            "CurrentPrice": 0.0,
+            "TotalCost": 0.0,
+            "Reason": "No reason provided",
+            "Caution": "No caution provided",
+            "NewsSentiment": "Neutral",
+            "Score": 0
+        }
+        
+        for rec in recommendations:
+            try:
+                # Create a new recommendation with all required fields
+                validated_rec = {field: rec.get(field, default) for field, default in required_fields.items()}
+                
+                # Convert numeric fields to proper types
+                try:
+                    validated_rec["Score"] = int(float(str(validated_rec["Score"]).replace(',', '')))
+                    validated_rec["Quantity"] = self._convert_to_float(validated_rec["Quantity"])
+                    validated_rec["CurrentPrice"] = self._convert_to_float(validated_rec["CurrentPrice"])
+                    validated_rec["TotalCost"] = self._convert_to_float(validated_rec["TotalCost"])
+                except (ValueError, TypeError) as e:
+                    logger.error(f"Error converting numeric fields: {str(e)}")
+                    continue
+                
+                # Validate stock symbol
+                if validated_rec["Symbol"] not in self.ALLOWED_STOCKS:
+                    logger.error(f"Model suggested invalid stock: {validated_rec['Symbol']}. Must be one of: {', '.join(self.ALLOWED_STOCKS)}")
+                    continue
+
+                # Get current price; quantities are sized once all recommendations are validated
+                current_price = self._get_current_price(validated_rec["Symbol"], stock_data)
+                if current_price <= 0:
+                    logger.error(f"Invalid price for {validated_rec['Symbol']}: {current_price}")
+                    continue
+                validated_rec["CurrentPrice"] = current_price
+
+                # Validate score and other fields after type conversion
+                score = validated_rec["Score"]
+                if not isinstance(score, (int, float)):
+                    logger.error(f"Invalid score type: {type(score)}")
+                    continue
+                    
+                if not (0 <= score <= 100):
+                    logger.error(f"Score out of range: {score}")
+                    continue
+                    
+                if validated_rec["Action"] not in ["Buy", "Sell"]:
+                    logger.error(f"Invalid action: {validated_rec['Action']}")
+                    continue
+                    
+                if validated_rec["NewsSentiment"] not in ["Positive", "Negative", "Neutral"]:
+                    logger.error(f"Invalid sentiment: {validated_rec['NewsSentiment']}")
+                    continue
+                    
+                validated_recommendations.append(validated_rec)
+            except Exception as e:
+                logger.error(f"Error validating recommendation: {str(e)}")
+                continue
+
+        validated_recommendations = self._size_positions(validated_recommendations, preferences, investment_amount)
+
+        if not validated_recommendations:
+            validated_recommendations = [{
+                "Symbol": "ERROR",
+                "Company": "Error in Recommendation",
                 "Action": "None",
                 "Quantity": 0,
                 "CurrentPrice": 0.0,
                 "TotalCost": 0.0,
-                "Reason": "No reason provided",
-                "Caution": "No caution provided",
+                "Reason": "Failed to generate valid recommendation",
+                "Caution": "Please try again",
                 "NewsSentiment": "Neutral",
                 "Score": 0
-            }
-            
-            for rec in recommendations:
-                try:
-                    # Create a new recommendation with all required fields
-                    validated_rec = {field: rec.get(field, default) for field, default in required_fields.items()}
-                    
-                    # Convert numeric fields to proper types
-                    try:
-                        validated_rec["Score"] = int(float(str(validated_rec["Score"]).replace(',', '')))
-                        validated_rec["Quantity"] = self._convert_to_float(validated_rec["Quantity"])
-                        validated_rec["CurrentPrice"] = self._convert_to_float(validated_rec["CurrentPrice"])
-                        validated_rec["TotalCost"] = self._convert_to_float(validated_rec["TotalCost"])
-                    except (ValueError, TypeError) as e:
-                        logger.error(f"Error converting numeric fields: {str(e)}")
-                        continue
-                    
-                    # Validate stock symbol
-                    if validated_rec["Symbol"] not in self.ALLOWED_STOCKS:
-                        logger.error(f"Model suggested invalid stock: {validated_rec['Symbol']}. Must be one of: {', '.join(self.ALLOWED_STOCKS)}")
-                        continue
-
-                    # Get current price and validate quantity
-                    current_price = self._get_current_price(validated_rec["Symbol"])
-                    quantity = validated_rec["Quantity"]
-                    total_cost = current_price * quantity
+            }]
+
+        # Update reasoning steps with enhanced formatting
+        reasoning_steps.extend([
+            "✨ Completed initial preference and risk assessment",
+            "📊 Analyzed market conditions and sector performance",
+            f"🎯 Generated {len(validated_recommendations)} validated recommendations"
+        ])
+        
+        for rec in validated_recommendations:
+            reasoning_steps.append(self.format_recommendation(rec))
+        
+        reasoning_steps.extend([
+            "✅ Sized positions with mean-variance allocation within the investment amount",
+            "🏁 Compiled final market insights and guidance"
+        ])
+        return validated_recommendations, insights
+
+    def stream_thinking(self, preferences: Dict, stock_data: Dict) -> Iterator[Dict]:
+        """Thinking-process tokens as {"type": "thinking"} events, then the formatted {"type": "thoughts"} event."""
+        parts = []
+        try:
+            for chunk in self.llm.stream(self._build_thinking_prompt(preferences, stock_data)):
+                text = chunk.content or ""
+                if text:
+                    parts.append(text)
+                    yield {"type": "thinking", "text": text}
+        except Exception as e:
+            logger.error(f"Streaming thinking call failed: {str(e)}")
+        content = "".join(parts)
+        yield {"type": "thoughts",
+               "thoughts": self._format_thoughts(content) if content.strip() else list(self.THINKING_FALLBACK)}
 
-                    if current_price <= 0:
-                        logger.error(f"Invalid price for {validated_rec['Symbol']}: {current_price}")
-                        continue
-
-                    if quantity <= 0:
-                        logger.error(f"Invalid quantity for {validated_rec['Symbol']}: {quantity}")
-                        continue
-
-                    if total_cost > investment_amount:
-                        # Adjust quantity to fit investment amount
-                        quantity = math.floor((investment_amount / current_price) * 100) / 100  # Round to 2 decimal places
-                        logger.info(f"Adjusted quantity for {validated_rec['Symbol']} from {validated_rec['Quantity']} to {quantity} to fit investment amount")
-
-                    # Update the recommendation with validated values
-                    validated_rec.update({
-                        "CurrentPrice": current_price,
-                        "TotalCost": total_cost,
-                        "Quantity": quantity
-                    })
-
-                    # Validate score and other fields after type conversion
-                    score = validated_rec["Score"]
-                    if not isinstance(score, (int, float)):
-                        logger.error(f"Invalid score type: {type(score)}")
-                        continue
-                        
-                    if not (0 <= score <= 100):
-                        logger.error(f"Score out of range: {score}")
-                        continue
-                        
-                    if validated_rec["Action"] not in ["Buy", "Sell"]:
-                        logger.error(f"Invalid action: {validated_rec['Action']}")
-                        continue
-                        
-                    if validated_rec["NewsSentiment"] not in ["Positive", "Negative", "Neutral"]:
-                        logger.error(f"Invalid sentiment: {validated_rec['NewsSentiment']}")
-                        continue
-                        
-                    validated_recommendations.append(validated_rec)
-                except Exception as e:
-                    logger.error(f"Error validating recommendation: {str(e)}")
+    def stream_analysis(self, preferences: Dict, stock_data: Dict, market_context: str = "") -> Iterator[Dict]:
+        """
+        Comprehensive-analysis tokens as {"type": "analysis"} events and each recommendation as its JSON
+        object closes, then {"type": "analysis_result", "recommendations", "market_insights", "reasoning_steps"}.
+        """
+        self._record_price_bar(stock_data)
+        investment_amount = self._convert_to_float(preferences.get('investment_amount', 0.0))
+        reasoning_steps = [f"Investment amount specified: ${investment_amount:.2f}"]
+        scanner = _PartialRecommendationScanner()
+        parts = []
+        try:
+            prompt = self._build_analysis_prompt(preferences, stock_data, investment_amount, market_context)
+            for chunk in self.llm.stream(prompt):
+                text = chunk.content or ""
+                if not text:
                     continue
-
-            if not validated_recommendations:
-                validated_recommendations = [{
-                    "Symbol": "ERROR",
-                    "Company": "Error in Recommendation",
-                    "Action": "None",
-                    "Quantity": 0,
-                    "CurrentPrice": 0.0,
-                    "TotalCost": 0.0,
-                    "Reason": "Failed to generate valid recommendation",
-                    "Caution": "Please try again",
-                    "NewsSentiment": "Neutral",
-                    "Score": 0
-                }]
-
-            # Update reasoning steps with enhanced formatting
-            reasoning_steps.extend([
-                "✨ Completed initial preference and risk assessment",
-                "📊 Analyzed market conditions and sector performance",
-                f"🎯 Generated {len(validated_recommendations)} validated recommendations"
-            ])
-            
-            for rec in validated_recommendations:
-                formatted_output = (
-                    f"🎯 {rec['Company']} ({rec['Symbol']})\n"
-                    f"{'='*50}\n"
-                    f"  📈 Action: {rec['Action']}\n"
-                    f"  💰 Current Price: ${rec['CurrentPrice']:.2f}\n"
-                    f"  📊 Quantity: {rec['Quantity']}\n"
-                    f"  💵 Total Cost: ${rec['TotalCost']:.2f}\n"
-                    f"  📝 Reason: {rec['Reason']}\n"
-                    f"  ⚠️ Caution: {rec['Caution']}\n"
-                    f"  📰 News Sentiment: {rec['NewsSentiment']}\n"
-                    f"  ⭐ Score: {rec['Score']}/100\n"
-                    f"{'='*50}"
-                )
-                reasoning_steps.append(formatted_output)
-            
-            reasoning_steps.extend([
-                "✅ Validated investment amounts and share quantities",
-                "🏁 Compiled final market insights and guidance"
-            ])
-            return validated_recommendations, insights, reasoning_steps, thinking_process
-
+                parts.append(text)
+                yield {"type": "analysis", "text": text}
+                for rec in scanner.feed(text):
+                    symbol = str(rec.get("Symbol", "")).upper()
+                    if symbol in self.ALLOWED_STOCKS:
+                        rec["CurrentPrice"] = self._get_current_price(symbol, stock_data)
+                        yield {"type": "recommendation", "recommendation": rec}
+            content = "".join(parts)
+            if not content.strip():
+                raise ValueError("Empty analysis response")
+            recommendations, insights = self._finalize_analysis(
+                content, preferences, stock_data, investment_amount, reasoning_steps
+            )
         except Exception as e:
             logger.error(f"Reasoning analysis failed: {str(e)}")
-            return [], "Analysis failed due to technical issues.", reasoning_steps, thinking_process
+            recommendations, insights = [], "Analysis failed due to technical issues."
+        yield {"type": "analysis_result", "recommendations": recommendations, "market_insights": insights,
+               "reasoning_steps": reasoning_steps}
 
-    def validate_trade(self, recommendation: Dict, preferences: Dict) -> Tuple[bool, str, List[str]]:
+    def validate_trade(self, recommendation: Dict, preferences: Dict, holdings: Dict = None) -> Tuple[bool, str, List[str]]:
         """
         Validate a specific trade recommendation with detailed reasoning steps.
+        Deterministic rules settle clear-cut trades; only ambiguous ones reach the LLM.
         Returns: (is_valid, explanation, reasoning_steps)
         """
         reasoning_steps = []
         
         try:
-            # Validate stock symbol first
-            if recommendation["Symbol"] not in self.ALLOWED_STOCKS:
-                return False, f"Invalid stock symbol: {recommendation['Symbol']} is not in the allowed list", reasoning_steps
-
-            # Validate trade amount
             current_price = self._get_current_price(recommendation["Symbol"])
-            if current_price <= 0:
-                return False, f"Could not get valid price for {recommendation['Symbol']}", reasoning_steps
-
             quantity = self._convert_to_float(recommendation["Quantity"])
-            total_cost = current_price * quantity
 
-            if recommendation["Action"].lower() == "buy":
-                max_investment = self._convert_to_float(preferences.get("investment_amount", float('inf')))
-                if total_cost > max_investment:
-                    return False, f"Total cost (${total_cost:.2f}) exceeds investment amount (${max_investment:.2f})", reasoning_steps
+            verdict, rule_reasons = self.trade_rules.evaluate(recommendation, preferences, current_price, holdings)
+            if verdict != ESCALATE:
+                is_valid = verdict == ACCEPT
+                header = "⚡ Rule-Based Validation: Accepted" if is_valid else "❌ Trade Rejected"
+                explanation = f"{header}\n{'='*50}\n" + "\n".join(f"• {reason}" for reason in rule_reasons)
+                reasoning_steps.extend([explanation, RULE_SETTLED_STEP])
+                return is_valid, explanation, reasoning_steps
+            reasoning_steps.append("⚖️ Trade needs judgement beyond the deterministic rules: " + rule_reasons[-1])
 
             # Combined trade validation prompt
             reasoning_steps.append("✓ Performing comprehensive trade validation...")
+            risk_summary = get_universe_risk(self.ALLOWED_STOCKS).describe(recommendation["Symbol"])
             validation_prompt = f"""You are an expert trading advisor performing a complete trade validation analysis.
 
 Context:
-Trade Details: {json.dumps(recommendation, indent=2)}
-User Preferences: {json.dumps(preferences, indent=2)}
-Allowed Stocks: {json.dumps(self.ALLOWED_STOCKS, indent=2)}
+Trade Details: {compact_json(recommendation)}
+User Preferences: {compact_preferences(preferences)}
+Allowed Stocks: {", ".join(self.ALLOWED_STOCKS)}
+Risk Metrics (computed from daily closes, use these figures for correlation and volatility analysis):
+{risk_summary}
 
 Perform a comprehensive trade validation analysis covering:
 
@@ -793,12 +839,11 @@ Important:
 
 Return ONLY the JSON object, no other text."""
 
-            response = self.llm.invoke(validation_prompt)
-            validation_result = self._parse_json_response(response.content)
+            validation_result = invoke_structured(self.llm, validation_prompt, TradeValidationReport).model_dump()
             
             # Extract validation decision
-            validation = validation_result.get("validation", {}).get("validation_result", {})
-            is_valid = validation.get("is_valid", False)
+            validation = validation_result["validation"]["validation_result"]
+            is_valid = validation["is_valid"]
             
             # Additional validation for trade execution
             if is_valid:
@@ -0,0 +1,133 @@
+from utils.disk_cache import DiskCache, CACHE_DIR
+from utils.logger import logger
+from typing import Dict, List, Optional
+import bisect
+import copy
+import hashlib
+import json
+import math
+import os
+import threading
+
+# Upper edges of the investment amount buckets; amounts within a bucket share one analysis
+AMOUNT_BUCKETS = [100, 250, 500, 1000, 2500, 5000, 10000, 25000, 50000, 100000, 250000, 1000000]
+PREFERENCE_FIELDS = ["risk_appetite", "investment_goals", "time_horizon", "investment_style"]
+FREE_TEXT_FIELDS = ["additional_details", "additional_preferences"]
+RECOMMENDATION_TTL = 6 * 3600
+RECOMMENDATION_CACHE_ENABLED = os.getenv("RECOMMENDATION_CACHE_ENABLED", "1") not in ("0", "false", "False")
+NAMESPACE = "recommendations"
+
+
+def amount_bucket(amount: float) -> int:
+    """Index of the bucket containing `amount`."""
+    return bisect.bisect_left(AMOUNT_BUCKETS, amount)
+
+
+def snapshot_epoch(stock_data: Dict) -> str:
+    """Short fingerprint of a price snapshot; changes whenever any current price changes."""
+    prices = sorted((symbol, round(float(data.get("current_price", 0.0)), 2)) for symbol, data in stock_data.items())
+    return hashlib.sha1(json.dumps(prices).encode("utf-8")).hexdigest()[:12]
+
+
+def recommendation_key(preferences: Dict, stock_data: Dict) -> Optional[str]:
+    """Cache key for an analysis, or None when free-text preferences make it user-specific."""
+    if any(str(preferences.get(field) or "").strip() for field in FREE_TEXT_FIELDS):
+        return None
+    try:
+        amount = float(preferences.get("investment_amount", 0.0))
+    except (TypeError, ValueError):
+        return None
+    if amount <= 0 or not stock_data:
+        return None
+    fields = [str(preferences.get(field, "")).strip().lower() for field in PREFERENCE_FIELDS]
+    return "|".join(fields + [f"b{amount_bucket(amount)}", snapshot_epoch(stock_data)])
+
+
+def rescale_recommendations(recommendations: List[Dict], base_amount: float, amount: float) -> List[Dict]:
+    """
+    Scale Buy quantities from the analyzed amount to the user's amount, flooring to 2 decimals
+    so the total never exceeds the budget. Sell quantities are share counts and stay as-is.
+    """
+    ratio = amount / base_amount if base_amount > 0 else 0.0
+    scaled = []
+    for rec in copy.deepcopy(recommendations):
+        if rec.get("Action") == "Buy":
+            quantity = math.floor(float(rec.get("Quantity", 0)) * ratio * 100 + 1e-9) / 100
+            if quantity <= 0:
+                logger.info(f"Dropping cached {rec.get('Symbol')}: nothing affordable within ${amount:.2f}")
+                continue
+            rec["Quantity"] = quantity
+            rec["TotalCost"] = round(quantity * float(rec.get("CurrentPrice", 0.0)), 2)
+        scaled.append(rec)
+    return scaled
+
+
+class RecommendationCache:
+    """
+    Analyses shared across users whose preferences fall in the same bucket
+    and who see the same price snapshot.
+    """
+
+    def __init__(self, store: DiskCache, ttl: int = RECOMMENDATION_TTL):
+        self.store = store
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, preferences: Dict, stock_data: Dict) -> Optional[Dict]:
+        """Stored analysis rescaled to the user's amount, or None."""
+        key = recommendation_key(preferences, stock_data)
+        if key is None:
+            return None
+        entry = self.store.get(NAMESPACE, key)
+        with self._lock:
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        result, meta = entry
+        amount = float(preferences["investment_amount"])
+        result["recommendations"] = rescale_recommendations(result["recommendations"], meta["base_amount"], amount)
+        result["base_amount"] = meta["base_amount"]
+        logger.info(f"Recommendation cache hit for {key} (analyzed at ${meta['base_amount']:.2f}, serving ${amount:.2f})")
+        return result if result["recommendations"] else None
+
+    def put(self, preferences: Dict, stock_data: Dict, recommendations: List[Dict], insights: str,
+            thinking_process: List[str]):
+        key = recommendation_key(preferences, stock_data)
+        if key is None or not recommendations or any(rec.get("Symbol") == "ERROR" for rec in recommendations):
+            return
+        try:
+            self.store.set(NAMESPACE, key, {
+                "recommendations": recommendations,
+                "market_insights": insights,
+                "thinking_process": thinking_process
+            }, self.ttl, {"base_amount": float(preferences["investment_amount"])})
+        except Exception as e:
+            logger.error(f"Failed to store recommendations for {key}: {str(e)}")
+
+    def stats(self) -> Dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {"hits": self.hits, "misses": self.misses, "hit_rate": self.hits / lookups if lookups else 0.0}
+
+
+_cache: Optional[RecommendationCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_recommendation_cache() -> Optional[RecommendationCache]:
+    """Process-wide recommendation cache, or None if disabled or the cache file can't be opened."""
+    global _cache
+    if not RECOMMENDATION_CACHE_ENABLED:
+        return None
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                try:
+                    _cache = RecommendationCache(DiskCache(CACHE_DIR / "recommendations.sqlite3", max_entries=2000))
+                except Exception as e:
+                    logger.error(f"Failed to open recommendation cache: {str(e)}")
+                    return None
+    return _cache
@@ -0,0 +1,272 @@
+from agents.prompt_encoding import compact_json
+from utils.json_extraction import extract_json, JSONExtractionError
+from utils.logger import logger
+from pydantic import BaseModel, Field, ValidationError, field_validator
+from typing import Any, Dict, List, Literal, Optional, Tuple, Type, Union
+import threading
+import time
+
+# Models that accept response_format={"type": "json_object"} on Groq; reasoning models emit <think> text first
+JSON_MODE_MODELS = {"llama-3.1-8b-instant", "gemma2-9b-it", "mixtral-8x7b-32768"}
+# Follow-up calls allowed per request to fix invalid fields
+MAX_REPAIRS = 2
+# Longest raw answer quoted back when asking the model to reformat it
+REFORMAT_CHARS = 6000
+
+
+class StockRecommendation(BaseModel):
+    Symbol: str = Field(..., description="Stock ticker from the allowed list")
+    Company: str = Field(..., description="Company name")
+    Action: Literal["Buy", "Sell", "Hold"] = Field(..., description="Buy, Sell or Hold")
+    Quantity: float = Field(..., ge=0, description="Number of shares")
+    Reason: str = Field(..., description="Why this action fits the preferences")
+    Caution: str = Field(..., description="Potential risks")
+    NewsSentiment: str = Field(..., description="Positive, Negative or Neutral")
+    Score: Union[int, float] = Field(..., ge=0, le=100, description="Alignment score 0-100")
+
+    @field_validator("Symbol")
+    @classmethod
+    def _known_symbol(cls, value: str, info) -> str:
+        value = value.strip().upper()
+        valid_symbols = (info.context or {}).get("valid_symbols")
+        if valid_symbols and value not in valid_symbols:
+            raise ValueError(f"Symbol must be one of {', '.join(sorted(valid_symbols))}")
+        return value
+
+    @field_validator("Action", mode="before")
+    @classmethod
+    def _action_case(cls, value: Any) -> Any:
+        return value.strip().capitalize() if isinstance(value, str) else value
+
+    @field_validator("Quantity")
+    @classmethod
+    def _affordable(cls, value: float, info) -> float:
+        context = info.context or {}
+        prices = context.get("prices")
+        budget = context.get("investment_amount")
+        if prices and budget is not None and info.data.get("Action") == "Buy":
+            cost = value * prices.get(info.data.get("Symbol", ""), 0.0)
+            if cost > budget:
+                raise ValueError(f"Quantity * price = {cost:.2f} exceeds investment_amount {budget:.2f}")
+        return value
+
+
+class RecommendationSelection(BaseModel):
+    SelectedRecommendation: StockRecommendation
+    SelectionReason: str = Field(..., description="2-3 sentences on why it was chosen")
+
+
+class ValidationResult(BaseModel):
+    is_valid: bool
+    confidence: Union[int, float, str] = "N/A"
+    primary_reasons: List[str] = []
+    concerns: List[str] = []
+    modifications: Dict[str, Any] = {}
+
+
+class ValidationSection(BaseModel):
+    validation_result: ValidationResult
+
+
+class TradeValidationReport(BaseModel):
+    analysis: Dict[str, Any] = {}
+    validation: ValidationSection
+    execution: Dict[str, Any] = {}
+
+
+class StructuredOutputError(ValueError):
+    """The model's answer still failed schema validation after the allowed repairs."""
+
+
+def json_mode(llm):
+    """Bind JSON mode onto an LLM handle when its model supports it; JSON mode only returns objects."""
+    if getattr(llm, "model_name", None) in JSON_MODE_MODELS:
+        return llm.bind(response_format={"type": "json_object"})
+    return llm
+
+
+class StructuredOutputStats:
+    """Per-schema counts of first-pass successes, repair calls and the latency they add."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats: Dict[str, Dict[str, float]] = {}
+
+    def record(self, schema: str, repairs: int, ok: bool, dropped: int, latency: float, repair_latency: float):
+        with self._lock:
+            stats = self._stats.setdefault(schema, {
+                "calls": 0, "first_pass": 0, "repair_calls": 0, "failures": 0,
+                "dropped_items": 0, "latency": 0.0, "repair_latency": 0.0
+            })
+            stats["calls"] += 1
+            stats["first_pass"] += int(ok and repairs == 0 and not dropped)
+            stats["repair_calls"] += repairs
+            stats["failures"] += int(not ok)
+            stats["dropped_items"] += dropped
+            stats["latency"] += latency
+            stats["repair_latency"] += repair_latency
+
+    def stats(self) -> Dict[str, Dict]:
+        with self._lock:
+            return {
+                schema: {
+                    "calls": s["calls"],
+                    "first_pass": s["first_pass"],
+                    "repair_calls": s["repair_calls"],
+                    "failures": s["failures"],
+                    "dropped_items": s["dropped_items"],
+                    "avg_retries": round(s["repair_calls"] / s["calls"], 2),
+                    "avg_latency": round(s["latency"] / s["calls"], 3),
+                    "repair_latency": round(s["repair_latency"], 3)
+                }
+                for schema, s in self._stats.items()
+            }
+
+
+_stats = StructuredOutputStats()
+
+
+def structured_output_stats() -> Dict[str, Dict]:
+    """First-pass successes, repair calls and latency per schema."""
+    return _stats.stats()
+
+
+def _unwrap(data: Any, many: bool, key: Optional[str]) -> Any:
+    """JSON mode wraps arrays in an object; accept either shape."""
+    if not many:
+        return data
+    if isinstance(data, dict):
+        if key and isinstance(data.get(key), list):
+            return data[key]
+        lists = [value for value in data.values() if isinstance(value, list)]
+        return lists[0] if len(lists) == 1 else [data]
+    return data
+
+
+def _errors(schema: Type[BaseModel], data: Any, many: bool, context: Optional[Dict]) -> Tuple[Any, List[Tuple[tuple, str]]]:
+    """Validate and return (parsed, [(path, message)]); with `many`, parsed holds None for invalid items."""
+    if many:
+        if not isinstance(data, list):
+            return None, [((), "expected a JSON array of objects")]
+        parsed, errors = [], []
+        for index, item in enumerate(data):
+            item_parsed, item_errors = _errors(schema, item, False, context)
+            parsed.append(item_parsed)
+            errors.extend(((index,) + path, message) for path, message in item_errors)
+        return parsed, errors
+    try:
+        return schema.model_validate(data, context=context), []
+    except ValidationError as e:
+        return None, [(tuple(err["loc"]), err["msg"]) for err in e.errors()]
+
+
+def _get_path(data: Any, path: tuple) -> Any:
+    for part in path:
+        try:
+            data = data[part]
+        except (KeyError, IndexError, TypeError):
+            return "<missing>"
+    return data
+
+
+def _set_path(data: Any, path: tuple, value: Any):
+    for part in path[:-1]:
+        if isinstance(data, dict) and not isinstance(data.get(part), (dict, list)):
+            data[part] = {}
+        data = data[part]
+    data[path[-1]] = value
+
+
+def _parse_path(text: str) -> tuple:
+    return tuple(int(part) if part.isdigit() else part for part in str(text).split("."))
+
+
+def _repair_prompt(errors: List[Tuple[tuple, str]], data: Any) -> str:
+    lines = [
+        f"- {'.'.join(str(p) for p in path)} = {compact_json(_get_path(data, path))} ({message})"
+        for path, message in errors
+    ]
+    return (
+        f"Your previous JSON answer was:\n{compact_json(data)}\n\n"
+        "Some of its fields are invalid:\n" + "\n".join(lines) +
+        "\n\nReturn only a JSON object that maps each field path listed above to its corrected value, "
+        "e.g. {\"0.Score\": 80}. Do not include fields that are not listed."
+    )
+
+
+def _reformat_prompt(raw: str, schema: Type[BaseModel], many: bool, key: Optional[str]) -> str:
+    fields = ", ".join(schema.model_fields)
+    shape = f'an object {{"{key}": [...]}} whose list items have keys: {fields}' if many else f"an object with keys: {fields}"
+    return (
+        f"Convert the following answer into valid JSON: {shape}. Keep the content, fix only the syntax. "
+        f"Return only the JSON.\n\n{raw[:REFORMAT_CHARS]}"
+    )
+
+
+def invoke_structured(llm, prompt: Any, schema: Type[BaseModel], many: bool = False, key: Optional[str] = None,
+                      context: Optional[Dict] = None, max_repairs: int = MAX_REPAIRS):
+    """
+    Invoke `llm` (in JSON mode where supported) and validate the answer against `schema`.
+    Invalid fields are sent back for targeted repair instead of regenerating the whole answer; an
+    unparseable answer is sent back once to be reformatted. With `many`, the answer is a list (or
+    an object holding it under `key`) and items still invalid after the repairs are dropped.
+    Raises StructuredOutputError if nothing valid remains.
+    """
+    llm = json_mode(llm)
+    name = schema.__name__ + ("[]" if many else "")
+    started = time.perf_counter()
+    repairs = 0
+    repair_latency = 0.0
+
+    def ask(text: str) -> str:
+        return llm.invoke(text).content
+
+    raw = ask(prompt)
+    try:
+        data = _unwrap(extract_json(raw), many, key)
+    except JSONExtractionError:
+        data = None
+
+    parsed, errors = None, []
+    while True:
+        if data is None:
+            errors = [((), "response was not valid JSON")]
+        else:
+            parsed, errors = _errors(schema, data, many, context)
+        if not errors or repairs >= max_repairs:
+            break
+        repairs += 1
+        repair_started = time.perf_counter()
+        try:
+            # Errors on the whole answer (or a whole list item) can't be fixed field by field
+            if data is None or any(len(path) <= int(many) for path, _ in errors):
+                logger.warning(f"{name}: unusable response, asking the model to reformat it")
+                data = _unwrap(extract_json(ask(_reformat_prompt(raw, schema, many, key))), many, key)
+            else:
+                logger.warning(f"{name}: repairing {len(errors)} invalid field(s)")
+                patch = extract_json(ask(_repair_prompt(errors, data)), dict)
+                for path, value in patch.items():
+                    try:
+                        _set_path(data, _parse_path(path), value)
+                    except (KeyError, IndexError, TypeError):
+                        logger.warning(f"{name}: ignoring repair for unknown field {path}")
+        except JSONExtractionError:
+            logger.warning(f"{name}: repair response was not valid JSON")
+        finally:
+            repair_latency += time.perf_counter() - repair_started
+
+    latency = time.perf_counter() - started
+    if many and parsed is not None:
+        valid = [item for item in parsed if item is not None]
+        dropped = len(parsed) - len(valid)
+        if dropped:
+            logger.warning(f"{name}: dropping {dropped} item(s) still invalid after {repairs} repair(s)")
+        _stats.record(name, repairs, bool(valid), dropped, latency, repair_latency)
+        if valid:
+            return valid
+    else:
+        _stats.record(name, repairs, parsed is not None, 0, latency, repair_latency)
+        if parsed is not None:
+            return parsed
+    raise StructuredOutputError(f"{name} still invalid after {repairs} repair(s): " +
+                                "; ".join(f"{'.'.join(map(str, p)) or '<root>'}: {m}" for p, m in errors[:5]))
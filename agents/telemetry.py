@@ -0,0 +1,146 @@
+from utils.logger import logger
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, List, Optional
+import json
+import os
+import sys
+import threading
+import time
+
+# Most recent calls kept in memory; older records are dropped (export them first if they matter)
+TELEMETRY_MAX_RECORDS = int(os.getenv("LLM_TELEMETRY_MAX_RECORDS", "10000"))
+# Modules between an agent method and the client call; the first frame outside these names the method
+_PLUMBING_MODULES = ("agents.llm_registry", "agents.structured_output", "agents.telemetry", "utils.single_flight")
+
+_method: ContextVar[Optional[str]] = ContextVar("llm_method", default=None)
+
+
+@contextmanager
+def llm_method(name: str):
+    """
+    Attribute LLM calls made inside the block to agent method `name`. For calls handed to a thread pool,
+    whose stack doesn't reach the agent: submit them with contextvars.copy_context() inside the block.
+    """
+    token = _method.set(name)
+    try:
+        yield
+    finally:
+        _method.reset(token)
+
+
+def call_site() -> str:
+    """
+    Name of the agent method that issued the current LLM call, e.g. "ReasoningAgent" -> "validate_trade":
+    the method set with llm_method, else the nearest agent frame on this thread's stack.
+    """
+    method = _method.get()
+    if method is not None:
+        return method
+    frame = sys._getframe(1)
+    while frame is not None:
+        module = frame.f_globals.get("__name__", "")
+        if module.startswith("agents.") and not module.startswith(_PLUMBING_MODULES):
+            return frame.f_code.co_name
+        frame = frame.f_back
+    return "unknown"
+
+
+def _percentile(values: List[float], fraction: float) -> float:
+    return values[min(len(values) - 1, int(round(fraction * (len(values) - 1))))]
+
+
+class LLMTelemetry:
+    """
+    In-process record of every LLM call made through ManagedLLM: model, agent, calling method,
+    tokens, API latency, total time including rate-limit waits, retries, cache hits and errors.
+    """
+
+    def __init__(self, max_records: int = TELEMETRY_MAX_RECORDS):
+        self._lock = threading.Lock()
+        self._records: deque = deque(maxlen=max_records)
+
+    def record(self, model: str, agent: str, method: str, mode: str, prompt_tokens: int = 0,
+               completion_tokens: int = 0, latency: float = 0.0, total: float = 0.0, retries: int = 0,
+               cache_hit: bool = False, first_token: Optional[float] = None, error: Optional[str] = None):
+        entry = {
+            "ts": time.time(),
+            "model": model,
+            "agent": agent,
+            "method": method,
+            "mode": mode,
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "latency": round(latency, 4),
+            "total": round(total, 4),
+            "first_token": round(first_token, 4) if first_token is not None else None,
+            "retries": retries,
+            "cache_hit": cache_hit,
+            "error": error
+        }
+        with self._lock:
+            self._records.append(entry)
+
+    def records(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            return list(self._records)
+
+    def summary(self) -> Dict[str, Dict]:
+        """Per "Agent.method": calls, errors, cache hits, retries, tokens, latency percentiles and share of total time."""
+        groups: Dict[str, List[Dict]] = {}
+        for entry in self.records():
+            groups.setdefault(f"{entry['agent']}.{entry['method']}", []).append(entry)
+        overall = sum(entry["total"] for entries in groups.values() for entry in entries) or 1.0
+        summary = {}
+        for name, entries in groups.items():
+            latencies = sorted(entry["latency"] for entry in entries if not entry["cache_hit"] and not entry["error"])
+            total = sum(entry["total"] for entry in entries)
+            summary[name] = {
+                "model": entries[-1]["model"],
+                "calls": len(entries),
+                "errors": sum(1 for entry in entries if entry["error"]),
+                "cache_hits": sum(1 for entry in entries if entry["cache_hit"]),
+                "retries": sum(entry["retries"] for entry in entries),
+                "prompt_tokens": sum(entry["prompt_tokens"] for entry in entries),
+                "completion_tokens": sum(entry["completion_tokens"] for entry in entries),
+                "p50_latency": round(_percentile(latencies, 0.5), 3) if latencies else 0.0,
+                "p95_latency": round(_percentile(latencies, 0.95), 3) if latencies else 0.0,
+                "max_latency": round(latencies[-1], 3) if latencies else 0.0,
+                "total_seconds": round(total, 3),
+                "share": round(total / overall, 3)
+            }
+        return dict(sorted(summary.items(), key=lambda item: item[1]["total_seconds"], reverse=True))
+
+    def export_jsonl(self, path: str, clear: bool = False) -> int:
+        """Append every record to `path` as one JSON object per line; returns the number written."""
+        with self._lock:
+            entries = list(self._records)
+            if clear:
+                self._records.clear()
+        try:
+            with open(path, "a", encoding="utf-8") as f:
+                for entry in entries:
+                    f.write(json.dumps(entry) + "\n")
+        except OSError as e:
+            logger.error(f"Failed to export LLM telemetry to {path}: {str(e)}")
+            return 0
+        logger.info(f"Exported {len(entries)} LLM telemetry records to {path}")
+        return len(entries)
+
+    def clear(self):
+        with self._lock:
+            self._records.clear()
+
+
+telemetry = LLMTelemetry()
+
+
+def llm_telemetry_summary() -> Dict[str, Dict]:
+    """Latency, token, retry and cache-hit totals per agent method, slowest first."""
+    return telemetry.summary()
+
+
+def export_llm_telemetry(path: str, clear: bool = False) -> int:
+    """Write the recorded LLM calls to a JSONL file."""
+    return telemetry.export_jsonl(path, clear)
@@ -0,0 +1,95 @@
+from agents.prompt_encoding import estimate_tokens
+from utils.logger import logger
+from collections import deque
+from typing import Any, Dict
+import threading
+import time
+
+# Per-agent limits: largest prompt accepted in one call, and total tokens (prompt + completion) per rolling hour
+AGENT_TOKEN_BUDGETS = {
+    "ReasoningAgent": {"prompt": 8000, "hourly": 2_000_000},
+    "StrategistAgent": {"prompt": 6000, "hourly": 500_000},
+    "MarketAnalystAgent": {"prompt": 3000, "hourly": 500_000},
+    "PreferenceParserAgent": {"prompt": 2000, "hourly": 200_000},
+    "EducatorAgent": {"prompt": 1000, "hourly": 200_000},
+    "MonitorGuardrailAgent": {"prompt": 2000, "hourly": 200_000},
+    "GroqEnhancerAgent": {"prompt": 4000, "hourly": 300_000}
+}
+DEFAULT_TOKEN_BUDGET = {"prompt": 8000, "hourly": 500_000}
+WINDOW_SECONDS = 3600
+
+
+class TokenBudgetExceeded(RuntimeError):
+    """Raised before a call that would exceed its agent's token budget."""
+
+
+def usage_from_response(response: Any, prompt: Any) -> Dict[str, int]:
+    """Prompt and completion tokens reported by the API, estimated from text when missing."""
+    usage = getattr(response, "usage_metadata", None) or {}
+    if not usage:
+        token_usage = (getattr(response, "response_metadata", None) or {}).get("token_usage") or {}
+        usage = {"input_tokens": token_usage.get("prompt_tokens"), "output_tokens": token_usage.get("completion_tokens")}
+    prompt_tokens = usage.get("input_tokens")
+    completion_tokens = usage.get("output_tokens")
+    return {
+        "prompt_tokens": int(prompt_tokens) if prompt_tokens is not None else estimate_tokens(prompt),
+        "completion_tokens": int(completion_tokens) if completion_tokens is not None else estimate_tokens(getattr(response, "content", ""))
+    }
+
+
+class TokenLedger:
+    """Per-agent token accounting with a per-call prompt cap and a rolling hourly total."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._window: Dict[str, deque] = {}
+        self.totals: Dict[str, Dict[str, int]] = {}
+
+    def _hourly_used(self, agent: str, now: float) -> int:
+        window = self._window.setdefault(agent, deque())
+        while window and window[0][0] < now - WINDOW_SECONDS:
+            window.popleft()
+        return sum(tokens for _, tokens in window)
+
+    def check(self, agent: str, prompt: Any) -> int:
+        """Estimate the prompt's tokens and raise TokenBudgetExceeded if the agent can't afford it."""
+        budget = AGENT_TOKEN_BUDGETS.get(agent, DEFAULT_TOKEN_BUDGET)
+        prompt_tokens = estimate_tokens(prompt)
+        if prompt_tokens > budget["prompt"]:
+            raise TokenBudgetExceeded(f"{agent} prompt of ~{prompt_tokens} tokens exceeds its {budget['prompt']} token limit")
+        with self._lock:
+            used = self._hourly_used(agent, time.time())
+        if used + prompt_tokens > budget["hourly"]:
+            raise TokenBudgetExceeded(f"{agent} has used {used} of its {budget['hourly']} tokens this hour")
+        return prompt_tokens
+
+    def record(self, agent: str, model_name: str, prompt_tokens: int, completion_tokens: int):
+        now = time.time()
+        with self._lock:
+            self._window.setdefault(agent, deque()).append((now, prompt_tokens + completion_tokens))
+            totals = self.totals.setdefault(agent, {"calls": 0, "prompt_tokens": 0, "completion_tokens": 0})
+            totals["calls"] += 1
+            totals["prompt_tokens"] += prompt_tokens
+            totals["completion_tokens"] += completion_tokens
+        logger.info(f"{agent} ({model_name}) used {prompt_tokens} prompt + {completion_tokens} completion tokens")
+
+    def stats(self) -> Dict[str, Dict]:
+        now = time.time()
+        with self._lock:
+            return {
+                agent: {
+                    **totals,
+                    "avg_prompt_tokens": totals["prompt_tokens"] // totals["calls"] if totals["calls"] else 0,
+                    "hourly_used": self._hourly_used(agent, now),
+                    "hourly_budget": AGENT_TOKEN_BUDGETS.get(agent, DEFAULT_TOKEN_BUDGET)["hourly"]
+                }
+                for agent, totals in self.totals.items()
+            }
+
+
+token_ledger = TokenLedger()
+
+
+def token_stats() -> Dict[str, Dict]:
+    """Calls, prompt/completion tokens and hourly budget use per agent."""
+    return token_ledger.stats()
@@ -0,0 +1,129 @@
+from utils.logger import logger
+from typing import Dict, List, Optional, Tuple
+import statistics
+import threading
+import time
+
+ACCEPT = "accept"
+REJECT = "reject"
+ESCALATE = "escalate"
+
+# Symbols the simulator trades; the one list shared by the reasoning agent, strategist and guardrail
+TRADED_SYMBOLS = [
+    "UNH", "TSLA", "QCOM", "ORCL", "NVDA", "NFLX", "MSFT", "META", "LLY", "JNJ",
+    "INTC", "IBM", "GOOGL", "GM", "F", "CSCO", "AMZN", "AMD", "ADBE", "AAPL"
+]
+
+# Largest share of the investment amount a single trade may take, by risk appetite
+CONCENTRATION_LIMITS = {"low": 0.4, "medium": 0.5, "high": 0.6}
+# Buys scoring at least this much with non-negative news are accepted without the LLM
+MIN_CLEAR_SCORE = 60
+# Reasoning step marking a validation that was settled without an LLM call
+RULE_SETTLED_STEP = "✓ Settled by deterministic trade rules without an LLM call"
+
+
+class _RuleStats:
+    """Process-wide counters for rule-engine decisions."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.decisions = {ACCEPT: 0, REJECT: 0, ESCALATE: 0}
+        self._latencies_ms: List[float] = []
+
+    def record(self, verdict: str, elapsed_ms: float):
+        with self._lock:
+            self.decisions[verdict] += 1
+            if verdict != ESCALATE:
+                self._latencies_ms.append(elapsed_ms)
+                del self._latencies_ms[:-1000]
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            total = sum(self.decisions.values())
+            saved = self.decisions[ACCEPT] + self.decisions[REJECT]
+            return {
+                "evaluated": total,
+                "accepted": self.decisions[ACCEPT],
+                "rejected": self.decisions[REJECT],
+                "escalated": self.decisions[ESCALATE],
+                "llm_calls_saved": saved,
+                "saved_ratio": saved / total if total else 0.0,
+                "median_rule_latency_ms": statistics.median(self._latencies_ms) if self._latencies_ms else 0.0
+            }
+
+
+rule_stats = _RuleStats()
+
+
+class TradeRuleEngine:
+    """
+    Deterministic pre-validation for trade recommendations.
+    Clear-cut trades are accepted or rejected outright; anything ambiguous is escalated to the LLM.
+    """
+
+    def __init__(self, allowed_symbols: List[str]):
+        self.allowed_symbols = {s.upper() for s in allowed_symbols}
+
+    def evaluate(self, recommendation: Dict, preferences: Dict, current_price: float,
+                 holdings: Optional[Dict[str, float]] = None) -> Tuple[str, List[str]]:
+        """Return (verdict, reasons) where verdict is ACCEPT, REJECT or ESCALATE."""
+        started = time.perf_counter()
+        verdict, reasons = self._evaluate(recommendation, preferences, current_price, holdings)
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        rule_stats.record(verdict, elapsed_ms)
+        logger.info(f"Rule engine {verdict} for {recommendation.get('Symbol')} in {elapsed_ms:.3f}ms: {'; '.join(reasons)}")
+        return verdict, reasons
+
+    def _evaluate(self, recommendation: Dict, preferences: Dict, current_price: float,
+                  holdings: Optional[Dict[str, float]]) -> Tuple[str, List[str]]:
+        symbol = str(recommendation.get("Symbol", "")).upper()
+        action = str(recommendation.get("Action", "")).lower()
+        try:
+            quantity = float(recommendation.get("Quantity", 0))
+            score = float(recommendation.get("Score", 0))
+            budget = float(preferences.get("investment_amount", 0.0))
+        except (TypeError, ValueError):
+            return REJECT, ["Quantity, score or investment amount is not numeric"]
+
+        # Hard rejections
+        if symbol not in self.allowed_symbols:
+            return REJECT, [f"{symbol} is not in the allowed stock list"]
+        if action not in ("buy", "sell"):
+            return REJECT, [f"Unsupported action '{recommendation.get('Action')}'"]
+        if current_price <= 0:
+            return REJECT, [f"No valid price for {symbol}"]
+        if quantity <= 0:
+            return REJECT, [f"Quantity must be positive, got {quantity}"]
+
+        total_cost = quantity * current_price
+        if action == "buy":
+            if total_cost > budget:
+                return REJECT, [f"Total cost ${total_cost:.2f} exceeds investment amount ${budget:.2f}"]
+            limit = CONCENTRATION_LIMITS.get(str(preferences.get("risk_appetite", "medium")).lower(), 0.5)
+            if budget > 0 and total_cost / budget > limit:
+                return REJECT, [f"Position is {total_cost / budget:.0%} of the investment amount, above the {limit:.0%} concentration limit"]
+        elif holdings is not None:
+            held = holdings.get(symbol, 0.0)
+            if quantity > held + 1e-9:
+                return REJECT, [f"Cannot sell {quantity:.2f} shares of {symbol}: only {held:.2f} held"]
+
+        passed = [f"{symbol} is an allowed stock", f"{action.capitalize()} {quantity:.2f} shares at ${current_price:.2f} (${total_cost:.2f})"]
+
+        # Anything needing judgement goes to the LLM
+        free_text = preferences.get("additional_details") or preferences.get("additional_preferences")
+        if free_text and str(free_text).strip():
+            return ESCALATE, passed + ["Additional free-text preferences need interpretation"]
+        if action == "sell":
+            if holdings is None:
+                return ESCALATE, passed + ["Holdings unknown, cannot confirm the sell quantity"]
+            return ACCEPT, passed + [f"Sell quantity is within the {holdings.get(symbol, 0.0):.2f} shares held"]
+        if score < MIN_CLEAR_SCORE:
+            return ESCALATE, passed + [f"Score {score:.0f} is below the {MIN_CLEAR_SCORE} auto-accept threshold"]
+        if recommendation.get("NewsSentiment") == "Negative":
+            return ESCALATE, passed + ["Negative news sentiment"]
+        return ACCEPT, passed + ["Cost within budget and concentration limit", f"Score {score:.0f} with {recommendation.get('NewsSentiment', 'Neutral')} news"]
+
+
+def get_rule_stats() -> Dict:
+    """Counts of rule-engine decisions and the LLM calls they saved."""
+    return rule_stats.snapshot()
@@ -1,76 +1,451 @@
-from langgraph.graph import StateGraph, END
-from typing import TypedDict, List, Dict
+from langgraph.graph import StateGraph, START, END
+from langgraph.config import get_stream_writer
+from langchain_core.runnables import RunnableConfig
+from typing import Annotated, TypedDict, Iterator, List, Dict, Optional, Tuple, TYPE_CHECKING
+from concurrent.futures import ThreadPoolExecutor
 from agents.reasoning_agent import ReasoningAgent
+from agents.trade_rules import RULE_SETTLED_STEP
+from agents.llm_registry import MODEL_CONCURRENCY, DEFAULT_CONCURRENCY
+from agents.prompt_encoding import market_data_table, compact_json
+from agents.workflow_checkpoints import get_workflow_checkpoints
+from agents.recommendation_cache import get_recommendation_cache, snapshot_epoch, PREFERENCE_FIELDS, FREE_TEXT_FIELDS
 from utils.logger import logger
+from utils.single_flight import SingleFlight
 import finnhub
 from utils.config import FINNHUB_API_KEY
+import contextvars
+import hashlib
+import os
+import threading
 import time
 
-class WorkflowState(TypedDict):
+if TYPE_CHECKING:
+    from agents.market_analyst import MarketAnalystAgent
+
+def _merge_timings(left: Dict, right: Dict) -> Dict:
+    return {**(left or {}), **(right or {})}
+
+class WorkflowState(TypedDict, total=False):
     preferences: Dict
     user_id: str
+    is_trade: bool
+    stock_data: Dict
+    fundamentals: Dict
+    sentiments: Dict
+    cached: bool
     recommendations: List[Dict]
     market_insights: str
     reasoning_steps: List[str]
     thinking_process: List[str]
+    result: Dict
+    # Node name -> [start, end] in seconds since the run began; parallel nodes merge their entries
+    timings: Annotated[Dict[str, List[float]], _merge_timings]
 
 finnhub_client = finnhub.Client(api_key=FINNHUB_API_KEY)
 STOCK_LIST = ["AAPL", "MSFT", "GOOGL", "AMZN", "TSLA", "NVDA", "META", "JPM", "WMT", "V"]
 
-def run_workflow(preferences: Dict, user_id: str, is_trade: bool = False) -> Dict:
-    """Run the investment recommendation workflow with step-by-step reasoning."""
+# Concurrent requests with identical preferences and prices share one analysis
+_analysis_flight = SingleFlight("workflow analysis")
+# Set WORKFLOW_MARKET_DATA=0 to skip the fundamentals and news nodes (e.g. offline load tests)
+MARKET_DATA_ENABLED = os.getenv("WORKFLOW_MARKET_DATA", "1") != "0"
+# Set WORKFLOW_HOLDINGS=0 to validate trades without reading the user's holdings from MySQL
+HOLDINGS_ENABLED = os.getenv("WORKFLOW_HOLDINGS", "1") != "0"
+# Concurrent workflows share one fundamentals read and one news sentiment pass
+_market_flight = SingleFlight("workflow market data")
+
+# Nodes whose output is checkpointed; analysis and thinking checkpoints are tied to the price snapshot
+CHECKPOINTED_NODES = {"snapshot": False, "fundamentals": False, "news_sentiment": False,
+                      "analysis": True, "thinking": True}
+
+# Upstream nodes of each graph node; the critical path follows whichever finished last
+NODE_DEPENDENCIES = {
+    "snapshot": [],
+    "fundamentals": [],
+    "news_sentiment": [],
+    "cache_lookup": ["snapshot", "fundamentals", "news_sentiment"],
+    "analysis": ["cache_lookup"],
+    "thinking": ["cache_lookup"],
+    "finalize": ["analysis", "thinking", "cache_lookup"]
+}
+
+# One long-lived analyst per market-data node, so their hour-long TTL caches carry over between runs
+# and each cache is only used by one thread at a time (the single flight keeps one call per node in flight)
+# Created on first use: MarketAnalystAgent opens its MySQL connection when constructed and imported
+_analysts: Dict[str, "MarketAnalystAgent"] = {}
+_analysts_lock = threading.Lock()
+
+def _analyst(role: str) -> "MarketAnalystAgent":
+    from agents.market_analyst import MarketAnalystAgent
+    with _analysts_lock:
+        if role not in _analysts:
+            _analysts[role] = MarketAnalystAgent()
+        return _analysts[role]
+
+def _price_snapshot() -> Dict:
+    """One price snapshot shared by the cache lookup and the analysis."""
     try:
-        reasoning_agent = ReasoningAgent()
-
-        # Initialize state
-        state = WorkflowState(
-            preferences=preferences,
-            user_id=user_id,
-            recommendations=[],
-            market_insights="",
-            reasoning_steps=[],
-            thinking_process=[]
-        )
-
-        # Run the analysis
-        recommendations, insights, steps, thinking = reasoning_agent.analyze_investment_scenario(
-            preferences,
-            is_trade=is_trade
-        )
-
-        if not recommendations:
-            logger.warning("No recommendations generated")
-            return {
-                "recommendations": [],
-                "market_insights": "Unable to generate recommendations at this time.",
-                "reasoning_steps": steps,
-                "thinking_process": thinking
-            }
-
-        # If this is a trade request, validate the recommendations
-        if is_trade:
-            valid_recommendations = []
-            validation_steps = []
-            for rec in recommendations:
-                is_valid, explanation, val_steps = reasoning_agent.validate_trade(rec, preferences)
-                if is_valid:
-                    valid_recommendations.append(rec)
-                validation_steps.extend(val_steps)
-            recommendations = valid_recommendations
-            steps.extend(validation_steps)
+        from scripts.fetch_stock_prices import fetch_stock_prices
+        return fetch_stock_prices()
+    except Exception as e:
+        logger.error(f"Failed to fetch price snapshot for recommendation cache: {str(e)}")
+        return {}
+
+def _cached_analysis(reasoning_agent: ReasoningAgent, preferences: Dict,
+                     stock_data: Dict) -> Optional[Tuple[List[Dict], str, List[str], List[str]]]:
+    """Stored analysis for the same preference bucket and price snapshot, rescaled to this user's amount."""
+    rec_cache = get_recommendation_cache()
+    cached = rec_cache.get(preferences, stock_data) if rec_cache else None
+    if not cached:
+        return None
+    amount = float(preferences["investment_amount"])
+    recommendations = cached["recommendations"]
+    thinking = [f"♻️ Reusing an analysis made for ${cached['base_amount']:.2f} with the same preferences and prices; "
+                f"quantities are rescaled to ${amount:.2f}"] + cached["thinking_process"]
+    steps = [f"Investment amount specified: ${amount:.2f}",
+             "⚡ Served from the recommendation cache for matching preferences and price snapshot"]
+    steps.extend(reasoning_agent.format_recommendation(rec) for rec in recommendations)
+    return recommendations, cached["market_insights"], steps, thinking
+
+def _flight_key(mode: str, preferences: Dict, stock_data: Dict, is_trade: bool) -> str:
+    """Normalized preferences, exact amount, free text and price snapshot; equal keys get equal analyses."""
+    fields = [str(preferences.get(field) or "").strip().lower() for field in PREFERENCE_FIELDS]
+    notes = [" ".join(str(preferences.get(field) or "").lower().split()) for field in FREE_TEXT_FIELDS]
+    try:
+        amount = f"{float(preferences.get('investment_amount', 0.0)):.2f}"
+    except (TypeError, ValueError):
+        amount = str(preferences.get("investment_amount"))
+    epoch = snapshot_epoch(stock_data) if stock_data else "nosnapshot"
+    return "|".join([mode, "trade" if is_trade else "advice", amount, epoch] + fields + notes)
 
+def _store_analysis(preferences: Dict, stock_data: Dict, recommendations: List[Dict], insights: str, thinking: List[str]):
+    rec_cache = get_recommendation_cache()
+    if rec_cache:
+        rec_cache.put(preferences, stock_data, recommendations, insights, thinking)
+
+def _complete_workflow(reasoning_agent: ReasoningAgent, preferences: Dict, user_id: str, is_trade: bool,
+                       recommendations: List[Dict], insights: str, steps: List[str], thinking: List[str],
+                       run_id: Optional[str] = None, epoch: str = "") -> Dict:
+    """
+    Validate trades if requested and assemble the workflow result. With a `run_id`, each validation is
+    checkpointed against the price snapshot `epoch` and the user's holdings, so a resumed run skips it.
+    """
+    if not recommendations:
+        logger.warning("No recommendations generated")
         return {
-            "recommendations": recommendations,
-            "market_insights": insights,
+            "recommendations": [],
+            "market_insights": "Unable to generate recommendations at this time.",
             "reasoning_steps": steps,
             "thinking_process": thinking
         }
 
+    # If this is a trade request, validate the recommendations
+    if is_trade:
+        holdings = None
+        try:
+            if HOLDINGS_ENABLED:
+                from gamification.virtual_currency import get_holdings
+                holdings = get_holdings(user_id)
+        except Exception as e:
+            logger.error(f"Failed to load holdings for user {user_id}: {str(e)}")
+
+        checkpoints = get_workflow_checkpoints() if run_id else None
+        holdings_key = hashlib.sha1(compact_json(holdings or {}).encode("utf-8")).hexdigest()[:12]
+
+        def validate(rec: Dict) -> Tuple[bool, str, List[str]]:
+            step = f"validate:{epoch}:{holdings_key}:{rec.get('Symbol')}:{rec.get('Action')}:{rec.get('Quantity')}"
+            stored = checkpoints.load(run_id, step) if checkpoints else None
+            if stored is not None:
+                return tuple(stored)
+            result = reasoning_agent.validate_trade(rec, preferences, holdings)
+            if checkpoints:
+                checkpoints.save(run_id, step, list(result))
+            return result
+
+        # Validations are independent LLM calls; fan them out and keep the original order.
+        # The shared client's per-model semaphore keeps in-flight requests within the Groq limit.
+        workers = min(len(recommendations), MODEL_CONCURRENCY.get(reasoning_agent.llm.model_name, DEFAULT_CONCURRENCY))
+        with ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="validate") as pool:
+            # Each validation runs in a copy of the caller's context so it keeps the request priority
+            results = list(pool.map(
+                lambda rec, ctx: ctx.run(validate, rec),
+                recommendations,
+                [contextvars.copy_context() for _ in recommendations]
+            ))
+
+        valid_recommendations = []
+        validation_steps = []
+        saved = 0
+        for rec, (is_valid, explanation, val_steps) in zip(recommendations, results):
+            if is_valid:
+                valid_recommendations.append(rec)
+            if RULE_SETTLED_STEP in val_steps:
+                saved += 1
+            validation_steps.extend(val_steps)
+        logger.info(f"Trade rules settled {saved} of {len(recommendations)} validations without an LLM call")
+        validation_steps.append(f"⚡ Trade rules settled {saved} of {len(recommendations)} validations without an LLM call")
+        recommendations = valid_recommendations
+        steps.extend(validation_steps)
+
+    return {
+        "recommendations": recommendations,
+        "market_insights": insights,
+        "reasoning_steps": steps,
+        "thinking_process": thinking
+    }
+
+def _failed_result(e: Exception) -> Dict:
+    return {
+        "recommendations": [],
+        "market_insights": f"Analysis failed: {str(e)}",
+        "reasoning_steps": ["Error occurred during analysis"],
+        "thinking_process": ["🤔 Thinking: An error occurred during analysis..."]
+    }
+
+def _market_context(stock_data: Dict, fundamentals: Dict, sentiments: Dict) -> str:
+    """CSV of fundamentals and news sentiment for the analysis prompt; empty when neither was fetched."""
+    if not fundamentals and not sentiments:
+        return ""
+    items = []
+    for symbol in sorted(set(fundamentals) | set(sentiments)):
+        fundamental = fundamentals.get(symbol) or {}
+        items.append({
+            "symbol": symbol,
+            "company": fundamental.get("company", symbol),
+            "price": (stock_data.get(symbol) or {}).get("current_price"),
+            "news_sentiment": sentiments.get(symbol, "Neutral"),
+            "financials": fundamental.get("financials") or {}
+        })
+    return market_data_table(items)
+
+def _checkpoint_worthy(update: Dict) -> bool:
+    """Only complete outputs are checkpointed; an empty or fallback result is retried by the next run."""
+    if not all(update.values()):
+        return False
+    if update.get("thinking_process") == list(ReasoningAgent.THINKING_FALLBACK):
+        return False
+    return not any(rec.get("Symbol") == "ERROR" for rec in update.get("recommendations", []))
+
+def _resumed_events(update: Dict) -> List[Dict]:
+    """Events a streaming caller would have seen from the node, replayed from its checkpoint."""
+    events = []
+    if "thinking_process" in update:
+        events.append({"type": "thoughts", "thoughts": update["thinking_process"]})
+    for rec in update.get("recommendations", []):
+        events.append({"type": "recommendation", "recommendation": rec})
+    return events
+
+def _timed(name: str, node):
+    """
+    Wrap a graph node to record when it started and finished, relative to the start of the run.
+    Checkpointed nodes first look for their output from an earlier attempt at the same run.
+    """
+    def run(state: WorkflowState, config: RunnableConfig) -> Dict:
+        origin = config["configurable"]["started"]
+        run_id = config["configurable"].get("run_id")
+        started = time.perf_counter()
+        checkpoints = get_workflow_checkpoints() if run_id and name in CHECKPOINTED_NODES else None
+        step = f"{name}:{snapshot_epoch(state['stock_data'])}" if CHECKPOINTED_NODES.get(name) else name
+        update = checkpoints.load(run_id, step) if checkpoints else None
+        if update is not None:
+            write = get_stream_writer()
+            write({"type": "status", "text": f"♻️ Resumed {name.replace('_', ' ')} from an earlier attempt"})
+            for event in _resumed_events(update):
+                write(event)
+        else:
+            update = node(state, config)
+            if checkpoints and _checkpoint_worthy(update):
+                checkpoints.save(run_id, step, update)
+        finished = time.perf_counter()
+        logger.info(f"Workflow node {name} took {finished - started:.2f}s")
+        update["timings"] = {name: [round(started - origin, 3), round(finished - origin, 3)]}
+        return update
+    return run
+
+def _snapshot_node(state: WorkflowState, config: RunnableConfig) -> Dict:
+    return {"stock_data": _price_snapshot()}
+
+def _fundamentals_node(state: WorkflowState, config: RunnableConfig) -> Dict:
+    if not MARKET_DATA_ENABLED:
+        return {"fundamentals": {}}
+    symbols = config["configurable"]["reasoning_agent"].ALLOWED_STOCKS
+    try:
+        fundamentals = _market_flight.do("fundamentals", lambda: _analyst("fundamentals").fetch_fundamentals(symbols))
+    except Exception as e:
+        logger.error(f"Failed to load fundamentals for the workflow: {str(e)}")
+        fundamentals = {}
+    get_stream_writer()({"type": "status", "text": f"Loaded fundamentals for {len(fundamentals)} stocks"})
+    return {"fundamentals": fundamentals}
+
+def _news_sentiment_node(state: WorkflowState, config: RunnableConfig) -> Dict:
+    if not MARKET_DATA_ENABLED:
+        return {"sentiments": {}}
+    symbols = config["configurable"]["reasoning_agent"].ALLOWED_STOCKS
+    try:
+        sentiments = _market_flight.do("news", lambda: _analyst("news").fetch_news_sentiment(symbols))
+    except Exception as e:
+        logger.error(f"Failed to score news sentiment for the workflow: {str(e)}")
+        sentiments = {}
+    get_stream_writer()({"type": "status", "text": f"Scored news sentiment for {len(sentiments)} stocks"})
+    return {"sentiments": sentiments}
+
+def _cache_lookup_node(state: WorkflowState, config: RunnableConfig) -> Dict:
+    """Serve a stored analysis for the same preference bucket and price snapshot when there is one."""
+    cached = _cached_analysis(config["configurable"]["reasoning_agent"], state["preferences"], state["stock_data"])
+    if not cached:
+        return {"cached": False}
+    recommendations, insights, steps, thinking = cached
+    return {"cached": True, "recommendations": recommendations, "market_insights": insights,
+            "reasoning_steps": steps, "thinking_process": thinking}
+
+def _after_cache_lookup(state: WorkflowState) -> List[str]:
+    return ["finalize"] if state.get("cached") else ["analysis", "thinking"]
+
+def _thinking_node(state: WorkflowState, config: RunnableConfig) -> Dict:
+    reasoning_agent = config["configurable"]["reasoning_agent"]
+    preferences, stock_data = state["preferences"], state["stock_data"]
+    write = get_stream_writer()
+    thoughts = list(reasoning_agent.THINKING_FALLBACK)
+    # Identical requests already in flight share that call instead of starting their own
+    key = _flight_key("thinking", preferences, stock_data, state["is_trade"])
+    for event in _analysis_flight.stream(key, lambda: reasoning_agent.stream_thinking(preferences, stock_data)):
+        if event["type"] == "thoughts":
+            thoughts = event["thoughts"]
+        write(event)
+    return {"thinking_process": thoughts}
+
+def _analysis_node(state: WorkflowState, config: RunnableConfig) -> Dict:
+    reasoning_agent = config["configurable"]["reasoning_agent"]
+    preferences, stock_data = state["preferences"], state["stock_data"]
+    context = _market_context(stock_data, state.get("fundamentals") or {}, state.get("sentiments") or {})
+    write = get_stream_writer()
+    key = (_flight_key("analysis", preferences, stock_data, state["is_trade"])
+           + "|" + hashlib.sha256(context.encode("utf-8")).hexdigest()[:16])
+    final = None
+    for event in _analysis_flight.stream(key, lambda: reasoning_agent.stream_analysis(preferences, stock_data, context)):
+        if event["type"] == "analysis_result":
+            final = event
+        else:
+            write(event)
+    return {"recommendations": final["recommendations"], "market_insights": final["market_insights"],
+            "reasoning_steps": final["reasoning_steps"]}
+
+def _finalize_node(state: WorkflowState, config: RunnableConfig) -> Dict:
+    reasoning_agent = config["configurable"]["reasoning_agent"]
+    preferences = state["preferences"]
+    recommendations = list(state.get("recommendations") or [])
+    if not state.get("cached"):
+        _store_analysis(preferences, state["stock_data"], recommendations, state["market_insights"],
+                        state["thinking_process"])
+    if state["is_trade"] and recommendations:
+        get_stream_writer()({"type": "status", "text": f"Validating {len(recommendations)} recommendations..."})
+    return {"result": _complete_workflow(reasoning_agent, preferences, state["user_id"], state["is_trade"],
+                                         recommendations, state.get("market_insights", ""),
+                                         list(state.get("reasoning_steps") or []),
+                                         list(state.get("thinking_process") or []),
+                                         run_id=config["configurable"].get("run_id"),
+                                         epoch=snapshot_epoch(state["stock_data"]))}
+
+def _build_graph():
+    """
+    Price snapshot, fundamentals and news sentiment run in parallel; the cache lookup joins them and
+    either finishes from a stored analysis or runs the analysis and thinking calls in parallel
+    before validation. Nodes run in supersteps, so each step lasts as long as its slowest node.
+    """
+    graph = StateGraph(WorkflowState)
+    for name, node in (("snapshot", _snapshot_node), ("fundamentals", _fundamentals_node),
+                       ("news_sentiment", _news_sentiment_node), ("cache_lookup", _cache_lookup_node),
+                       ("analysis", _analysis_node), ("thinking", _thinking_node), ("finalize", _finalize_node)):
+        graph.add_node(name, _timed(name, node))
+    for name in ("snapshot", "fundamentals", "news_sentiment"):
+        graph.add_edge(START, name)
+    graph.add_edge(["snapshot", "fundamentals", "news_sentiment"], "cache_lookup")
+    graph.add_conditional_edges("cache_lookup", _after_cache_lookup, ["finalize", "analysis", "thinking"])
+    graph.add_edge(["analysis", "thinking"], "finalize")
+    graph.add_edge("finalize", END)
+    return graph.compile()
+
+_workflow_graph = _build_graph()
+
+def critical_path(timings: Dict[str, List[float]]) -> List[str]:
+    """Nodes on the path that determined the run's latency, walking back from the last to finish."""
+    if not timings:
+        return []
+    node = "finalize" if "finalize" in timings else max(timings, key=lambda name: timings[name][1])
+    path = []
+    while node:
+        path.append(node)
+        upstream = [name for name in NODE_DEPENDENCIES.get(node, []) if name in timings]
+        node = max(upstream, key=lambda name: timings[name][1]) if upstream else None
+    return path[::-1]
+
+def _timing_step(timings: Dict[str, List[float]]) -> str:
+    path = critical_path(timings)
+    total = max(end for _, end in timings.values())
+    busy = sum(end - start for start, end in timings.values())
+    chain = " → ".join(f"{name} {timings[name][1] - timings[name][0]:.1f}s" for name in path)
+    logger.info("Workflow node timings: " + ", ".join(
+        f"{name} {start:.2f}-{end:.2f}s" for name, (start, end) in sorted(timings.items(), key=lambda item: item[1][0])
+    ))
+    logger.info(f"Workflow critical path {total:.2f}s: {chain} ({busy:.2f}s of node time overall)")
+    return f"⏱️ Critical path {total:.1f}s: {chain} ({busy:.1f}s of work across parallel nodes)"
+
+def _initial_state(preferences: Dict, user_id: str, is_trade: bool,
+                   run_id: Optional[str]) -> Tuple[WorkflowState, Dict]:
+    """Graph input and config; without a run id nothing is checkpointed."""
+    state = WorkflowState(preferences=preferences, user_id=user_id, is_trade=is_trade, timings={})
+    config = {"configurable": {"reasoning_agent": ReasoningAgent(), "started": time.perf_counter(), "run_id": run_id}}
+    return state, config
+
+def _clear_checkpoints(run_id: Optional[str]):
+    """A finished run is never resumed, so its checkpoints would only serve stale outputs to a later one."""
+    checkpoints = get_workflow_checkpoints() if run_id else None
+    if checkpoints:
+        checkpoints.clear(run_id)
+
+def _with_timings(final_state: WorkflowState) -> Dict:
+    result = final_state["result"]
+    if final_state.get("timings"):
+        result["reasoning_steps"] = list(result["reasoning_steps"]) + [_timing_step(final_state["timings"])]
+    return result
+
+def run_workflow(preferences: Dict, user_id: str, is_trade: bool = False, run_id: Optional[str] = None) -> Dict:
+    """
+    Run the investment recommendation workflow graph with step-by-step reasoning. With a `run_id` (e.g. a
+    job id), completed nodes are checkpointed until the run finishes, so resuming an interrupted run skips them.
+    """
+    try:
+        state, config = _initial_state(preferences, user_id, is_trade, run_id)
+        result = _with_timings(_workflow_graph.invoke(state, config))
+        _clear_checkpoints(run_id)
+        return result
+
     except Exception as e:
         logger.error(f"Workflow failed: {str(e)}")
-        return {
-            "recommendations": [],
-            "market_insights": f"Analysis failed: {str(e)}",
-            "reasoning_steps": ["Error occurred during analysis"],
-            "thinking_process": ["🤔 Thinking: An error occurred during analysis..."]
-        }
\ No newline at end of file
+        return _failed_result(e)
+
+def workflow_flight_stats() -> Dict[str, int]:
+    """Analyses requested, actually run, and coalesced into an identical in-flight request."""
+    return _analysis_flight.stats()
+
+def stream_workflow(preferences: Dict, user_id: str, is_trade: bool = False,
+                    run_id: Optional[str] = None) -> Iterator[Dict]:
+    """
+    Streaming counterpart of run_workflow. Yields the events graph nodes emit as they run (status updates,
+    thinking and analysis tokens, thoughts, recommendations), then a final
+    {"type": "result", "result": <run_workflow result>} event.
+    """
+    try:
+        state, config = _initial_state(preferences, user_id, is_trade, run_id)
+        final_state = None
+        for mode, chunk in _workflow_graph.stream(state, config, stream_mode=["custom", "values"]):
+            if mode == "custom":
+                yield chunk
+            else:
+                final_state = chunk
+        result = _with_timings(final_state)
+        _clear_checkpoints(run_id)
+        yield {"type": "result", "result": result}
+
+    except Exception as e:
+        logger.error(f"Workflow failed: {str(e)}")
+        yield {"type": "result", "result": _failed_result(e)}
@@ -0,0 +1,77 @@
+from utils.disk_cache import DiskCache, CACHE_DIR
+from utils.logger import logger
+from typing import Any, Dict, Optional
+import os
+import threading
+
+# Completed node outputs of an unfinished run are kept this long; resuming it within the window skips them
+CHECKPOINT_TTL = int(os.getenv("WORKFLOW_CHECKPOINT_TTL", "900"))
+CHECKPOINTS_ENABLED = os.getenv("WORKFLOW_CHECKPOINTS_ENABLED", "1") not in ("0", "false", "False")
+NAMESPACE = "workflow_checkpoints"
+
+
+class WorkflowCheckpoints:
+    """
+    Per-run store of completed graph node outputs on a DiskCache. Only each node's own state update is
+    kept (never the accumulated state), compressed by the store; a finished run's entries are cleared
+    and an abandoned run's expire after `ttl`.
+    """
+
+    def __init__(self, store: DiskCache, ttl: int = CHECKPOINT_TTL):
+        self.store = store
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self.resumed = 0
+        self.saved = 0
+
+    def load(self, run_id: str, step: str) -> Optional[Any]:
+        try:
+            hit = self.store.get(NAMESPACE, f"{run_id}:{step}")
+        except Exception as e:
+            logger.error(f"Failed to read workflow checkpoint {run_id}:{step}: {str(e)}")
+            return None
+        if hit is None:
+            return None
+        with self._lock:
+            self.resumed += 1
+        return hit[0]
+
+    def save(self, run_id: str, step: str, value: Any):
+        try:
+            self.store.set(NAMESPACE, f"{run_id}:{step}", value, self.ttl)
+        except Exception as e:
+            logger.error(f"Failed to write workflow checkpoint {run_id}:{step}: {str(e)}")
+            return
+        with self._lock:
+            self.saved += 1
+
+    def clear(self, run_id: str):
+        """Drop a run's checkpoints once it has finished; nothing will resume it."""
+        try:
+            self.store.delete_prefix(NAMESPACE, f"{run_id}:")
+        except Exception as e:
+            logger.error(f"Failed to clear workflow checkpoints of {run_id}: {str(e)}")
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"resumed": self.resumed, "saved": self.saved}
+
+
+_checkpoints: Optional[WorkflowCheckpoints] = None
+_checkpoints_lock = threading.Lock()
+
+
+def get_workflow_checkpoints() -> Optional[WorkflowCheckpoints]:
+    """Process-wide checkpoint store, or None if disabled or the file can't be opened."""
+    global _checkpoints
+    if not CHECKPOINTS_ENABLED:
+        return None
+    if _checkpoints is None:
+        with _checkpoints_lock:
+            if _checkpoints is None:
+                try:
+                    _checkpoints = WorkflowCheckpoints(DiskCache(CACHE_DIR / "workflow_checkpoints.sqlite3", max_entries=5000))
+                except Exception as e:
+                    logger.error(f"Failed to open workflow checkpoints: {str(e)}")
+                    return None
+    return _checkpoints
@@ -0,0 +1,360 @@
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+from utils.logger import logger
+import csv
+import itertools
+import math
+import os
+import time
+import numpy as np
+
+TRADING_DAYS_PER_YEAR = 252
+
+DEFAULT_PARAMS = {
+    "lookback": 60,             # Momentum window in trading days (ignored when scores are supplied)
+    "top_k": 5,                 # Number of symbols held after each rebalance
+    "rebalance_every": 21,      # Trading days between rebalances
+    "max_weight": 0.4,          # Cap on any single position, mirrors ReasoningAgent's 40% limit
+    "weighting": "equal",       # 'equal' or 'score'
+    "transaction_cost": 0.001,  # Fraction of traded notional
+    "initial_cash": 10000.0
+}
+
+
+def parameter_grid(**options) -> List[Dict]:
+    """Expand lists of parameter values into a list of strategy variants."""
+    keys = list(options.keys())
+    values = [v if isinstance(v, (list, tuple)) else [v] for v in options.values()]
+    return [dict(zip(keys, combo)) for combo in itertools.product(*values)]
+
+
+def scores_from_recommendations(dates: List, symbols: List[str], recommendations: List[Dict]) -> np.ndarray:
+    """
+    Turn recorded agent advice into a (dates x symbols) score matrix.
+    Each recommendation needs 'date', 'Symbol', 'Action' and 'Score'; the latest advice for a
+    symbol stays in force until the next one. Sell advice scores 0 so the symbol is dropped.
+    """
+    index = {symbol: i for i, symbol in enumerate(symbols)}
+    date_index = {d: i for i, d in enumerate(dates)}
+    scores = np.full((len(dates), len(symbols)), np.nan)
+    for rec in sorted(recommendations, key=lambda r: r["date"]):
+        symbol = str(rec.get("Symbol", "")).upper()
+        if symbol not in index or rec["date"] not in date_index:
+            continue
+        score = 0.0 if str(rec.get("Action", "")).lower() == "sell" else float(rec.get("Score", 0))
+        scores[date_index[rec["date"]], index[symbol]] = score
+    return _forward_fill(scores)
+
+
+def _forward_fill(matrix: np.ndarray) -> np.ndarray:
+    """Forward-fill NaNs down each column."""
+    valid = ~np.isnan(matrix)
+    idx = np.where(valid, np.arange(matrix.shape[0])[:, None], 0)
+    np.maximum.accumulate(idx, axis=0, out=idx)
+    filled = matrix[idx, np.arange(matrix.shape[1])]
+    filled[~np.maximum.accumulate(valid, axis=0)] = np.nan
+    return filled
+
+
+def _momentum(prices: np.ndarray, lookback: int) -> np.ndarray:
+    """Trailing return over `lookback` days for every date at once."""
+    signal = np.full(prices.shape, np.nan)
+    if 0 < lookback < prices.shape[0]:
+        with np.errstate(divide="ignore", invalid="ignore"):
+            signal[lookback:] = prices[lookback:] / prices[:-lookback] - 1.0
+    signal[~np.isfinite(signal)] = np.nan
+    return signal
+
+
+def _target_weights(signal: np.ndarray, top_k: np.ndarray, max_weight: np.ndarray, by_score: np.ndarray) -> np.ndarray:
+    """Select the top_k symbols per variant and size them, vectorized over variants."""
+    finite = np.isfinite(signal)
+    ranked = np.where(finite, signal, -np.inf)
+    order = np.argsort(-ranked, axis=1, kind="stable")
+    ranks = np.empty_like(order)
+    np.put_along_axis(ranks, order, np.arange(signal.shape[1])[None, :], axis=1)
+    selected = finite & (ranks < top_k[:, None])
+
+    equal = selected.astype(float)
+    counts = equal.sum(axis=1, keepdims=True)
+    equal = np.divide(equal, counts, out=np.zeros_like(equal), where=counts > 0)
+
+    positive = np.where(selected, np.clip(np.nan_to_num(signal), 0.0, None), 0.0)
+    totals = positive.sum(axis=1, keepdims=True)
+    scored = np.divide(positive, totals, out=equal.copy(), where=totals > 0)
+
+    weights = np.where(by_score[:, None], scored, equal)
+    return np.minimum(weights, max_weight[:, None])
+
+
+def _simulate(prices: np.ndarray, signals: np.ndarray, variants: List[Dict], signal_index: np.ndarray,
+              start: np.ndarray, return_curves: bool) -> List[Dict]:
+    """
+    Replay a batch of variants over the full price history.
+    State is held as (variants x symbols) arrays, so each rebalance day costs a handful of
+    array operations no matter how many variants are in the batch.
+    """
+    n_days, n_symbols = prices.shape
+    n_variants = len(variants)
+    every = np.array([int(v["rebalance_every"]) for v in variants])
+    top_k = np.array([int(v["top_k"]) for v in variants])
+    max_weight = np.array([float(v["max_weight"]) for v in variants])
+    by_score = np.array([v["weighting"] == "score" for v in variants])
+    cost = np.array([float(v["transaction_cost"]) for v in variants])
+    initial = np.array([float(v["initial_cash"]) for v in variants])
+
+    # Rebalance calendar for every variant, computed across all dates at once
+    days = np.arange(n_days)
+    offsets = days[None, :] - start[:, None]
+    schedule = (offsets >= 0) & (offsets % every[:, None] == 0)
+    rebalance_days = np.flatnonzero(schedule.any(axis=0))
+
+    cash = initial.copy()
+    quantity = np.zeros((n_variants, n_symbols))
+    cost_basis = np.zeros((n_variants, n_symbols))
+    realized = np.zeros(n_variants)
+    turnover = np.zeros(n_variants)
+    trade_count = np.zeros(n_variants, dtype=int)
+    equity = np.empty((n_variants, n_days))
+    marks = np.nan_to_num(prices)
+
+    next_rebalance = 0
+    for t in range(n_days):
+        price = marks[t]
+        if next_rebalance < len(rebalance_days) and rebalance_days[next_rebalance] == t:
+            next_rebalance += 1
+            active = np.flatnonzero(schedule[:, t])
+            tradable = price > 0
+            value = cash[active] + quantity[active] @ price
+            weights = _target_weights(signals[signal_index[active], t], top_k[active], max_weight[active], by_score[active])
+            budget = weights * (value * (1.0 - cost[active]))[:, None]
+            with np.errstate(divide="ignore", invalid="ignore"):
+                # Fractional shares rounded down to 2 decimals, as in ReasoningAgent
+                target = np.floor(np.where(tradable, budget / price, 0.0) * 100) / 100
+            held = quantity[active]
+            target = np.where(tradable, target, held)
+            delta = target - held
+            sold = np.clip(-delta, 0.0, None)
+            bought = np.clip(delta, 0.0, None)
+            # Buys are paid from cash plus sale proceeds, after the costs of both legs; like add_trade,
+            # never spend more than the balance (scaled down and rounded to 2 decimals when short)
+            sale_value = (sold * price).sum(axis=1)
+            buy_value = (bought * price).sum(axis=1)
+            affordable = np.clip((cash[active] + sale_value * (1.0 - cost[active])) / (1.0 + cost[active]), 0.0, None)
+            scale = np.divide(affordable, buy_value, out=np.ones_like(buy_value), where=buy_value > affordable)
+            bought = np.where(scale[:, None] < 1.0, np.floor(bought * scale[:, None] * 100) / 100, bought)
+            target = held - sold + bought
+            delta = target - held
+
+            # Average-cost accounting, same as the portfolio view built from add_trade records
+            basis = cost_basis[active]
+            avg_price = np.divide(basis, held, out=np.zeros_like(basis), where=held > 0)
+            realized[active] += ((price - avg_price) * sold).sum(axis=1)
+            cost_basis[active] = basis - avg_price * sold + price * bought
+
+            notional = (np.abs(delta) * price).sum(axis=1)
+            cash[active] += (sold * price).sum(axis=1) - (bought * price).sum(axis=1) - notional * cost[active]
+            turnover[active] += np.divide(notional, value, out=np.zeros_like(notional), where=value > 0)
+            trade_count[active] += (np.abs(delta) > 0).sum(axis=1)
+            quantity[active] = target
+        equity[:, t] = cash + quantity @ price
+
+    return _summarize(equity, start, initial, cash, realized, turnover, trade_count, quantity, cost_basis, marks[-1],
+                      variants, return_curves)
+
+
+def _summarize(equity: np.ndarray, start: np.ndarray, initial: np.ndarray, cash: np.ndarray, realized: np.ndarray,
+               turnover: np.ndarray, trade_count: np.ndarray, quantity: np.ndarray, cost_basis: np.ndarray,
+               last_price: np.ndarray, variants: List[Dict], return_curves: bool) -> List[Dict]:
+    """Compute return, risk and turnover metrics for each variant from its equity curve."""
+    n_variants, n_days = equity.shape
+    live = np.arange(n_days)[None, :] >= start[:, None]
+    curve = np.where(live, equity, initial[:, None])
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        daily = np.where(live[:, 1:] & live[:, :-1], curve[:, 1:] / curve[:, :-1] - 1.0, np.nan)
+    peaks = np.maximum.accumulate(curve, axis=1)
+    drawdown = (curve - peaks) / np.where(peaks > 0, peaks, 1.0)
+
+    live_days = np.maximum(live.sum(axis=1), 1)
+    years = live_days / TRADING_DAYS_PER_YEAR
+    final_value = curve[:, -1]
+    total_return = final_value / initial - 1.0
+    with np.errstate(divide="ignore", invalid="ignore"):
+        cagr = np.where(final_value > 0, (final_value / initial) ** (1.0 / years) - 1.0, -1.0)
+        mean = np.nanmean(daily, axis=1)
+        vol = np.nanstd(daily, axis=1)
+    annual_vol = vol * math.sqrt(TRADING_DAYS_PER_YEAR)
+    sharpe = np.divide(mean * TRADING_DAYS_PER_YEAR, annual_vol, out=np.zeros_like(mean), where=annual_vol > 0)
+    unrealized = (quantity * last_price).sum(axis=1) - cost_basis.sum(axis=1)
+
+    results = []
+    for i, params in enumerate(variants):
+        result = {
+            "params": params,
+            "final_value": round(float(final_value[i]), 2),
+            "cash": round(float(cash[i]), 2),
+            "total_return": float(total_return[i]),
+            "cagr": float(cagr[i]),
+            "annual_volatility": float(np.nan_to_num(annual_vol[i])),
+            "sharpe": float(np.nan_to_num(sharpe[i])),
+            "max_drawdown": float(drawdown[i].min()),
+            "turnover": float(turnover[i] / years[i]),
+            "trades": int(trade_count[i]),
+            "realized_profit": round(float(realized[i]), 2),
+            "unrealized_profit": round(float(unrealized[i]), 2)
+        }
+        if return_curves:
+            result["equity_curve"] = curve[i].tolist()
+        results.append(result)
+    return results
+
+
+def _run_batch(args) -> List[Dict]:
+    """Process-pool entry point; must live at module level to be picklable."""
+    prices, scores, variants, return_curves = args
+    if scores is not None:
+        signals = scores[None, :, :]
+        signal_index = np.zeros(len(variants), dtype=int)
+        start = np.zeros(len(variants), dtype=int)
+    else:
+        lookbacks = sorted({int(v["lookback"]) for v in variants})
+        signals = np.stack([_momentum(prices, lb) for lb in lookbacks])
+        position = {lb: i for i, lb in enumerate(lookbacks)}
+        signal_index = np.array([position[int(v["lookback"])] for v in variants])
+        start = np.array([int(v["lookback"]) for v in variants])
+    return _simulate(prices, signals, variants, signal_index, start, return_curves)
+
+
+class BacktestEngine:
+    """Replays recommendation strategies over daily closes for the stock universe."""
+
+    def __init__(self, dates: List, symbols: List[str], prices: np.ndarray, scores: Optional[np.ndarray] = None):
+        prices = np.asarray(prices, dtype=float)
+        if prices.shape != (len(dates), len(symbols)):
+            raise ValueError(f"Price matrix shape {prices.shape} does not match {len(dates)} dates x {len(symbols)} symbols")
+        if scores is not None and np.shape(scores) != prices.shape:
+            raise ValueError(f"Score matrix shape {np.shape(scores)} does not match price matrix {prices.shape}")
+        self.dates = list(dates)
+        self.symbols = [s.upper() for s in symbols]
+        self.prices = _forward_fill(prices)
+        self.scores = None if scores is None else np.asarray(scores, dtype=float)
+
+    @classmethod
+    def from_database(cls, symbols: List[str], years: int = 10) -> "BacktestEngine":
+        """Build an engine from the daily_prices table."""
+        dates, prices = load_price_history(symbols, years)
+        return cls(dates, symbols, prices)
+
+    def run(self, params: Optional[Dict] = None, return_curve: bool = True) -> Dict:
+        """Backtest a single strategy variant."""
+        return self.run_grid([params or {}], workers=1, return_curves=return_curve)[0]
+
+    def run_grid(self, variants: List[Dict], workers: Optional[int] = None, return_curves: bool = False) -> List[Dict]:
+        """
+        Backtest many strategy variants. Variants are split into one batch per worker process;
+        each batch is simulated with all of its variants side by side.
+        """
+        if not variants:
+            return []
+        full = [{**DEFAULT_PARAMS, **v} for v in variants]
+        for params in full:
+            if params["weighting"] not in ("equal", "score"):
+                raise ValueError(f"Invalid weighting: {params['weighting']}")
+            if int(params["rebalance_every"]) < 1 or int(params["top_k"]) < 1:
+                raise ValueError(f"Invalid variant: {params}")
+
+        workers = workers or os.cpu_count() or 1
+        workers = max(1, min(workers, len(full)))
+        started = time.perf_counter()
+        if workers == 1:
+            results = _run_batch((self.prices, self.scores, full, return_curves))
+        else:
+            size = math.ceil(len(full) / workers)
+            batches = [(self.prices, self.scores, full[i:i + size], return_curves) for i in range(0, len(full), size)]
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                results = [r for batch in pool.map(_run_batch, batches) for r in batch]
+        logger.info(f"Backtested {len(full)} variants over {len(self.dates)} days x {len(self.symbols)} symbols "
+                    f"in {time.perf_counter() - started:.2f}s using {workers} worker(s)")
+        return results
+
+
+def load_price_history(symbols: List[str], years: int = 10):
+    """Load daily closes as (dates, prices) with prices shaped (dates x symbols)."""
+    from data.mysql_db import get_db_connection
+
+    since = datetime.now() - timedelta(days=int(years * 365.25))
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    try:
+        placeholders = ", ".join(["%s"] * len(symbols))
+        cursor.execute(f"""
+            SELECT price_date, symbol, close_price
+            FROM daily_prices
+            WHERE symbol IN ({placeholders}) AND price_date >= %s
+            ORDER BY price_date
+        """, (*symbols, since.date()))
+        rows = cursor.fetchall()
+    finally:
+        cursor.close()
+        conn.close()
+
+    dates = sorted({row[0] for row in rows})
+    date_index = {d: i for i, d in enumerate(dates)}
+    symbol_index = {s.upper(): i for i, s in enumerate(symbols)}
+    prices = np.full((len(dates), len(symbols)), np.nan)
+    for price_date, symbol, close in rows:
+        prices[date_index[price_date], symbol_index[symbol.upper()]] = float(close)
+    logger.info(f"Loaded {len(rows)} daily closes for {len(symbols)} symbols across {len(dates)} dates")
+    return dates, prices
+
+
+def history_years(dates: List) -> float:
+    """Span of the loaded history in years."""
+    if len(dates) < 2:
+        return 0.0
+    return (dates[-1] - dates[0]).days / 365.25
+
+
+def backfill_price_history(symbols: List[str], directory: str) -> Dict[str, int]:
+    """
+    Load daily closes from `{directory}/{SYMBOL}.csv` files (Date plus Adj Close or Close columns, as
+    exported by most market data sites) into daily_prices. Existing days are overwritten.
+    Returns rows written per symbol; symbols without a file are skipped.
+    """
+    from data.mysql_db import get_db_connection
+
+    written = {}
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    try:
+        for symbol in symbols:
+            path = os.path.join(directory, f"{symbol.upper()}.csv")
+            if not os.path.exists(path):
+                logger.warning(f"No price history file for {symbol} at {path}")
+                continue
+            rows = []
+            with open(path, newline="", encoding="utf-8") as f:
+                for row in csv.DictReader(f):
+                    close = row.get("Adj Close") or row.get("Close") or row.get("close")
+                    day = row.get("Date") or row.get("date")
+                    try:
+                        price_date = datetime.strptime(day[:10], "%Y-%m-%d").date()
+                        close = float(close)
+                    except (TypeError, ValueError):
+                        continue
+                    if close > 0:
+                        rows.append((symbol.upper(), price_date, close, close))
+            cursor.executemany("""
+                INSERT INTO daily_prices (symbol, price_date, close_price)
+                VALUES (%s, %s, %s)
+                ON DUPLICATE KEY UPDATE close_price = %s
+            """, rows)
+            conn.commit()
+            written[symbol.upper()] = len(rows)
+            logger.info(f"Backfilled {len(rows)} daily closes for {symbol} from {path}")
+    finally:
+        cursor.close()
+        conn.close()
+    return written
@@ -0,0 +1,248 @@
+from typing import Dict, List, Optional
+from utils.logger import logger
+import math
+import os
+import threading
+import numpy as np
+
+TRADING_DAYS_PER_YEAR = 252
+# Set COVARIANCE_SEED_HISTORY=0 to start universe models empty instead of reading daily_prices (e.g. offline)
+SEED_FROM_HISTORY = os.getenv("COVARIANCE_SEED_HISTORY", "1") != "0"
+
+
+class RollingCovariance:
+    """
+    Rolling covariance and correlation of daily returns across a fixed symbol universe.
+    Each new bar updates running sums in O(symbols^2) instead of recomputing the window.
+    """
+
+    def __init__(self, symbols: List[str], window: int = 60):
+        if window < 2:
+            raise ValueError(f"Window must be at least 2, got {window}")
+        self.symbols = [s.upper() for s in symbols]
+        self.index = {s: i for i, s in enumerate(self.symbols)}
+        self.window = window
+        n = len(self.symbols)
+        self._returns = np.zeros((window, n))
+        self._sum = np.zeros(n)
+        self._cross = np.zeros((n, n))
+        self._count = 0
+        self._pos = 0
+        self._updates_since_rebuild = 0
+        self._last_prices = np.full(n, np.nan)
+        self._prev_prices = self._last_prices
+        self._last_row = None
+        self._evicted = None
+        self._pushed_return = False
+        self._last_bar = None
+        self._cov = None
+        self._corr = None
+        self._lock = threading.Lock()
+
+    @property
+    def observations(self) -> int:
+        return self._count
+
+    def seed(self, prices: np.ndarray, last_bar=None):
+        """Warm up from a (dates x symbols) matrix of closes, oldest first."""
+        prices = np.asarray(prices, dtype=float)
+        with self._lock:
+            for row in prices[-(self.window + 1):]:
+                self._push_prices(row)
+            if last_bar is not None:
+                self._last_bar = last_bar
+
+    def on_bar(self, bar_key, prices: Dict[str, float]) -> bool:
+        """
+        Feed one bar of prices keyed by symbol. A bar with the same key as the last one (e.g. a later
+        intraday snapshot for the same date) replaces it, so the latest snapshot stands as that day's
+        close; bars with an earlier key are ignored.
+        """
+        row = np.full(len(self.symbols), np.nan)
+        for symbol, price in prices.items():
+            i = self.index.get(symbol.upper())
+            if i is not None and price and price > 0:
+                row[i] = float(price)
+        with self._lock:
+            if self._last_bar is not None and bar_key < self._last_bar:
+                return False
+            if self._last_bar is not None and bar_key == self._last_bar:
+                if np.array_equal(row, self._last_row, equal_nan=True):
+                    return False
+                self._undo_last_push()
+            self._push_prices(row)
+            self._last_bar = bar_key
+            return True
+
+    def on_snapshot(self, bar_key, stock_data: Dict[str, Dict]) -> bool:
+        """Feed a fetch_stock_prices() snapshot as a bar."""
+        return self.on_bar(bar_key, {s: d.get("current_price", 0.0) for s, d in stock_data.items()})
+
+    def _push_prices(self, row: np.ndarray):
+        """Append a bar of closes; the caller holds the lock."""
+        previous = self._last_prices
+        self._prev_prices = previous
+        self._last_row = row
+        self._last_prices = np.where(np.isfinite(row), row, previous)
+        self._evicted = None
+        self._pushed_return = False
+        if not np.isfinite(previous).any():
+            return
+        with np.errstate(divide="ignore", invalid="ignore"):
+            returns = row / previous - 1.0
+        # Symbols without a price on either bar contribute a flat return
+        self._add_returns(np.where(np.isfinite(returns), returns, 0.0))
+        self._pushed_return = True
+
+    def _undo_last_push(self):
+        """Take back the most recent bar, restoring any return it pushed out of the window."""
+        if self._pushed_return:
+            self._pos = (self._pos - 1) % self.window
+            r = self._returns[self._pos]
+            self._sum -= r
+            self._cross -= np.outer(r, r)
+            if self._evicted is not None:
+                self._returns[self._pos] = self._evicted
+                self._sum += self._evicted
+                self._cross += np.outer(self._evicted, self._evicted)
+            else:
+                self._returns[self._pos] = 0.0
+                self._count -= 1
+            self._cov = None
+            self._corr = None
+        self._last_prices = self._prev_prices
+        self._pushed_return = False
+
+    def _add_returns(self, r: np.ndarray):
+        if self._count == self.window:
+            old = self._returns[self._pos]
+            self._evicted = old.copy()
+            self._sum -= old
+            self._cross -= np.outer(old, old)
+        else:
+            self._count += 1
+        self._returns[self._pos] = r
+        self._sum += r
+        self._cross += np.outer(r, r)
+        self._pos = (self._pos + 1) % self.window
+        self._cov = None
+        self._corr = None
+
+        # Periodically rebuild the sums from the buffer to stop floating-point drift
+        self._updates_since_rebuild += 1
+        if self._updates_since_rebuild >= self.window * 10:
+            live = self._returns[:self._count]
+            self._sum = live.sum(axis=0)
+            self._cross = live.T @ live
+            self._updates_since_rebuild = 0
+
+    def covariance_matrix(self) -> np.ndarray:
+        """Sample covariance of daily returns (symbols x symbols)."""
+        with self._lock:
+            if self._cov is None:
+                n = self._count
+                if n < 2:
+                    self._cov = np.full((len(self.symbols), len(self.symbols)), np.nan)
+                else:
+                    mean = self._sum / n
+                    self._cov = (self._cross - n * np.outer(mean, mean)) / (n - 1)
+            return self._cov
+
+    def correlation_matrix(self) -> np.ndarray:
+        """Correlation of daily returns (symbols x symbols)."""
+        cov = self.covariance_matrix()
+        with self._lock:
+            if self._corr is None:
+                std = np.sqrt(np.clip(np.diag(cov), 0.0, None))
+                with np.errstate(divide="ignore", invalid="ignore"):
+                    corr = cov / np.outer(std, std)
+                corr[~np.isfinite(corr)] = 0.0
+                np.fill_diagonal(corr, 1.0)
+                self._corr = np.clip(corr, -1.0, 1.0)
+            return self._corr
+
+    def covariance(self, a: str, b: str) -> Optional[float]:
+        value = self.covariance_matrix()[self.index[a.upper()], self.index[b.upper()]]
+        return None if np.isnan(value) else float(value)
+
+    def correlation(self, a: str, b: str) -> Optional[float]:
+        if self._count < 2:
+            return None
+        return float(self.correlation_matrix()[self.index[a.upper()], self.index[b.upper()]])
+
+    def volatility(self, symbol: str) -> Optional[float]:
+        """Annualized volatility of daily returns."""
+        variance = self.covariance(symbol, symbol)
+        return None if variance is None else math.sqrt(max(variance, 0.0) * TRADING_DAYS_PER_YEAR)
+
+    def submatrix(self, symbols: List[str], annualize: bool = False) -> np.ndarray:
+        """Covariance restricted to `symbols`, in the given order."""
+        idx = [self.index[s.upper()] for s in symbols]
+        cov = self.covariance_matrix()[np.ix_(idx, idx)]
+        return cov * TRADING_DAYS_PER_YEAR if annualize else cov
+
+    def average_correlation(self, symbol: str, others: Optional[List[str]] = None) -> Optional[float]:
+        """Mean correlation of `symbol` with `others` (defaults to the rest of the universe)."""
+        if self._count < 2:
+            return None
+        others = [s for s in (others or self.symbols) if s.upper() != symbol.upper() and s.upper() in self.index]
+        if not others:
+            return None
+        row = self.correlation_matrix()[self.index[symbol.upper()]]
+        return float(np.mean([row[self.index[s.upper()]] for s in others]))
+
+    def most_correlated(self, symbol: str, limit: int = 3) -> List[tuple]:
+        """The `limit` symbols most correlated with `symbol`, as (symbol, correlation) pairs."""
+        if self._count < 2:
+            return []
+        i = self.index[symbol.upper()]
+        row = self.correlation_matrix()[i]
+        order = [j for j in np.argsort(-row) if j != i][:limit]
+        return [(self.symbols[j], float(row[j])) for j in order]
+
+    def portfolio_volatility(self, weights: Dict[str, float]) -> Optional[float]:
+        """Annualized volatility of a portfolio given symbol -> weight."""
+        if self._count < 2 or not weights:
+            return None
+        symbols = [s for s in weights if s.upper() in self.index]
+        w = np.array([weights[s] for s in symbols], dtype=float)
+        variance = float(w @ self.submatrix(symbols) @ w)
+        return math.sqrt(max(variance, 0.0) * TRADING_DAYS_PER_YEAR)
+
+    def describe(self, symbol: str, holdings: Optional[List[str]] = None) -> str:
+        """One-paragraph risk summary for prompts."""
+        symbol = symbol.upper()
+        if symbol not in self.index or self._count < 2:
+            return f"Not enough price history to compute correlation metrics for {symbol}."
+        parts = [f"{symbol} annualized volatility {self.volatility(symbol):.1%} over {self._count} daily returns"]
+        parts.append(f"average correlation with the stock universe {self.average_correlation(symbol):.2f}")
+        peers = ", ".join(f"{s} {c:.2f}" for s, c in self.most_correlated(symbol))
+        if peers:
+            parts.append(f"most correlated: {peers}")
+        held = [h for h in (holdings or []) if h.upper() in self.index and h.upper() != symbol]
+        if held:
+            parts.append(f"average correlation with current holdings {self.average_correlation(symbol, held):.2f}")
+        return "; ".join(parts) + "."
+
+
+_models: Dict[tuple, RollingCovariance] = {}
+_models_lock = threading.Lock()
+
+
+def get_universe_risk(symbols: List[str], window: int = 60) -> RollingCovariance:
+    """Process-wide rolling covariance for a universe, seeded from daily_prices on first use."""
+    key = (tuple(s.upper() for s in symbols), window)
+    with _models_lock:
+        model = _models.get(key)
+        if model is None:
+            model = RollingCovariance(symbols, window)
+            if SEED_FROM_HISTORY:
+                try:
+                    from analytics.backtest import load_price_history
+                    dates, prices = load_price_history(symbols, years=1)
+                    model.seed(prices, last_bar=dates[-1] if dates else None)
+                    logger.info(f"Seeded rolling covariance with {model.observations} daily returns")
+                except Exception as e:
+                    logger.error(f"Failed to seed rolling covariance from price history: {str(e)}")
+            _models[key] = model
+        return model
@@ -0,0 +1,139 @@
+from typing import Dict, List, Optional
+from utils.logger import logger
+import math
+import time
+import numpy as np
+
+# Risk aversion used by the mean-variance objective for each risk appetite
+RISK_AVERSION = {"low": 8.0, "medium": 4.0, "high": 2.0}
+# Annualized volatility assumed for symbols without enough price history
+DEFAULT_VOLATILITY = 0.30
+# Expected annual return implied by a perfect score of 100
+MAX_EXPECTED_RETURN = 0.20
+
+
+def _project_capped_simplex(v: np.ndarray, cap: float, total: float) -> np.ndarray:
+    """Euclidean projection onto {0 <= w <= cap, sum(w) = total}."""
+    lo, hi = v.min() - cap, v.max()
+    for _ in range(60):
+        tau = (lo + hi) / 2
+        if np.clip(v - tau, 0.0, cap).sum() > total:
+            lo = tau
+        else:
+            hi = tau
+    return np.clip(v - hi, 0.0, cap)
+
+
+class PositionSizer:
+    """
+    Turns recommendation scores and a return covariance into budget-respecting share quantities.
+    Supports long-only mean-variance ('mean_variance') and score-tilted risk parity ('risk_parity').
+    """
+
+    def __init__(self, method: str = "mean_variance", max_weight: float = 0.4, risk_aversion: float = 4.0):
+        if method not in ("mean_variance", "risk_parity"):
+            raise ValueError(f"Invalid sizing method: {method}")
+        if not 0 < max_weight <= 1:
+            raise ValueError(f"max_weight must be in (0, 1], got {max_weight}")
+        self.method = method
+        self.max_weight = max_weight
+        self.risk_aversion = risk_aversion
+
+    @classmethod
+    def for_preferences(cls, preferences: Dict, method: str = "mean_variance", max_weight: float = 0.4) -> "PositionSizer":
+        risk = str(preferences.get("risk_appetite", "medium")).lower()
+        return cls(method=method, max_weight=max_weight, risk_aversion=RISK_AVERSION.get(risk, 4.0))
+
+    def weights(self, scores: np.ndarray, cov: np.ndarray) -> np.ndarray:
+        """Portfolio weights summing to min(1, n * max_weight)."""
+        scores = np.clip(np.asarray(scores, dtype=float), 0.0, 100.0)
+        n = len(scores)
+        if n == 0:
+            return np.zeros(0)
+        cov = np.asarray(cov, dtype=float) + np.eye(n) * 1e-6
+        total = min(1.0, n * self.max_weight)
+        if self.method == "risk_parity":
+            return self._risk_parity(scores, cov, total)
+        return self._mean_variance(scores, cov, total)
+
+    def _mean_variance(self, scores: np.ndarray, cov: np.ndarray, total: float) -> np.ndarray:
+        # Maximize mu.w - (lambda / 2) w'Cw over the capped simplex by projected gradient ascent
+        mu = scores / 100.0 * MAX_EXPECTED_RETURN
+        step = 1.0 / (self.risk_aversion * np.linalg.eigvalsh(cov).max())
+        w = np.full(len(scores), total / len(scores))
+        for _ in range(500):
+            updated = _project_capped_simplex(w + step * (mu - self.risk_aversion * cov @ w), self.max_weight, total)
+            if np.abs(updated - w).max() < 1e-9:
+                w = updated
+                break
+            w = updated
+        return w
+
+    def _risk_parity(self, scores: np.ndarray, cov: np.ndarray, total: float) -> np.ndarray:
+        # Risk budgets proportional to score; multiplicative updates toward equal budget-weighted contributions
+        budgets = np.where(scores > 0, scores, 1.0)
+        budgets = budgets / budgets.sum()
+        w = budgets / np.sqrt(np.diag(cov))
+        w /= w.sum()
+        for _ in range(200):
+            contribution = w * (cov @ w)
+            contribution /= contribution.sum()
+            updated = w * np.sqrt(budgets / np.maximum(contribution, 1e-12))
+            updated /= updated.sum()
+            if np.abs(updated - w).max() < 1e-9:
+                w = updated
+                break
+            w = updated
+        return _project_capped_simplex(w * total, self.max_weight, total)
+
+    def allocate(self, symbols: List[str], scores: List[float], prices: List[float], budget: float,
+                 cov: Optional[np.ndarray] = None) -> Dict[str, Dict]:
+        """
+        Size positions for `symbols` within `budget`.
+        `cov` is an annualized covariance aligned with `symbols`; NaN entries fall back to
+        DEFAULT_VOLATILITY with zero correlation. Quantities are rounded down to 2 decimals.
+        """
+        started = time.perf_counter()
+        prices = np.asarray(prices, dtype=float)
+        tradable = prices > 0
+        symbols = [s for s, ok in zip(symbols, tradable) if ok]
+        scores = np.asarray(scores, dtype=float)[tradable]
+        prices = prices[tradable]
+        n = len(symbols)
+        if n == 0 or budget <= 0:
+            return {}
+
+        fallback = np.eye(n) * DEFAULT_VOLATILITY ** 2
+        if cov is None:
+            cov = fallback
+        else:
+            cov = np.asarray(cov, dtype=float)[np.ix_(tradable, tradable)]
+            cov = np.where(np.isfinite(cov), cov, fallback)
+
+        weights = self.weights(scores, cov)
+        quantities = np.floor(weights * budget / prices * 100) / 100
+        costs = quantities * prices
+        volatility = math.sqrt(max(float(weights @ cov @ weights), 0.0))
+        logger.info(f"Sized {n} positions with {self.method} in {(time.perf_counter() - started) * 1000:.2f}ms: "
+                    f"${costs.sum():.2f} of ${budget:.2f}, expected volatility {volatility:.1%}")
+        return {
+            symbol: {
+                "weight": float(weights[i]),
+                "quantity": float(quantities[i]),
+                "total_cost": round(float(costs[i]), 2),
+                "price": float(prices[i])
+            }
+            for i, symbol in enumerate(symbols)
+        }
+
+
+def universe_covariance(symbols: List[str], risk_model) -> Optional[np.ndarray]:
+    """Annualized covariance for `symbols` from a RollingCovariance, NaN where a symbol is unknown."""
+    if risk_model is None or risk_model.observations < 2:
+        return None
+    n = len(symbols)
+    cov = np.full((n, n), np.nan)
+    known = [i for i, s in enumerate(symbols) if s.upper() in risk_model.index]
+    if known:
+        cov[np.ix_(known, known)] = risk_model.submatrix([symbols[i] for i in known], annualize=True)
+    return cov
@@ -0,0 +1,180 @@
+from utils.disk_cache import CACHE_DIR
+from utils.logger import logger
+from typing import Dict, List, Optional, Tuple
+import json
+import os
+import re
+import threading
+import time
+import numpy as np
+
+# Same cut-offs the LLM prompt uses: Positive >= 0.3, Negative <= -0.3
+POSITIVE_THRESHOLD = 0.3
+NEGATIVE_THRESHOLD = -0.3
+# Normalizes a headline's summed weights into (-1, 1), as in VADER
+NORMALIZATION_ALPHA = 4.0
+# LLM labels recorded for calibrating the lexicon against
+LABEL_LOG = os.path.join(CACHE_DIR, "sentiment_labels.jsonl")
+
+# Finance-tuned term weights, roughly -3 (very negative) to +3 (very positive)
+FINANCE_LEXICON = {
+    # Results and guidance
+    "beat": 2.0, "beats": 2.0, "tops": 1.5, "topped": 1.5, "exceeds": 1.8, "exceeded": 1.8,
+    "miss": -2.0, "misses": -2.0, "missed": -2.0, "shortfall": -2.0, "disappointing": -2.2, "disappoints": -2.2,
+    "record": 1.5, "profit": 1.0, "profits": 1.0, "profitable": 1.5, "loss": -1.5, "losses": -1.5,
+    "raises": 1.2, "raised": 1.2, "boosts": 1.5, "boosted": 1.5, "lifts": 1.2, "hikes": 0.8,
+    "cuts": -1.2, "cut": -1.2, "slashes": -2.0, "slashed": -2.0, "lowers": -1.2, "lowered": -1.2,
+    "guidance": 0.0, "outlook": 0.0, "warns": -2.0, "warning": -1.8, "warned": -2.0,
+    "growth": 1.2, "grows": 1.2, "expands": 1.2, "expansion": 1.0, "accelerates": 1.5,
+    "decline": -1.5, "declines": -1.5, "declined": -1.5, "slowdown": -1.5, "slows": -1.2, "shrinks": -1.5,
+    "strong": 1.5, "stronger": 1.5, "robust": 1.5, "solid": 1.0, "weak": -1.5, "weaker": -1.5, "weakness": -1.5,
+    # Price action
+    "surge": 2.2, "surges": 2.2, "surged": 2.2, "soar": 2.5, "soars": 2.5, "soared": 2.5, "jump": 1.8,
+    "jumps": 1.8, "jumped": 1.8, "rally": 1.8, "rallies": 1.8, "gain": 1.2, "gains": 1.2, "rises": 1.0,
+    "rise": 1.0, "rose": 1.0, "climbs": 1.2, "high": 0.5, "highs": 1.0, "rebound": 1.2, "rebounds": 1.2,
+    "plunge": -2.5, "plunges": -2.5, "plunged": -2.5, "tumble": -2.2, "tumbles": -2.2, "slump": -2.0,
+    "slumps": -2.0, "sinks": -1.8, "sink": -1.8, "drop": -1.5, "drops": -1.5, "dropped": -1.5, "falls": -1.2,
+    "fall": -1.2, "fell": -1.2, "slide": -1.2, "slides": -1.2, "selloff": -2.0, "crash": -3.0, "crashes": -3.0,
+    "lows": -1.0, "volatile": -0.8, "volatility": -0.5,
+    # Analysts
+    "upgrade": 2.0, "upgrades": 2.0, "upgraded": 2.0, "downgrade": -2.0, "downgrades": -2.0, "downgraded": -2.0,
+    "outperform": 1.5, "overweight": 1.2, "buy": 0.8, "bullish": 2.0, "underperform": -1.5,
+    "underweight": -1.2, "sell": -0.8, "bearish": -2.0,
+    # Corporate events
+    "approval": 1.8, "approved": 1.8, "approves": 1.8, "partnership": 1.0, "deal": 0.6, "wins": 1.5,
+    "win": 1.2, "launch": 0.8, "launches": 0.8, "breakthrough": 2.0, "innovation": 1.0, "dividend": 0.8,
+    "buyback": 1.2, "repurchase": 1.0, "acquire": 0.3, "acquisition": 0.3,
+    "lawsuit": -1.8, "sued": -1.8, "sues": -1.2, "probe": -1.8, "investigation": -1.8, "fine": -1.5,
+    "fined": -1.8, "penalty": -1.8, "recall": -2.0, "recalls": -2.0, "layoffs": -1.5, "layoff": -1.5,
+    "fraud": -3.0, "scandal": -2.5, "bankruptcy": -3.0, "default": -2.5, "delay": -1.2, "delays": -1.2,
+    "delayed": -1.2, "halts": -1.5, "halted": -1.5, "ban": -1.5, "banned": -1.8, "tariff": -1.0,
+    "tariffs": -1.0, "antitrust": -1.2, "breach": -2.0, "outage": -1.5, "resigns": -1.2, "strike": -1.0,
+    "risk": -0.6, "risks": -0.6, "concern": -1.0, "concerns": -1.0, "fears": -1.5, "uncertainty": -1.0,
+    "optimism": 1.5, "optimistic": 1.5, "confidence": 1.0, "momentum": 1.0, "upside": 1.2, "downside": -1.2
+}
+# Two-word phrases whose meaning differs from their parts; added on top of the unigram weights
+FINANCE_BIGRAMS = {
+    "beat estimates": 0.5, "above expectations": 2.0, "below expectations": -2.0, "price target": 0.0,
+    "all-time high": 1.5, "record high": 1.0, "52-week low": -1.5, "short seller": -1.5, "profit warning": -1.5,
+    "job cuts": -0.5, "rate cut": 2.0, "cost cuts": 1.5, "market share": 0.5, "free fall": -2.0
+}
+# Flip the sign of the next three terms ("not expected to rally")
+NEGATIONS = {"not", "no", "never", "without", "fails", "failed", "unable", "isn't", "wasn't", "won't", "can't"}
+_NEGATION_SPAN = 3
+_TOKEN = re.compile(r"[a-z0-9][a-z0-9'\-]*")
+
+
+def label_for_score(score: float) -> str:
+    if score >= POSITIVE_THRESHOLD:
+        return "Positive"
+    if score <= NEGATIVE_THRESHOLD:
+        return "Negative"
+    return "Neutral"
+
+
+class LexiconSentimentScorer:
+    """
+    Offline headline sentiment from a finance lexicon. A batch of headlines is tokenized once,
+    mapped to a flat weight array, negated and summed per headline with numpy, so scoring
+    costs microseconds per headline and needs no network.
+    """
+
+    def __init__(self, lexicon: Optional[Dict[str, float]] = None, bigrams: Optional[Dict[str, float]] = None,
+                 negations: Optional[set] = None):
+        self.lexicon = dict(FINANCE_LEXICON if lexicon is None else lexicon)
+        self.bigrams = dict(FINANCE_BIGRAMS if bigrams is None else bigrams)
+        self.negations = set(NEGATIONS if negations is None else negations)
+
+    def score_headlines(self, headlines: List[str]) -> Tuple[np.ndarray, np.ndarray]:
+        """Per-headline scores in (-1, 1) and the number of lexicon terms each headline matched."""
+        tokenized = [_TOKEN.findall(headline.lower()) for headline in headlines]
+        lengths = np.array([len(tokens) for tokens in tokenized], dtype=np.int64)
+        tokens = [token for headline_tokens in tokenized for token in headline_tokens]
+        if not tokens:
+            return np.zeros(len(headlines)), np.zeros(len(headlines), dtype=np.int64)
+
+        weights = np.array([self.lexicon.get(token, 0.0) for token in tokens])
+        # Bigram weight lands on the second word; pairs spanning two headlines are masked out below
+        pair_weights = np.array([self.bigrams.get(f"{a} {b}", 0.0) for a, b in zip(tokens, tokens[1:])] or [0.0])
+        negators = np.array([token in self.negations for token in tokens])
+
+        starts = np.concatenate(([0], np.cumsum(lengths)[:-1]))
+        headline_of = np.repeat(np.arange(len(headlines)), lengths)
+        if len(tokens) > 1:
+            same_headline = headline_of[1:] == headline_of[:-1]
+            weights[1:] += np.where(same_headline, pair_weights[:len(tokens) - 1], 0.0)
+
+        # A negator flips the following _NEGATION_SPAN terms within the same headline
+        flip = np.zeros(len(tokens), dtype=bool)
+        for offset in range(1, _NEGATION_SPAN + 1):
+            if len(tokens) > offset:
+                flip[offset:] |= negators[:-offset] & (headline_of[offset:] == headline_of[:-offset])
+        weights = np.where(flip, -weights, weights)
+
+        matched = (weights != 0).astype(np.int64)
+        nonempty = lengths > 0
+        sums = np.zeros(len(headlines))
+        hits = np.zeros(len(headlines), dtype=np.int64)
+        sums[nonempty] = np.add.reduceat(weights, starts[nonempty])
+        hits[nonempty] = np.add.reduceat(matched, starts[nonempty])
+        return sums / np.sqrt(sums * sums + NORMALIZATION_ALPHA), hits
+
+    def score_symbol(self, headlines: List[str]) -> Dict:
+        """
+        Sentiment label, mean score and confidence for one symbol's headlines. Confidence is the share
+        of headlines with lexicon hits, times how consistently they point one way, times the score's
+        distance from the nearest label threshold.
+        """
+        if not headlines:
+            return {"sentiment": "Neutral", "score": 0.0, "confidence": 0.0}
+        scores, hits = self.score_headlines(headlines)
+        score = float(scores.mean())
+        polar = scores[hits > 0]
+        coverage = len(polar) / len(headlines)
+        consistency = abs(polar.sum()) / np.abs(polar).sum() if np.abs(polar).sum() > 0 else 1.0
+        margin = min(abs(score - POSITIVE_THRESHOLD), abs(score - NEGATIVE_THRESHOLD)) / POSITIVE_THRESHOLD
+        confidence = coverage * float(consistency) * min(1.0, margin)
+        return {"sentiment": label_for_score(score), "score": round(score, 3), "confidence": round(confidence, 3)}
+
+
+_scorer: Optional[LexiconSentimentScorer] = None
+_log_lock = threading.Lock()
+
+
+def get_lexicon_scorer() -> LexiconSentimentScorer:
+    global _scorer
+    if _scorer is None:
+        _scorer = LexiconSentimentScorer()
+    return _scorer
+
+
+def record_llm_labels(headlines: Dict[str, List[str]], labels: Dict[str, str], path: str = LABEL_LOG):
+    """Append LLM-labelled headline sets to the calibration log (one JSON object per symbol)."""
+    rows = [
+        json.dumps({"symbol": symbol, "headlines": headlines[symbol], "label": label, "recorded": time.time()})
+        for symbol, label in labels.items() if symbol in headlines
+    ]
+    if not rows:
+        return
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with _log_lock, open(path, "a", encoding="utf-8") as f:
+            f.write("\n".join(rows) + "\n")
+    except OSError as e:
+        logger.warning(f"Could not record sentiment labels: {str(e)}")
+
+
+def load_llm_labels(path: str = LABEL_LOG) -> List[Dict]:
+    """Recorded LLM labels, skipping malformed lines."""
+    records = []
+    if not os.path.exists(path):
+        return records
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            if record.get("headlines") and record.get("label") in ("Positive", "Negative", "Neutral"):
+                records.append(record)
+    return records
@@ -13,7 +13,7 @@ import mysql.connector
 from scripts.fetch_stock_prices import fetch_stock_prices
 # from utils.config import FINNHUB_API_KEY, GNEWS_API_KEY
 from utils.logger import logger
-from agents import EducatorAgent, StrategistAgent, MarketAnalystAgent, ExecutorAgent, MonitorGuardrailAgent, run_workflow
+from agents import EducatorAgent, StrategistAgent, MarketAnalystAgent, ExecutorAgent, MonitorGuardrailAgent, get_job_queue, submit_workflow_job
 from auth.auth import sign_up, sign_in, get_user
 from gamification.leaderboard import update_leaderboard, get_leaderboard
 from gamification.virtual_currency import get_balance, add_trade, get_portfolio
@@ -374,6 +374,92 @@ def news_endpoint():
     news_data = fetch_news(symbol)
     st.json(news_data)
 
+# Render workflow progress as tokens arrive instead of waiting for the full result
+def pending_workflow_job(session_key: str):
+    """
+    (job id, preferences) of the job stored under `session_key` if that job still exists, else (None, None).
+    A job that expired or was pruned clears the key, so the page falls back to the form.
+    """
+    job_id = st.session_state.get(session_key)
+    if not job_id:
+        return None, None
+    job = get_job_queue().get(job_id)
+    preferences = (job or {}).get("payload", {}).get("preferences")
+    if preferences is None:
+        st.session_state.pop(session_key, None)
+        return None, None
+    return job_id, preferences
+
+def render_workflow_stream(preferences: dict, user_id: str, is_trade: bool = False, job_id: str = None) -> dict:
+    """
+    Run the workflow as a background job and render its progress. The job id is kept in session
+    state until its result has been shown, so a rerun or page switch reattaches instead of restarting.
+    """
+    session_key = "trade_job_id" if is_trade else "recommendation_job_id"
+    job_queue = get_job_queue()
+    if job_id is None:
+        job_id = submit_workflow_job(preferences, user_id, is_trade=is_trade)
+        st.session_state[session_key] = job_id
+    status_box = st.empty()
+    thinking_box = st.empty()
+    recommendations_box = st.empty()
+    status_box.info("Analyzing investment scenario...")
+    thinking_text = ""
+    partial_recommendations = []
+    analysis_chars = 0
+    seen = 0
+    result = None
+    while True:
+        job = job_queue.get(job_id)
+        events = job_queue.events(job_id, seen)
+        seen += len(events)
+        for event in events:
+            if event["type"] == "thinking":
+                thinking_text += event["text"]
+            elif event["type"] == "thoughts":
+                thinking_text = "\n\n".join(event["thoughts"])
+            elif event["type"] == "analysis":
+                analysis_chars += len(event["text"])
+            elif event["type"] == "recommendation":
+                partial_recommendations.append(event["recommendation"])
+            elif event["type"] == "status":
+                status_box.info(event["text"])
+        if job is None or job["status"] in ("done", "failed"):
+            if job is not None and job["status"] == "done":
+                result = job["result"]
+            elif job is not None:
+                logger.error(f"Workflow job {job_id} failed: {job['error']}")
+            break
+        if thinking_text:
+            thinking_html = thinking_text[-4000:].replace("\n", "<br>")
+            thinking_box.markdown(f"<div class='thought-bubble'>{thinking_html}</div>", unsafe_allow_html=True)
+        if analysis_chars and not partial_recommendations:
+            status_box.info(f"Generating recommendations... ({analysis_chars:,} characters received)")
+        if partial_recommendations:
+            status_box.info(f"Received {len(partial_recommendations)} recommendation(s), sizing positions...")
+            recommendations_box.table(pd.DataFrame([
+                {
+                    "Symbol": rec.get("Symbol"),
+                    "Company": rec.get("Company"),
+                    "Action": rec.get("Action"),
+                    "Price": f"${float(rec.get('CurrentPrice') or 0):.2f}",
+                    "Score": rec.get("Score")
+                }
+                for rec in partial_recommendations
+            ]))
+        # Poll rather than block on the job; tokens arrive far faster than the page needs to update
+        time.sleep(0.15)
+    st.session_state.pop(session_key, None)
+    status_box.empty()
+    thinking_box.empty()
+    recommendations_box.empty()
+    return result or {
+        "recommendations": [],
+        "market_insights": "Analysis failed: no result received",
+        "reasoning_steps": ["Error occurred during analysis"],
+        "thinking_process": []
+    }
+
 # Initialize session state
 if "authenticated" not in st.session_state:
     st.session_state.authenticated = False
@@ -606,19 +692,24 @@ else:
                 
                 submit_button = st.form_submit_button("Get Recommendations")
 
-            if submit_button:
-                if investment_amount <= 0:
+            # A job started before a rerun or page switch is picked up instead of lost
+            resume_job_id, resume_preferences = (None, None) if submit_button else pending_workflow_job("recommendation_job_id")
+            if submit_button or resume_job_id:
+                if submit_button and investment_amount <= 0:
                     st.error("Investment amount must be greater than zero.")
                     logger.error(f"Invalid investment amount: {investment_amount}")
                 else:
-                    preferences = {
-                        "risk_appetite": risk_appetite,
-                        "investment_goals": investment_goals,
-                        "time_horizon": time_horizon,
-                        "investment_amount": float(investment_amount),
-                        "investment_style": investment_style,
-                        "additional_details": additional_details
-                    }
+                    if resume_job_id:
+                        preferences = resume_preferences
+                    else:
+                        preferences = {
+                            "risk_appetite": risk_appetite,
+                            "investment_goals": investment_goals,
+                            "time_horizon": time_horizon,
+                            "investment_amount": float(investment_amount),
+                            "investment_style": investment_style,
+                            "additional_details": additional_details
+                        }
                     st.session_state.preferences = preferences
                     logger.info(f"Submitted preferences: {preferences}")
                     
@@ -630,15 +721,14 @@ else:
                         "Investment Amount": f"${preferences['investment_amount']:.2f}",
                         "Investment Style": preferences["investment_style"]
                     }
-                    if additional_details:
-                        prefs_display["Additional Details"] = additional_details
+                    if preferences.get("additional_details"):
+                        prefs_display["Additional Details"] = preferences["additional_details"]
                     st.table(pd.DataFrame([prefs_display]))
                     
                     st.info("Starting investment analysis...")
                     logger.info("Starting recommendation workflow")
                     
-                    with st.spinner("Analyzing investment scenario..."):
-                        result = run_workflow(preferences, st.session_state.user_id)
+                    result = render_workflow_stream(preferences, st.session_state.user_id, job_id=resume_job_id)
                     
                     if result["recommendations"]:
                         st.success("Analysis complete!")
@@ -922,24 +1012,27 @@ else:
                     )
                     submit_button = st.form_submit_button("Execute Agent-Based Trade")
 
-                if submit_button:
+                resume_job_id, resume_preferences = (None, None) if submit_button else pending_workflow_job("trade_job_id")
+                if submit_button or resume_job_id:
                     try:
-                        if investment_amount <= 0:
+                        if submit_button and investment_amount <= 0:
                             st.error("Investment amount must be greater than zero.")
                             logger.error(f"Invalid investment amount: {investment_amount}")
                         else:
-                            preferences = {
-                                "risk_appetite": risk_appetite,
-                                "investment_goals": investment_goals,
-                                "time_horizon": time_horizon,
-                                "investment_amount": float(investment_amount),
-                                "investment_style": investment_style,
-                                "additional_preferences": additional_preferences.strip() if additional_preferences else ""
-                            }
+                            if resume_job_id:
+                                preferences = resume_preferences
+                            else:
+                                preferences = {
+                                    "risk_appetite": risk_appetite,
+                                    "investment_goals": investment_goals,
+                                    "time_horizon": time_horizon,
+                                    "investment_amount": float(investment_amount),
+                                    "investment_style": investment_style,
+                                    "additional_preferences": additional_preferences.strip() if additional_preferences else ""
+                                }
                             logger.info(f"Agent-based trade preferences: {preferences}")
                             
-                            with st.spinner("Analyzing trade scenario..."):
-                                result = run_workflow(preferences, st.session_state.user_id, is_trade=True)
+                            result = render_workflow_stream(preferences, st.session_state.user_id, is_trade=True, job_id=resume_job_id)
                             
                             if result["recommendations"]:
                                 st.success("Analysis complete!")
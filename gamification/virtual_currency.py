@@ -119,4 +119,24 @@ def get_portfolio(user_id: str) -> list:
         return trades
     except Exception as e:
         logger.error(f"Failed to get portfolio for user {user_id}: {str(e)}")
-        return []
\ No newline at end of file
+        return []
+
+def get_holdings(user_id: str) -> dict:
+    """Net shares held per symbol, replaying trades with the same rules as the Portfolio page."""
+    holdings = {}
+    for trade in get_portfolio(user_id):
+        try:
+            amount = float(trade["amount"])
+            price = float(trade["price"])
+        except (TypeError, ValueError, decimal.InvalidOperation):
+            continue
+        if amount <= 0 or price <= 0:
+            continue
+        quantity = amount / price
+        symbol = trade["symbol"]
+        held = holdings.get(symbol, 0.0)
+        if trade["trade_type"] == "buy":
+            holdings[symbol] = held + quantity
+        elif held >= quantity:
+            holdings[symbol] = held - quantity
+    return {symbol: quantity for symbol, quantity in holdings.items() if quantity > 0}
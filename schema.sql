@@ -45,6 +45,14 @@ CREATE TABLE IF NOT EXISTS cash_flows (
     UNIQUE(cik, fiscal_date_ending)
 );
 
+-- Daily closing prices, one bar per symbol per trading day (used for backtesting)
+CREATE TABLE IF NOT EXISTS daily_prices (
+    symbol VARCHAR(10) NOT NULL,
+    price_date DATE NOT NULL,
+    close_price DECIMAL(12,4) NOT NULL,
+    PRIMARY KEY (symbol, price_date)
+);
+
 -- Sample data
 INSERT INTO stocks (cik, symbol, company_name, exchange) VALUES
 ('0000320193', 'AAPL', 'Apple Inc.', 'NASDAQ'),
@@ -0,0 +1,185 @@
+import argparse
+import json
+import random
+import re
+import time
+from typing import Dict
+
+from utils.json_extraction import extract_json
+
+
+def legacy_parse(response: str) -> Dict:
+    """The previous ReasoningAgent._parse_json_response, kept for comparison (logging removed)."""
+    try:
+        # First try direct JSON parsing
+        return json.loads(response)
+    except json.JSONDecodeError:
+        try:
+            # Clean up common issues in the response
+            cleaned_response = response
+
+            # Remove any markdown code block markers
+            cleaned_response = re.sub(r'```json\s*|\s*```', '', cleaned_response)
+
+            # Try to find the first complete JSON object
+            start_idx = cleaned_response.find('{')
+            if start_idx != -1:
+                # Track brackets to find matching end
+                stack = []
+                in_string = False
+                escape_char = False
+
+                for i in range(start_idx, len(cleaned_response)):
+                    char = cleaned_response[i]
+
+                    # Handle escape characters
+                    if char == '\\' and not escape_char:
+                        escape_char = True
+                        continue
+
+                    # Handle strings
+                    if char == '"' and not escape_char:
+                        in_string = not in_string
+
+                    # Track brackets only when not in a string
+                    if not in_string:
+                        if char == '{':
+                            stack.append(char)
+                        elif char == '}':
+                            if stack:
+                                stack.pop()
+                                # If we've found the matching end brace
+                                if not stack:
+                                    try:
+                                        json_str = cleaned_response[start_idx:i+1]
+                                        parsed = json.loads(json_str)
+                                        return parsed
+                                    except json.JSONDecodeError:
+                                        # Continue searching in case there are more JSON objects
+                                        continue
+
+                    escape_char = False
+
+            # If we haven't found a valid JSON object yet, try a more aggressive cleanup
+            # Remove all whitespace and newlines outside of strings
+            cleaned_response = re.sub(r'\s+(?=(?:[^"]*"[^"]*")*[^"]*$)', '', cleaned_response)
+
+            # Try one more time with the aggressively cleaned response
+            try:
+                start_idx = cleaned_response.find('{')
+                end_idx = cleaned_response.rfind('}')
+                if start_idx != -1 and end_idx != -1:
+                    json_str = cleaned_response[start_idx:end_idx + 1]
+                    return json.loads(json_str)
+            except:
+                pass
+
+            # If all else fails, create a basic structure
+            return {
+                "error": "Failed to parse response",
+                "raw_response": response,
+                "recommendations": [],
+                "insights": "Analysis failed to generate valid insights.",
+                "market_analysis": {},
+                "investment_strategy": {}
+            }
+        except Exception as e:
+            return {
+                "error": "Failed to parse response",
+                "raw_response": response,
+                "recommendations": [],
+                "insights": "Analysis failed to generate valid insights.",
+                "market_analysis": {},
+                "investment_strategy": {}
+            }
+
+
+def _preamble(size: int, rng: random.Random) -> str:
+    """Reasoning-model style monologue sprinkled with braces, brackets and quotes."""
+    fragments = [
+        "Let me think about the allocation {weights} for each symbol. ",
+        "The user wants \"growth\" so I'll favour [NVDA, MSFT] over value names. ",
+        "A 10% drawdown on $500 is $50, which is acceptable for medium risk. ",
+        "I should return {\"recommendations\": [...], \"insights\": ...} as the answer. ",
+        "Checking correlations: AAPL/MSFT ~0.7, so not both at full weight. "
+    ]
+    parts = []
+    length = 0
+    while length < size:
+        fragment = rng.choice(fragments)
+        parts.append(fragment)
+        length += len(fragment)
+    return "".join(parts)
+
+
+def _answer(rng: random.Random, trailing_comma: bool) -> str:
+    recommendations = [{
+        "Symbol": symbol,
+        "Company": f"{symbol} Inc.",
+        "Action": "Buy",
+        "Quantity": 0,
+        "CurrentPrice": round(rng.uniform(20, 900), 2),
+        "TotalCost": 0,
+        "Reason": "Strong cash flow and improving margins.",
+        "Caution": "Valuation is stretched.",
+        "NewsSentiment": "Positive",
+        "Score": rng.randint(40, 95)
+    } for symbol in ("NVDA", "MSFT", "AAPL")]
+    answer = json.dumps({"recommendations": recommendations, "insights": "Tech leadership continues."}, indent=2)
+    if trailing_comma:
+        answer = answer.replace("\n  ]", ",\n  ]")
+    return answer
+
+
+def make_response(size: int, trailing_comma: bool = False, tagged: bool = True, seed: int = 0) -> str:
+    """A response of roughly `size` bytes: a monologue (in <think> tags or as bare prose), then the JSON answer."""
+    rng = random.Random(seed)
+    answer = _answer(rng, trailing_comma)
+    preamble = _preamble(max(0, size - len(answer)), rng)
+    if tagged:
+        return f"<think>\n{preamble}\n</think>\n\n{answer}"
+    return f"{preamble}\n\n{answer}"
+
+
+CASES = [
+    ("think + valid JSON", {"trailing_comma": False, "tagged": True}),
+    ("think + trailing comma", {"trailing_comma": True, "tagged": True}),
+    ("prose + valid JSON", {"trailing_comma": False, "tagged": False})
+]
+
+
+def _time(fn, text: str, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn(text)
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def main():
+    """Compare the single-pass extractor with the previous parser on long reasoning-model responses."""
+    parser = argparse.ArgumentParser(description="Benchmark JSON extraction from LLM responses",
+                                     epilog="Run from the project root: python -m scripts.benchmark_json_extraction")
+    parser.add_argument("--sizes", default="10,25,50,100", help="Response sizes in KB")
+    parser.add_argument("--repeat", type=int, default=3, help="Timing repetitions (best is reported)")
+    parser.add_argument("--legacy-limit", type=int, default=100,
+                        help="Skip the previous parser above this size in KB (it is quadratic)")
+    args = parser.parse_args()
+
+    print(f"{'Case':<22} {'Size':>7} {'extract_json':>13} {'previous':>11} {'Speedup':>8}")
+    for size_kb in (int(s) for s in args.sizes.split(",")):
+        for case, options in CASES:
+            text = make_response(size_kb * 1024, **options)
+            result = extract_json(text, dict)
+            assert len(result["recommendations"]) == 3, "extractor returned the wrong object"
+            new = _time(lambda t: extract_json(t, dict), text, args.repeat)
+            if size_kb <= args.legacy_limit:
+                old = _time(legacy_parse, text, 1)
+                print(f"{case:<22} {size_kb:>5}KB {new * 1000:>11.2f}ms {old * 1000:>9.1f}ms {old / new:>7.0f}x")
+            else:
+                print(f"{case:<22} {size_kb:>5}KB {new * 1000:>11.2f}ms {'skipped':>11}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+import argparse
+import time
+
+from analytics.sentiment_lexicon import LABEL_LOG, get_lexicon_scorer, load_llm_labels
+
+LABELS = ["Positive", "Neutral", "Negative"]
+
+
+def main():
+    """Compare the offline lexicon scorer with LLM sentiment labels recorded by MarketAnalystAgent."""
+    parser = argparse.ArgumentParser(description="Calibrate the lexicon sentiment scorer against recorded LLM labels",
+                                     epilog="Run from the project root: python -m scripts.calibrate_sentiment")
+    parser.add_argument("--labels", default=LABEL_LOG, help="JSONL file of recorded LLM labels")
+    parser.add_argument("--thresholds", type=float, nargs="+", default=[0.0, 0.3, 0.5, 0.7, 0.9],
+                        help="Confidence thresholds to report coverage and agreement at")
+    args = parser.parse_args()
+
+    records = load_llm_labels(args.labels)
+    if not records:
+        print(f"No recorded LLM labels in {args.labels}. Run the app with SENTIMENT_MODE=llm (the default) to record some.")
+        return
+
+    scorer = get_lexicon_scorer()
+    headline_count = sum(len(record["headlines"]) for record in records)
+    started = time.perf_counter()
+    results = [scorer.score_symbol(record["headlines"]) for record in records]
+    elapsed = time.perf_counter() - started
+
+    print(f"Scored {len(records)} symbol headline sets ({headline_count} headlines) in {elapsed * 1000:.1f}ms "
+          f"({elapsed / headline_count * 1e6:.1f}us per headline)")
+
+    agree = sum(result["sentiment"] == record["label"] for result, record in zip(results, records))
+    print(f"Overall agreement with LLM labels: {agree / len(records):.1%}")
+
+    print("\nConfusion matrix (rows: LLM label, columns: lexicon label)")
+    print(f"{'':>10}" + "".join(f"{label:>10}" for label in LABELS))
+    for llm_label in LABELS:
+        row = [sum(1 for result, record in zip(results, records)
+                   if record["label"] == llm_label and result["sentiment"] == lexicon_label) for lexicon_label in LABELS]
+        print(f"{llm_label:>10}" + "".join(f"{count:>10}" for count in row))
+
+    # In hybrid mode, confident symbols are only recorded at SENTIMENT_AUDIT_RATE, so rows above the
+    # running threshold rest on that sample
+    print(f"\n{'MinConf':>8} {'Settled':>8} {'Agreement':>10}  (symbols the lexicon would settle in hybrid mode)")
+    for threshold in args.thresholds:
+        settled = [(result, record) for result, record in zip(results, records) if result["confidence"] >= threshold]
+        agreement = (sum(result["sentiment"] == record["label"] for result, record in settled) / len(settled)
+                     if settled else 0.0)
+        print(f"{threshold:>8.2f} {len(settled) / len(records):>8.1%} {agreement:>10.1%}")
+
+
+if __name__ == "__main__":
+    main()
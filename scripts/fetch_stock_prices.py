@@ -126,6 +126,13 @@ def update_stock_price_in_db(symbol: str, quote: dict):
             symbol, quote["o"], quote["pc"], quote["h"], quote["l"], quote["c"], datetime.now(timezone.utc), datetime.now(timezone.utc),
             quote["o"], quote["pc"], quote["h"], quote["l"], quote["c"], datetime.now(timezone.utc), datetime.now(timezone.utc)
         ))
+        # Keep today's bar in the daily history used by the backtest engine
+        if quote["c"] > 0:
+            cursor.execute("""
+                INSERT INTO daily_prices (symbol, price_date, close_price)
+                VALUES (%s, %s, %s)
+                ON DUPLICATE KEY UPDATE close_price = %s
+            """, (symbol, datetime.now(timezone.utc).date(), quote["c"], quote["c"]))
         conn.commit()
         logger.info(f"Updated price for {symbol} in DB: ${quote['c']:.2f}")
     except Error as e:
@@ -0,0 +1,132 @@
+import os
+
+# Offline defaults, set before the agents read them: no response or recommendation caches, checkpoints,
+# fundamentals/news fetches or MySQL reads (holdings, price history). Export any of these beforehand to override.
+os.environ.setdefault("LLM_CACHE_ENABLED", "0")
+os.environ.setdefault("RECOMMENDATION_CACHE_ENABLED", "0")
+os.environ.setdefault("WORKFLOW_CHECKPOINTS_ENABLED", "0")
+os.environ.setdefault("WORKFLOW_MARKET_DATA", "0")
+os.environ.setdefault("WORKFLOW_HOLDINGS", "0")
+os.environ.setdefault("COVARIANCE_SEED_HISTORY", "0")
+
+import argparse
+import itertools
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from agents.fake_llm import fake_llm_factory
+from agents.llm_registry import set_llm_factory
+from agents.rate_limiter import MODEL_RATE_LIMITS, DEFAULT_RATE_LIMIT, rate_limiter_stats
+from agents.structured_output import structured_output_stats
+from agents.telemetry import llm_telemetry_summary, export_llm_telemetry
+from agents.workflow import run_workflow, workflow_flight_stats
+from scripts.fetch_stock_prices import STOCK_LIST, price_cache
+from utils.logger import logger
+
+RISK_APPETITES = ["low", "medium", "high"]
+INVESTMENT_GOALS = ["retirement", "growth", "income"]
+TIME_HORIZONS = ["short", "medium", "long"]
+INVESTMENT_STYLES = ["value", "growth", "index"]
+# Limits applied to every model unless --rpm/--tpm are given: high enough that the limiter never waits,
+# so the run measures the workflow rather than Groq's free-tier quotas
+UNLIMITED_RPM = 1_000_000
+UNLIMITED_TPM = 1_000_000_000
+
+
+def seed_prices():
+    """Fill the price cache with a fixed synthetic snapshot so fetch_stock_prices stays offline."""
+    for i, symbol in enumerate(STOCK_LIST):
+        price = 50.0 + 23.0 * i
+        price_cache[f"price_{symbol}"] = {
+            "current_price": price, "high_price": price * 1.01, "low_price": price * 0.99, "previous_close": price * 0.995
+        }
+
+
+def requests_for(count, shared):
+    """
+    `count` workflow requests cycling through the form grid. Unless `shared`, each carries unique
+    free text so no two are coalesced into one in-flight analysis and every one runs in full.
+    """
+    grid = itertools.cycle(itertools.product(RISK_APPETITES, INVESTMENT_GOALS, TIME_HORIZONS, INVESTMENT_STYLES))
+    requests = []
+    for i, (risk, goals, horizon, style) in zip(range(count), grid):
+        requests.append({
+            "risk_appetite": risk, "investment_goals": goals, "time_horizon": horizon, "investment_style": style,
+            "investment_amount": float(500 + 250 * (i % 8)),
+            "additional_details": "" if shared else f"load test request {i}"
+        })
+    return requests
+
+
+def percentile(values, fraction):
+    return values[min(len(values) - 1, int(round(fraction * (len(values) - 1))))]
+
+
+def main():
+    """Measure run_workflow throughput and latency against the offline fake chat model."""
+    parser = argparse.ArgumentParser(description="Load test the recommendation workflow without network access",
+                                     epilog="Run from the project root: python -m scripts.load_test_workflow")
+    parser.add_argument("--requests", type=int, default=40, help="Workflow runs in total")
+    parser.add_argument("--concurrency", type=int, default=8, help="Workflow runs in flight at once")
+    parser.add_argument("--trade", action="store_true", help="Run trade workflows, which also validate each recommendation")
+    parser.add_argument("--shared", action="store_true",
+                        help="Let identical requests share in-flight analyses")
+    parser.add_argument("--latency-scale", type=float, default=1.0, help="Multiplier on the fake model latencies")
+    parser.add_argument("--jitter", type=float, default=0.35, help="Log-normal spread of time to first token")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Share of LLM calls that fail")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="Share of LLM calls answered with a 429")
+    parser.add_argument("--rpm", type=int, default=None,
+                        help="Requests/minute limit for every model (default: unlimited)")
+    parser.add_argument("--tpm", type=int, default=None,
+                        help="Tokens/minute limit for every model (default: unlimited)")
+    parser.add_argument("--seed", type=int, default=0, help="Seed for latency and failure sampling")
+    parser.add_argument("--telemetry-out", default=None, help="Append every LLM call record to this JSONL file")
+    args = parser.parse_args()
+
+    for limits in list(MODEL_RATE_LIMITS.values()) + [DEFAULT_RATE_LIMIT]:
+        limits["rpm"] = args.rpm or UNLIMITED_RPM
+        limits["tpm"] = args.tpm or UNLIMITED_TPM
+    set_llm_factory(fake_llm_factory(latency_scale=args.latency_scale, jitter=args.jitter, error_rate=args.error_rate,
+                                     rate_limit_rate=args.rate_limit_rate, seed=args.seed))
+    seed_prices()
+    requests = requests_for(args.requests, args.shared)
+
+    def run(preferences):
+        started = time.perf_counter()
+        result = run_workflow(preferences, "loadtest", is_trade=args.trade)
+        ok = any(rec.get("Symbol") not in (None, "ERROR") for rec in result["recommendations"])
+        return time.perf_counter() - started, ok
+
+    logger.info(f"Load testing {len(requests)} workflows at concurrency {args.concurrency}")
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max(1, args.concurrency), thread_name_prefix="loadtest") as pool:
+        results = list(pool.map(run, requests))
+    elapsed = time.perf_counter() - started
+
+    latencies = sorted(latency for latency, _ in results)
+    failed = sum(1 for _, ok in results if not ok)
+    print(f"{len(results)} workflows in {elapsed:.2f}s at concurrency {args.concurrency}: "
+          f"{len(results) / elapsed:.2f} workflows/s, {failed} without recommendations")
+    print(f"Latency: p50 {percentile(latencies, 0.5):.2f}s, p90 {percentile(latencies, 0.9):.2f}s, "
+          f"p99 {percentile(latencies, 0.99):.2f}s, max {latencies[-1]:.2f}s")
+
+    print(f"\n{'Agent method':<40} {'Calls':>6} {'Retries':>7} {'Errors':>6} {'Prompt':>8} {'Compl.':>7} "
+          f"{'p50':>6} {'p95':>6} {'Share':>6}")
+    for name, calls in llm_telemetry_summary().items():
+        print(f"{name:<40} {calls['calls']:>6} {calls['retries']:>7} {calls['errors']:>6} {calls['prompt_tokens']:>8} "
+              f"{calls['completion_tokens']:>7} {calls['p50_latency']:>5.2f}s {calls['p95_latency']:>5.2f}s "
+              f"{calls['share']:>6.0%}")
+    for model, limits in rate_limiter_stats().items():
+        print(f"{model}: {limits['acquired']} requests, avg rate-limit wait {limits['avg_wait']:.2f}s "
+              f"(max {limits['max_wait']:.2f}s), {limits['rate_limited']} 429s")
+    for schema, stats in structured_output_stats().items():
+        print(f"{schema}: {stats['first_pass']}/{stats['calls']} valid first time, {stats['failures']} failures")
+    flights = workflow_flight_stats()
+    if flights["coalesced"]:
+        print(f"Coalesced {flights['coalesced']} of {flights['calls']} analysis calls into in-flight requests")
+    if args.telemetry_out:
+        print(f"Wrote {export_llm_telemetry(args.telemetry_out)} LLM call records to {args.telemetry_out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+import argparse
+import itertools
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from agents.prompt_encoding import estimate_tokens
+from agents.rate_limiter import request_priority, BACKGROUND, rate_limiter_stats, MODEL_RATE_LIMITS, DEFAULT_RATE_LIMIT
+from agents.reasoning_agent import ReasoningAgent
+from agents.recommendation_cache import AMOUNT_BUCKETS, RECOMMENDATION_TTL, get_recommendation_cache, snapshot_epoch
+from agents.token_budget import token_stats
+from agents.workflow import run_workflow
+from scripts.fetch_stock_prices import fetch_stock_prices
+from utils.logger import logger
+
+# Options of the Get Recommendations form
+RISK_APPETITES = ["low", "medium", "high"]
+INVESTMENT_GOALS = ["retirement", "growth", "income"]
+TIME_HORIZONS = ["short", "medium", "long"]
+INVESTMENT_STYLES = ["value", "growth", "index"]
+PREWARM_USER = "prewarm"
+# Representative amounts warmed by default: the full AMOUNT_BUCKETS grid (972 workflows) takes the
+# reasoning model's free-tier limits far longer than RECOMMENDATION_TTL
+DEFAULT_AMOUNTS = [1000, 10000, 100000]
+
+
+def preference_grid(amounts):
+    """Every form combination at each amount."""
+    return [
+        {"risk_appetite": risk, "investment_goals": goals, "time_horizon": horizon,
+         "investment_style": style, "investment_amount": float(amount)}
+        for risk, goals, horizon, style, amount in itertools.product(
+            RISK_APPETITES, INVESTMENT_GOALS, TIME_HORIZONS, INVESTMENT_STYLES, amounts)
+    ]
+
+
+def estimated_minutes(grid, stock_data) -> float:
+    """
+    Lower bound on the rate limiter's time for `grid`: each workflow sends an analysis and a thinking
+    prompt to the reasoning model, paced by its requests and tokens per minute (completions not counted).
+    """
+    agent = ReasoningAgent()
+    preferences = grid[0]
+    prompt_tokens = (estimate_tokens(agent._build_analysis_prompt(preferences, stock_data, preferences["investment_amount"]))
+                     + estimate_tokens(agent._build_thinking_prompt(preferences, stock_data)))
+    limits = MODEL_RATE_LIMITS.get(agent.llm.model_name, DEFAULT_RATE_LIMIT)
+    return max(len(grid) * 2 / limits["rpm"], len(grid) * prompt_tokens / limits["tpm"])
+
+
+def prewarm_one(preferences, stock_data, force):
+    """Run the workflow for one combination at background priority; returns (status, seconds, recommendations)."""
+    rec_cache = get_recommendation_cache()
+    cached = rec_cache.get(preferences, stock_data) if rec_cache and not force else None
+    if cached:
+        return "cached", 0.0, len(cached["recommendations"])
+    started = time.perf_counter()
+    with request_priority(BACKGROUND):
+        result = run_workflow(preferences, PREWARM_USER)
+    elapsed = time.perf_counter() - started
+    recommendations = [rec for rec in result["recommendations"] if rec.get("Symbol") != "ERROR"]
+    return ("warmed" if recommendations else "failed"), elapsed, len(recommendations)
+
+
+def main():
+    """Precompute recommendations for the whole preference grid against the latest price snapshot."""
+    parser = argparse.ArgumentParser(description="Pre-warm the recommendation cache for every form combination",
+                                     epilog="Run from the project root (e.g. nightly from cron): "
+                                            "python -m scripts.prewarm_recommendations")
+    parser.add_argument("--amounts", type=float, nargs="+", default=DEFAULT_AMOUNTS,
+                        help="Amounts to analyze, one per cache bucket (default: %(default)s; bucket upper edges are "
+                             + ", ".join(f"{amount:g}" for amount in AMOUNT_BUCKETS) + ")")
+    parser.add_argument("--concurrency", type=int, default=2,
+                        help="Workflows run at once; the shared rate limiter still paces their LLM calls")
+    parser.add_argument("--force", action="store_true", help="Recompute combinations that are already cached")
+    parser.add_argument("--usd-per-million", type=float, default=None,
+                        help="Blended price per million tokens, to report spend in dollars")
+    args = parser.parse_args()
+
+    if get_recommendation_cache() is None:
+        print("The recommendation cache is disabled or unavailable (RECOMMENDATION_CACHE_ENABLED); nothing to pre-warm.")
+        return
+    stock_data = fetch_stock_prices()
+    if not stock_data:
+        print("No price snapshot available; nothing to pre-warm.")
+        return
+    grid = preference_grid(args.amounts)
+    logger.info(f"Pre-warming {len(grid)} combinations against snapshot {snapshot_epoch(stock_data)}")
+    minutes = estimated_minutes(grid, stock_data)
+    print(f"Estimated at least {minutes:.0f} minutes of rate-limited LLM time for {len(grid)} combinations")
+    if minutes * 60 > RECOMMENDATION_TTL:
+        print(f"Warning: that exceeds the {RECOMMENDATION_TTL / 3600:.0f}h cache TTL, so the first entries expire "
+              f"before the run ends; pass fewer --amounts")
+    tokens_before = token_stats()
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max(1, args.concurrency), thread_name_prefix="prewarm") as pool:
+        futures = [pool.submit(prewarm_one, preferences, stock_data, args.force) for preferences in grid]
+        results = []
+        for preferences, future in zip(grid, futures):
+            try:
+                status, elapsed, count = future.result()
+            except Exception as e:
+                logger.error(f"Pre-warm failed for {preferences}: {str(e)}")
+                status, elapsed, count = "failed", 0.0, 0
+            results.append((preferences, status, elapsed))
+            print(f"{status:>7} {elapsed:>7.2f}s {count:>2} recs  {preferences['risk_appetite']}/"
+                  f"{preferences['investment_goals']}/{preferences['time_horizon']}/{preferences['investment_style']}"
+                  f" ${preferences['investment_amount']:,.0f}")
+    total = time.perf_counter() - started
+
+    counts = {status: sum(1 for _, s, _ in results if s == status) for status in ("warmed", "cached", "failed")}
+    latencies = sorted(elapsed for _, status, elapsed in results if status == "warmed")
+    print(f"\n{len(grid)} combinations in {total:.1f}s: {counts['warmed']} warmed, "
+          f"{counts['cached']} already cached, {counts['failed']} failed")
+    if latencies:
+        print(f"Workflow latency: mean {sum(latencies) / len(latencies):.2f}s, "
+              f"p50 {latencies[len(latencies) // 2]:.2f}s, max {latencies[-1]:.2f}s")
+
+    print(f"\n{'Agent':<24} {'Calls':>6} {'Prompt':>10} {'Completion':>11}")
+    spent = 0
+    for agent, usage in token_stats().items():
+        before = tokens_before.get(agent, {"calls": 0, "prompt_tokens": 0, "completion_tokens": 0})
+        calls = usage["calls"] - before["calls"]
+        prompt = usage["prompt_tokens"] - before["prompt_tokens"]
+        completion = usage["completion_tokens"] - before["completion_tokens"]
+        if calls:
+            spent += prompt + completion
+            print(f"{agent:<24} {calls:>6} {prompt:>10} {completion:>11}")
+    spend = f" (${spent / 1e6 * args.usd_per_million:.2f})" if args.usd_per_million is not None else ""
+    print(f"Total LLM spend: {spent:,} tokens{spend}")
+    for model, limits in rate_limiter_stats().items():
+        print(f"{model}: avg rate-limit wait {limits['avg_wait']:.2f}s, {limits['rate_limited']} 429s")
+
+
+if __name__ == "__main__":
+    main()
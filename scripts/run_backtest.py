@@ -0,0 +1,59 @@
+import argparse
+import time
+
+from analytics.backtest import BacktestEngine, parameter_grid, backfill_price_history, history_years
+from scripts.fetch_stock_prices import STOCK_LIST
+from utils.logger import logger
+
+
+def main():
+    """Backtest a grid of momentum strategy variants over the stored daily prices."""
+    parser = argparse.ArgumentParser(description="Backtest recommendation strategies over stored daily prices",
+                                     epilog="Run from the project root: python -m scripts.run_backtest")
+    parser.add_argument("--years", type=int, default=10, help="Years of history to replay")
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes (default: all cores)")
+    parser.add_argument("--top", type=int, default=10, help="Number of best variants to print")
+    parser.add_argument("--backfill", metavar="DIR", default=None,
+                        help="First load daily closes from DIR/<SYMBOL>.csv (Date, Close columns) into daily_prices")
+    args = parser.parse_args()
+
+    grid = parameter_grid(
+        lookback=[20, 40, 60, 90, 120],
+        top_k=[1, 2, 3, 5, 8],
+        rebalance_every=[5, 10, 21, 42, 63],
+        max_weight=[0.2, 0.3, 0.4, 0.6],
+        weighting=["equal", "score"]
+    )
+    logger.info(f"Starting backtest of {len(grid)} variants")
+    try:
+        if args.backfill:
+            written = backfill_price_history(STOCK_LIST, args.backfill)
+            print(f"Backfilled {sum(written.values())} daily closes for {len(written)} of {len(STOCK_LIST)} symbols")
+        engine = BacktestEngine.from_database(STOCK_LIST, years=args.years)
+        if not engine.dates:
+            print("No daily prices found. Run fetch_stock_prices.py to start recording history, "
+                  "or load past closes with --backfill DIR.")
+            return
+        covered = history_years(engine.dates)
+        if covered < args.years * 0.95:
+            # fetch_stock_prices only records one bar per day going forward, so history starts when recording did
+            print(f"Warning: only {covered:.1f} of the requested {args.years} years of daily prices are stored "
+                  f"({engine.dates[0]} to {engine.dates[-1]}); results cover that span. "
+                  f"Use --backfill DIR to load older closes.")
+        started = time.perf_counter()
+        results = engine.run_grid(grid, workers=args.workers)
+        elapsed = time.perf_counter() - started
+    except Exception as e:
+        logger.error(f"Backtest failed: {str(e)}")
+        print(f"Error: {str(e)}")
+        return
+
+    print(f"Backtested {len(results)} variants over {len(engine.dates)} days in {elapsed:.2f}s")
+    print(f"{'Return':>9} {'CAGR':>7} {'MaxDD':>7} {'Sharpe':>7} {'Turnover':>9}  Params")
+    for result in sorted(results, key=lambda r: r["sharpe"], reverse=True)[:args.top]:
+        print(f"{result['total_return']:>9.1%} {result['cagr']:>7.1%} {result['max_drawdown']:>7.1%} "
+              f"{result['sharpe']:>7.2f} {result['turnover']:>9.2f}  {result['params']}")
+
+
+if __name__ == "__main__":
+    main()
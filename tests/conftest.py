@@ -0,0 +1,10 @@
+import os
+import sys
+
+# Run from any directory: the packages live at the project root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Keep unit tests off the on-disk caches
+os.environ.setdefault("LLM_CACHE_ENABLED", "0")
+os.environ.setdefault("RECOMMENDATION_CACHE_ENABLED", "0")
+os.environ.setdefault("WORKFLOW_CHECKPOINTS_ENABLED", "0")
@@ -0,0 +1,54 @@
+import numpy as np
+import pytest
+
+from analytics.backtest import BacktestEngine, parameter_grid, scores_from_recommendations
+
+ROTATION = {"top_k": 1, "max_weight": 1.0, "rebalance_every": 1, "transaction_cost": 0.01, "initial_cash": 10_000.0}
+
+
+def swapping_leaders(days=40):
+    """Two symbols whose scores trade places every day, so each rebalance is a full rotation."""
+    dates = list(range(days))
+    prices = np.column_stack([np.linspace(100, 130, days), np.linspace(50, 45, days)])
+    scores = np.where(np.arange(days)[:, None] % 2 == 0, [[90, 10]], [[10, 90]]).astype(float)
+    return dates, prices, scores
+
+
+@pytest.mark.parametrize("days", range(2, 40, 3))
+def test_full_rotation_never_borrows(days):
+    dates, prices, scores = swapping_leaders(days)
+    result = BacktestEngine(dates, ["A", "B"], prices, scores).run(ROTATION)
+    assert result["cash"] >= 0
+    assert result["trades"] > 0
+
+
+def test_transaction_costs_reduce_value():
+    dates, prices, scores = swapping_leaders()
+    engine = BacktestEngine(dates, ["A", "B"], prices, scores)
+    free, costly = engine.run_grid(parameter_grid(**{**ROTATION, "transaction_cost": [0.0, 0.01]}), workers=1)
+    assert costly["final_value"] < free["final_value"]
+    assert free["cash"] >= 0 and costly["cash"] >= 0
+
+
+def test_buy_and_hold_tracks_the_price():
+    dates = list(range(30))
+    prices = np.column_stack([np.linspace(100, 150, 30)])
+    result = BacktestEngine(dates, ["A"], prices, np.full((30, 1), 80.0)).run(
+        {"top_k": 1, "max_weight": 1.0, "rebalance_every": 100, "transaction_cost": 0.0, "initial_cash": 1000.0})
+    assert result["trades"] == 1
+    assert result["final_value"] == pytest.approx(1000.0 * 1.5, rel=0.01)
+    assert result["max_drawdown"] == 0.0
+
+
+def test_sell_advice_drops_the_symbol():
+    scores = scores_from_recommendations([0, 1, 2], ["A", "B"], [
+        {"date": 0, "Symbol": "A", "Action": "Buy", "Score": 70},
+        {"date": 2, "Symbol": "A", "Action": "Sell", "Score": 90},
+    ])
+    assert scores[1, 0] == 70 and scores[2, 0] == 0
+    assert np.isnan(scores[:, 1]).all()
+
+
+def test_mismatched_shapes_raise():
+    with pytest.raises(ValueError):
+        BacktestEngine([0, 1], ["A"], np.ones((3, 1)))
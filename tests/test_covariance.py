@@ -0,0 +1,60 @@
+import threading
+
+import numpy as np
+
+from analytics.covariance import RollingCovariance
+
+SYMBOLS = ["A", "B", "C"]
+
+
+def _prices(days=30, seed=0):
+    rng = np.random.default_rng(seed)
+    return 100 * np.cumprod(1 + rng.normal(0, 0.01, (days, len(SYMBOLS))), axis=0)
+
+
+def _feed(model, prices):
+    for day, row in enumerate(prices):
+        model.on_bar(day, dict(zip(SYMBOLS, row)))
+
+
+def test_matches_direct_sample_covariance():
+    prices = _prices()
+    model = RollingCovariance(SYMBOLS, window=10)
+    _feed(model, prices)
+    returns = prices[1:] / prices[:-1] - 1.0
+    assert np.allclose(model.covariance_matrix(), np.cov(returns[-10:], rowvar=False))
+    assert model.observations == 10
+
+
+def test_same_key_replaces_last_bar():
+    prices = _prices()
+    reference = RollingCovariance(SYMBOLS, window=5)
+    _feed(reference, prices)
+    model = RollingCovariance(SYMBOLS, window=5)
+    for day, row in enumerate(prices):
+        # An early intraday snapshot, then the close for the same day
+        model.on_bar(day, dict(zip(SYMBOLS, row * 1.03)))
+        model.on_bar(day, dict(zip(SYMBOLS, row)))
+    assert np.allclose(model.covariance_matrix(), reference.covariance_matrix())
+    assert model.observations == reference.observations
+
+
+def test_older_and_repeated_bars_are_ignored():
+    model = RollingCovariance(SYMBOLS, window=5)
+    assert model.on_bar(2, {"A": 10.0, "B": 20.0, "C": 30.0})
+    assert not model.on_bar(2, {"A": 10.0, "B": 20.0, "C": 30.0})
+    assert not model.on_bar(1, {"A": 11.0, "B": 21.0, "C": 31.0})
+
+
+def test_concurrent_duplicate_bars_are_counted_once():
+    prices = _prices()
+    reference = RollingCovariance(SYMBOLS, window=5)
+    _feed(reference, prices)
+    model = RollingCovariance(SYMBOLS, window=5)
+    for day, row in enumerate(prices):
+        threads = [threading.Thread(target=model.on_bar, args=(day, dict(zip(SYMBOLS, row)))) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    assert np.allclose(model.covariance_matrix(), reference.covariance_matrix())
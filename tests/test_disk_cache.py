@@ -0,0 +1,45 @@
+import time
+
+from utils.disk_cache import DiskCache
+
+
+def test_reads_do_not_write(tmp_path):
+    cache = DiskCache(tmp_path / "cache.sqlite3")
+    cache.set("ns", "a", {"x": 1}, ttl=60)
+    writes = cache._conn.total_changes
+    for _ in range(50):
+        assert cache.get("ns", "a") == ({"x": 1}, {})
+    assert cache._conn.total_changes == writes
+
+
+def test_buffered_touches_still_drive_lru_eviction(tmp_path):
+    cache = DiskCache(tmp_path / "cache.sqlite3", max_entries=2)
+    cache.set("ns", "a", 1, ttl=60)
+    time.sleep(0.01)
+    cache.set("ns", "b", 2, ttl=60)
+    time.sleep(0.01)
+    assert cache.get("ns", "a") is not None
+    # Writing a third entry flushes the touch on "a", so "b" is the least recently used
+    cache.set("ns", "c", 3, ttl=60)
+    assert cache.get("ns", "a") is not None
+    assert cache.get("ns", "b") is None
+    assert cache.get("ns", "c") is not None
+
+
+def test_expired_entries_are_misses(tmp_path):
+    cache = DiskCache(tmp_path / "cache.sqlite3")
+    cache.set("ns", "a", 1, ttl=-1)
+    assert cache.get("ns", "a") is None
+
+
+def test_delete_prefix_only_drops_matching_keys(tmp_path):
+    cache = DiskCache(tmp_path / "cache.sqlite3")
+    cache.set("ns", "run1:a", 1, ttl=60)
+    cache.set("ns", "run1:b", 2, ttl=60)
+    cache.set("ns", "run10:a", 3, ttl=60)
+    cache.set("other", "run1:a", 4, ttl=60)
+    assert cache.get("ns", "run1:a") is not None
+    assert cache.delete_prefix("ns", "run1:") == 2
+    assert cache.get("ns", "run1:a") is None
+    assert cache.get("ns", "run10:a") == (3, {})
+    assert cache.get("other", "run1:a") == (4, {})
@@ -0,0 +1,52 @@
+import time
+
+import agents.jobs as jobs
+from agents.jobs import JobQueue, JobStore, DONE, FAILED
+
+
+def _wait(queue, job_id, timeout=5.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        job = queue.get(job_id)
+        if job["status"] in (DONE, FAILED):
+            return job
+        time.sleep(0.01)
+    raise AssertionError(f"Job {job_id} did not finish")
+
+
+def test_resume_requeues_recommendations_but_fails_trades(tmp_path):
+    store = JobStore(tmp_path / "jobs.sqlite3")
+    recommendation = store.create("workflow", {"preferences": {}, "user_id": "u", "is_trade": False})
+    trade = store.create("workflow", {"preferences": {}, "user_id": "u", "is_trade": True})
+
+    ran = []
+    queue = JobQueue(store, workers=1)
+    queue.register("workflow", lambda payload, emit: ran.append(payload["is_trade"]) or {"ok": True})
+    queue.resume_unfinished()
+
+    assert _wait(queue, recommendation)["status"] == DONE
+    failed = queue.get(trade)
+    assert failed["status"] == FAILED
+    assert "not resumed" in failed["error"]
+    assert ran == [False]
+
+
+def test_expired_job_is_none(tmp_path):
+    queue = JobQueue(JobStore(tmp_path / "jobs.sqlite3"), workers=1)
+    assert queue.get("missing") is None
+
+
+def test_events_are_dropped_once_the_result_expires(tmp_path, monkeypatch):
+    monkeypatch.setattr(jobs, "JOB_RESULT_TTL", 0.05)
+    queue = JobQueue(JobStore(tmp_path / "jobs.sqlite3"), workers=1)
+    queue.register("workflow", lambda payload, emit: emit({"step": 1}) or {"ok": True})
+    first = queue.submit("workflow", {})
+    _wait(queue, first)
+    assert queue.events(first) == [{"step": 1}]
+
+    time.sleep(0.1)
+    _wait(queue, queue.submit("workflow", {}))
+    deadline = time.time() + 5.0
+    while queue.events(first) and time.time() < deadline:
+        time.sleep(0.01)
+    assert queue.events(first) == []
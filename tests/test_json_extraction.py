@@ -0,0 +1,63 @@
+import pytest
+
+from utils.json_extraction import JSONExtractionError, _strip_trailing_commas, extract_json, strip_reasoning
+
+
+def test_plain_object():
+    assert extract_json('{"a": 1}') == {"a": 1}
+
+
+def test_reasoning_preamble_is_skipped():
+    text = '<think>maybe {"draft": true}</think>\n{"final": true}'
+    assert strip_reasoning(text).strip() == '{"final": true}'
+    assert extract_json(text) == {"final": True}
+
+
+def test_unclosed_reasoning_means_no_answer():
+    with pytest.raises(JSONExtractionError):
+        extract_json('<think>still thinking {"a": 1}')
+
+
+def test_fenced_block_wins_over_surrounding_prose():
+    text = 'Here you go {not json}:\n```json\n{"recommendations": [1, 2]}\n```\nDone.'
+    assert extract_json(text) == {"recommendations": [1, 2]}
+
+
+def test_first_value_of_the_expected_type():
+    text = 'Scores [1, 2] and details {"a": [3]} follow'
+    assert extract_json(text) == [1, 2]
+    assert extract_json(text, dict) == {"a": [3]}
+    assert extract_json('{"a": 1} then [5]', list) == [5]
+
+
+def test_trailing_commas_are_tolerated():
+    assert extract_json('Answer: {"a": [1, 2,], "b": {"c": 3,},}') == {"a": [1, 2], "b": {"c": 3}}
+
+
+def test_missing_json_raises():
+    with pytest.raises(JSONExtractionError):
+        extract_json("no json here")
+    with pytest.raises(JSONExtractionError):
+        extract_json(None)
+
+
+def test_large_answer_after_many_false_starts():
+    text = "{ broken " * 2000 + '{"ok": [' + ",".join(["1"] * 5000) + "]}"
+    assert extract_json(text) == {"ok": [1] * 5000}
+
+
+@pytest.mark.parametrize("text, expected", [
+    ('[1, 2,]', '[1, 2]'),
+    ('{"a": 1 , }', '{"a": 1  }'),
+    ('{"a": [1,\n  ]}', '{"a": [1\n  ]}'),
+    ('[1, 2]', '[1, 2]'),
+    ('[1,,2]', '[1,,2]'),
+    ('trailing,', 'trailing,'),
+])
+def test_strip_trailing_commas(text, expected):
+    assert _strip_trailing_commas(text) == expected
+
+
+def test_strip_trailing_commas_leaves_strings_alone():
+    text = '{"a": "x, ]", "b": "escaped \\", }",}'
+    assert _strip_trailing_commas(text) == '{"a": "x, ]", "b": "escaped \\", }"}'
@@ -0,0 +1,100 @@
+from types import SimpleNamespace
+import threading
+
+import pytest
+
+import agents.monitor_guardrail as guardrail
+from agents.fake_llm import fake_llm_factory
+from agents.llm_registry import set_llm_factory
+from agents.monitor_guardrail import MonitorGuardrailAgent, normalize_action, verdict_key
+
+
+class FakeGuardModel:
+    def __init__(self, verdict="safe", delay=0.0):
+        self.verdict = verdict
+        self.delay = delay
+        self.prompts = []
+        self.release = threading.Event()
+
+    def invoke(self, prompt):
+        self.prompts.append(prompt)
+        if self.delay:
+            self.release.wait(self.delay)
+        return SimpleNamespace(content=self.verdict)
+
+
+@pytest.fixture
+def agent():
+    # Offline clients so building the agent needs no GROQ_API_KEY
+    set_llm_factory(fake_llm_factory())
+    agent = MonitorGuardrailAgent()
+    agent.llm = FakeGuardModel()
+    yield agent
+    set_llm_factory(None)
+
+
+def trade(side="Buy", symbol="AAPL", quantity=10, price=190.0):
+    return {"Action": side, "Symbol": symbol, "Quantity": quantity, "CurrentPrice": price}
+
+
+def test_ordinary_trade_passes_on_rules(agent):
+    safe, stage, _ = agent.check(trade(), "u1")
+    assert (safe, stage) == (True, "rules")
+    assert agent.llm.prompts == []
+
+
+@pytest.mark.parametrize("action, reason", [
+    (trade(symbol="XYZ"), "not in the allowed stock list"),
+    (trade(quantity=0), "outside 0-"),
+    (trade(quantity=guardrail.MAX_TRADE_QUANTITY + 1), "outside 0-"),
+    (trade(price=0), "No valid price"),
+    (trade(quantity=1000, price=500.0), "exceeds"),
+    (trade(side="Short"), "Unsupported action"),
+])
+def test_rule_violations_are_blocked_without_the_model(agent, action, reason):
+    safe, stage, reasons = agent.check(action, "u1")
+    assert (safe, stage) == (False, "rules")
+    assert reason in reasons[0]
+    assert agent.llm.prompts == []
+
+
+def test_velocity_limit_blocks_a_busy_user(agent):
+    for _ in range(guardrail.MAX_ACTIONS_PER_MINUTE):
+        assert agent.check(trade(), "u1")[0]
+    safe, stage, reasons = agent.check(trade(), "u1")
+    assert (safe, stage) == (False, "rules")
+    assert "actions in the last minute" in reasons[0]
+    assert agent.check(trade(), "u2")[0]
+
+
+def test_text_trades_are_parsed_like_recommendations():
+    assert normalize_action("buy 10 shares of aapl at $190") == normalize_action(trade())
+
+
+def test_unusual_trades_and_free_text_go_to_the_model_and_are_cached(agent):
+    assert agent.check(trade(quantity=190, price=150.0), "u1")[:2] == (True, "llm")
+    assert agent.check(trade(quantity=191, price=150.01), "u1")[:2] == (True, "cache")
+    agent.llm.verdict = "unsafe\nS2"
+    assert agent.check("move all my money to crypto", "u1")[:2] == (False, "llm")
+    assert len(agent.llm.prompts) == 2
+
+
+def test_verdict_key_buckets_trade_value():
+    near = verdict_key(normalize_action(trade(quantity=190, price=150.0)))
+    assert near == verdict_key(normalize_action(trade(quantity=189, price=151.0)))
+    assert near != verdict_key(normalize_action(trade(quantity=400, price=150.0)))
+    assert near != verdict_key(normalize_action(trade(side="Sell", quantity=190, price=150.0)))
+
+
+def test_timed_out_checks_hold_their_worker_and_cache_the_late_verdict(agent, monkeypatch):
+    monkeypatch.setattr(guardrail, "GUARDRAIL_LLM_BUDGET", 0.01)
+    monkeypatch.setattr(guardrail, "_llm_slots", threading.BoundedSemaphore(1))
+    agent.llm = FakeGuardModel(delay=5.0)
+    assert agent.check("first free-text action", "u1")[:2] == (False, "timeout")
+    # The only worker is still busy, so a different action falls back without queuing
+    assert agent.check("second free-text action", "u1")[:2] == (False, "busy")
+    agent.llm.release.set()
+    future = agent._pending.get("first free-text action")
+    if future is not None:
+        future.result(timeout=5)
+    assert agent.check("first free-text action", "u1")[:2] == (True, "cache")
@@ -0,0 +1,58 @@
+import numpy as np
+import pytest
+
+from analytics.position_sizer import PositionSizer, RISK_AVERSION, _project_capped_simplex
+
+SYMBOLS = ["AAPL", "MSFT", "NVDA", "JNJ"]
+SCORES = [90, 70, 60, 40]
+PRICES = [190.0, 410.0, 120.0, 155.0]
+
+
+def test_projection_respects_cap_and_total():
+    w = _project_capped_simplex(np.array([0.9, 0.5, -0.2, 0.1]), cap=0.4, total=1.0)
+    assert w.sum() == pytest.approx(1.0, abs=1e-6)
+    assert w.min() >= 0 and w.max() <= 0.4 + 1e-9
+
+
+@pytest.mark.parametrize("method", ["mean_variance", "risk_parity"])
+def test_allocation_stays_within_budget_and_cap(method):
+    sizer = PositionSizer(method=method, max_weight=0.4)
+    allocation = sizer.allocate(SYMBOLS, SCORES, PRICES, 10_000.0)
+    assert set(allocation) == set(SYMBOLS)
+    assert sum(a["total_cost"] for a in allocation.values()) <= 10_000.0
+    assert sum(a["weight"] for a in allocation.values()) == pytest.approx(1.0, abs=1e-6)
+    assert all(a["weight"] <= 0.4 + 1e-6 for a in allocation.values())
+    # Quantities are rounded down to hundredths of a share
+    assert all(round(a["quantity"], 2) == a["quantity"] for a in allocation.values())
+
+
+def test_higher_scores_get_more_weight():
+    weights = PositionSizer().weights(np.array(SCORES, dtype=float), np.eye(4) * 0.09)
+    assert list(np.argsort(-weights)) == [0, 1, 2, 3]
+
+
+def test_risk_aversion_shifts_weight_to_low_volatility():
+    cov = np.diag([0.01, 0.25])
+    cautious = PositionSizer.for_preferences({"risk_appetite": "low"}, max_weight=1.0).weights(np.array([50.0, 80.0]), cov)
+    bold = PositionSizer.for_preferences({"risk_appetite": "high"}, max_weight=1.0).weights(np.array([50.0, 80.0]), cov)
+    assert cautious[0] > bold[0]
+    assert PositionSizer.for_preferences({"risk_appetite": "low"}).risk_aversion == RISK_AVERSION["low"]
+
+
+def test_untradable_symbols_and_unknown_covariance():
+    cov = np.full((3, 3), np.nan)
+    cov[0, 0] = 0.04
+    allocation = PositionSizer().allocate(["AAPL", "MSFT", "NVDA"], [80, 80, 80], [190.0, 0.0, 120.0], 5_000.0, cov)
+    assert set(allocation) == {"AAPL", "NVDA"}
+    assert PositionSizer().allocate(SYMBOLS, SCORES, PRICES, 0.0) == {}
+
+
+def test_few_symbols_leave_cash_when_capped():
+    allocation = PositionSizer(max_weight=0.4).allocate(["AAPL", "MSFT"], [90, 90], [100.0, 100.0], 10_000.0)
+    assert sum(a["weight"] for a in allocation.values()) == pytest.approx(0.8, abs=1e-6)
+
+
+@pytest.mark.parametrize("kwargs", [{"method": "kelly"}, {"max_weight": 0}, {"max_weight": 1.5}])
+def test_invalid_settings_raise(kwargs):
+    with pytest.raises(ValueError):
+        PositionSizer(**kwargs)
@@ -0,0 +1,81 @@
+from types import SimpleNamespace
+import json
+
+import pytest
+
+from agents.fake_llm import fake_llm_factory
+from agents.llm_registry import set_llm_factory
+from agents.preference_parser import PreferenceParserAgent, fast_parse
+
+
+class FakeParserModel:
+    def __init__(self, persona):
+        self.persona = persona
+        self.calls = 0
+
+    def invoke(self, prompt):
+        self.calls += 1
+        return SimpleNamespace(content=json.dumps(self.persona))
+
+
+LOW_RISK_PERSONA = {"risk_appetite": "low", "investment_goals": "growth", "time_horizon": "medium",
+                    "investment_amount": 5000.0, "investment_style": "index"}
+
+
+@pytest.fixture
+def parser():
+    # Offline clients so building the agent needs no GROQ_API_KEY
+    set_llm_factory(fake_llm_factory())
+    parser = PreferenceParserAgent()
+    parser.llm = FakeParserModel(LOW_RISK_PERSONA)
+    yield parser
+    set_llm_factory(None)
+
+
+def test_fast_parse_maps_keywords_years_and_amounts():
+    values, unresolved, conflicts, unexplained = fast_parse("i'm cautious, 1-3 years, $2,500, passive index funds")
+    assert values["risk_appetite"] == "low"
+    assert values["time_horizon"] == "short"
+    assert values["investment_amount"] == 2500.0
+    assert values["investment_style"] == "index"
+    assert unexplained == ["funds"]
+    assert conflicts == []
+    assert fast_parse("$5k for 7+ years")[0] == {"investment_amount": 5000.0, "time_horizon": "long"}
+
+
+def test_fast_parse_reports_conflicting_keywords():
+    _, _, conflicts, _ = fast_parse("safe but also aggressive with $3000")
+    assert conflicts == ["risk_appetite"]
+
+
+def test_fully_explained_text_skips_the_llm(parser):
+    preferences = parser.parse_preferences("Invest $10000 aggressively for 10 years.")
+    assert parser.llm.calls == 0
+    assert preferences["risk_appetite"] == "high"
+    assert preferences["time_horizon"] == "long"
+    assert preferences["investment_amount"] == 10000.0
+
+
+@pytest.mark.parametrize("text", [
+    "$5000, nothing risky",
+    "$5000 but not aggressive",
+    "I don't want anything risky, $5000",
+    "avoid aggressive stocks, $5000",
+    "never risky, $5000",
+])
+def test_negated_text_goes_to_the_llm(parser, text):
+    preferences = parser.parse_preferences(text)
+    assert parser.llm.calls == 1
+    # The LLM's reading wins over the negated keyword
+    assert preferences["risk_appetite"] == "low"
+
+
+def test_unexplained_words_go_to_the_llm_even_when_every_field_matched(parser):
+    parser.parse_preferences("safe, retirement, long-term, $5000, value, but my spouse decides")
+    assert parser.llm.calls == 1
+
+
+def test_llm_answer_is_not_overridden_by_keyword_matches(parser):
+    preferences = parser.parse_preferences("aggressive growth sounds scary to me, $5000")
+    assert parser.llm.calls == 1
+    assert preferences == LOW_RISK_PERSONA
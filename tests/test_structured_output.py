@@ -0,0 +1,81 @@
+from types import SimpleNamespace
+import json
+
+import pytest
+
+from agents.structured_output import (StockRecommendation, StructuredOutputError, TradeValidationReport,
+                                      invoke_structured)
+
+
+class ScriptedModel:
+    """Answers each invoke with the next scripted reply and records the prompts it was sent."""
+
+    model_name = "deepseek-r1-distill-llama-70b"
+
+    def __init__(self, *replies):
+        self.replies = list(replies)
+        self.prompts = []
+
+    def invoke(self, prompt):
+        self.prompts.append(prompt)
+        reply = self.replies.pop(0)
+        return SimpleNamespace(content=reply if isinstance(reply, str) else json.dumps(reply))
+
+
+def recommendation(**overrides):
+    rec = {"Symbol": "AAPL", "Company": "Apple", "Action": "Buy", "Quantity": 2, "Reason": "r",
+           "Caution": "c", "NewsSentiment": "Neutral", "Score": 80}
+    rec.update(overrides)
+    return rec
+
+
+def report(is_valid=True):
+    return {"validation": {"validation_result": {"is_valid": is_valid, "concerns": []}}}
+
+
+def test_valid_first_answer_needs_no_repair():
+    llm = ScriptedModel(report())
+    assert invoke_structured(llm, "validate", TradeValidationReport).validation.validation_result.is_valid
+    assert len(llm.prompts) == 1
+
+
+def test_invalid_fields_are_patched_by_path():
+    llm = ScriptedModel({"recommendations": [recommendation(Score=150), recommendation(Symbol="MSFT")]},
+                        {"0.Score": 90})
+    items = invoke_structured(llm, "recommend", StockRecommendation, many=True, key="recommendations")
+    assert [(item.Symbol, item.Score) for item in items] == [("AAPL", 90), ("MSFT", 80)]
+    assert "0.Score = 150" in llm.prompts[1]
+
+
+def test_unparseable_answer_is_reformatted_once():
+    llm = ScriptedModel("validation: valid, no concerns", report())
+    assert invoke_structured(llm, "validate", TradeValidationReport).validation.validation_result.is_valid
+    assert "Convert the following answer into valid JSON" in llm.prompts[1]
+    assert "validation: valid, no concerns" in llm.prompts[1]
+
+
+def test_context_rules_trigger_repairs():
+    context = {"valid_symbols": {"AAPL", "MSFT"}, "prices": {"AAPL": 100.0}, "investment_amount": 500.0}
+    llm = ScriptedModel([recommendation(Quantity=10)], {"0.Quantity": 4})
+    items = invoke_structured(llm, "recommend", StockRecommendation, many=True, context=context)
+    assert items[0].Quantity == 4
+
+
+def test_items_still_invalid_after_repairs_are_dropped():
+    llm = ScriptedModel([recommendation(), recommendation(Symbol="MSFT", Score=-1)],
+                        {"1.Score": -5}, {"1.Score": -2})
+    items = invoke_structured(llm, "recommend", StockRecommendation, many=True, max_repairs=2)
+    assert [item.Symbol for item in items] == ["AAPL"]
+    assert len(llm.prompts) == 3
+
+
+def test_unknown_repair_paths_are_ignored():
+    llm = ScriptedModel([recommendation(Score=150)], {"0.Score": 70, "5.Score": 1})
+    assert invoke_structured(llm, "recommend", StockRecommendation, many=True)[0].Score == 70
+
+
+def test_raises_when_nothing_valid_remains():
+    llm = ScriptedModel("not json", "still not json", "nope")
+    with pytest.raises(StructuredOutputError):
+        invoke_structured(llm, "validate", TradeValidationReport)
+    assert len(llm.prompts) == 3
@@ -0,0 +1,20 @@
+from concurrent.futures import ThreadPoolExecutor
+import contextvars
+
+from agents.telemetry import call_site, llm_method
+
+
+def test_pooled_calls_take_the_method_from_the_context():
+    with llm_method("_llm_check"):
+        context = contextvars.copy_context()
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        assert pool.submit(context.run, call_site).result() == "_llm_check"
+        assert pool.submit(call_site).result() == "unknown"
+
+
+def test_llm_method_resets_on_exit():
+    with llm_method("outer"):
+        with llm_method("inner"):
+            assert call_site() == "inner"
+        assert call_site() == "outer"
+    assert call_site() == "unknown"
@@ -0,0 +1,56 @@
+import pytest
+
+from agents.trade_rules import ACCEPT, ESCALATE, REJECT, MIN_CLEAR_SCORE, TradeRuleEngine
+
+PREFERENCES = {"risk_appetite": "medium", "investment_amount": 10_000.0}
+
+
+@pytest.fixture
+def engine():
+    return TradeRuleEngine(["AAPL", "MSFT"])
+
+
+def rec(action="Buy", symbol="AAPL", quantity=10, score=80, sentiment="Neutral"):
+    return {"Symbol": symbol, "Action": action, "Quantity": quantity, "Score": score, "NewsSentiment": sentiment}
+
+
+def test_clear_buy_is_accepted(engine):
+    verdict, _ = engine.evaluate(rec(), PREFERENCES, 100.0)
+    assert verdict == ACCEPT
+
+
+@pytest.mark.parametrize("recommendation, price, reason", [
+    (rec(symbol="XYZ"), 100.0, "not in the allowed stock list"),
+    (rec(action="Hold"), 100.0, "Unsupported action"),
+    (rec(), 0.0, "No valid price"),
+    (rec(quantity=0), 100.0, "Quantity must be positive"),
+    (rec(quantity="ten"), 100.0, "not numeric"),
+    (rec(quantity=200), 100.0, "exceeds investment amount"),
+    (rec(quantity=60), 100.0, "concentration limit"),
+])
+def test_hard_rejections(engine, recommendation, price, reason):
+    verdict, reasons = engine.evaluate(recommendation, PREFERENCES, price)
+    assert verdict == REJECT
+    assert reason in reasons[0]
+
+
+def test_concentration_limit_follows_risk_appetite(engine):
+    assert engine.evaluate(rec(quantity=45), {**PREFERENCES, "risk_appetite": "low"}, 100.0)[0] == REJECT
+    assert engine.evaluate(rec(quantity=45), {**PREFERENCES, "risk_appetite": "medium"}, 100.0)[0] == ACCEPT
+    assert engine.evaluate(rec(quantity=55), {**PREFERENCES, "risk_appetite": "high"}, 100.0)[0] == ACCEPT
+
+
+def test_sells_are_checked_against_holdings(engine):
+    assert engine.evaluate(rec(action="Sell", quantity=5), PREFERENCES, 100.0, {"AAPL": 5.0})[0] == ACCEPT
+    verdict, reasons = engine.evaluate(rec(action="Sell", quantity=6), PREFERENCES, 100.0, {"AAPL": 5.0})
+    assert verdict == REJECT and "only 5.00 held" in reasons[0]
+    assert engine.evaluate(rec(action="Sell", quantity=5), PREFERENCES, 100.0)[0] == ESCALATE
+
+
+@pytest.mark.parametrize("recommendation, preferences", [
+    (rec(score=MIN_CLEAR_SCORE - 1), PREFERENCES),
+    (rec(sentiment="Negative"), PREFERENCES),
+    (rec(), {**PREFERENCES, "additional_details": "only ethical companies"}),
+])
+def test_judgement_calls_are_escalated(engine, recommendation, preferences):
+    assert engine.evaluate(recommendation, preferences, 100.0)[0] == ESCALATE
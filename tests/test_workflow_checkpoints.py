@@ -0,0 +1,13 @@
+from agents.workflow_checkpoints import WorkflowCheckpoints
+from utils.disk_cache import DiskCache
+
+
+def test_clear_drops_a_finished_runs_checkpoints(tmp_path):
+    checkpoints = WorkflowCheckpoints(DiskCache(tmp_path / "checkpoints.sqlite3"))
+    checkpoints.save("run-a", "snapshot", {"stock_data": {"AAPL": 1.0}})
+    checkpoints.save("run-a", "analysis:epoch", {"recommendations": []})
+    checkpoints.save("run-b", "snapshot", {"stock_data": {"AAPL": 2.0}})
+    checkpoints.clear("run-a")
+    assert checkpoints.load("run-a", "snapshot") is None
+    assert checkpoints.load("run-a", "analysis:epoch") is None
+    assert checkpoints.load("run-b", "snapshot") == {"stock_data": {"AAPL": 2.0}}
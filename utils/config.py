@@ -5,29 +5,42 @@ import base64
 import tempfile
 import requests
 
+load_dotenv()
+
+
+def _secret(key, section=None):
+    """A Streamlit secret, falling back to the environment (and .env) when there is no secrets file or entry."""
+    try:
+        return st.secrets[section][key] if section else st.secrets[key]
+    except Exception:
+        return os.getenv(key)
+
+
 #API Configs
-GROQ_API_KEY = st.secrets["GROQ_API_KEY"]
-NEWSAPI_KEY = st.secrets["NEWSAPI_KEY"]
-FINNHUB_API_KEY = st.secrets["FINNHUB_API_KEY"]
-GNEWS_API_KEY = st.secrets["GNEWS_API_KEY"]
+GROQ_API_KEY = _secret("GROQ_API_KEY")
+NEWSAPI_KEY = _secret("NEWSAPI_KEY")
+FINNHUB_API_KEY = _secret("FINNHUB_API_KEY")
+GNEWS_API_KEY = _secret("GNEWS_API_KEY")
 
 #Database Configs
-AZURE_DATABASE=st.secrets["database"]["AZURE_DATABASE"]
-AZURE_HOSTNAME=st.secrets["database"]["AZURE_HOSTNAME"]
-AZURE_PASSWORD=st.secrets["database"]["AZURE_PASSWORD"]
-AZURE_USER=st.secrets["database"]["AZURE_USER"]
-AZURE_PORT=st.secrets["database"]["AZURE_PORT"]
+AZURE_DATABASE=_secret("AZURE_DATABASE", "database")
+AZURE_HOSTNAME=_secret("AZURE_HOSTNAME", "database")
+AZURE_PASSWORD=_secret("AZURE_PASSWORD", "database")
+AZURE_USER=_secret("AZURE_USER", "database")
+AZURE_PORT=_secret("AZURE_PORT", "database")
 # AZURE_SSL_CA=st.secrets["database"]["AZURE_SSL_CA"]
 
-cert_base64 = st.secrets["database"]["AZURE_CERT"]
-AZURE_SSL = base64.b64decode(cert_base64)
-
-with tempfile.NamedTemporaryFile(delete=False, suffix=".pem") as tmp_cert_file:
-    tmp_cert_file.write(AZURE_SSL)
-    AZURE_SSL_CA = tmp_cert_file.name
+# The CA certificate is shipped base64-encoded; without one, AZURE_SSL_CA may point at a file instead
+cert_base64 = _secret("AZURE_CERT", "database")
+if cert_base64:
+    AZURE_SSL = base64.b64decode(cert_base64)
 
+    with tempfile.NamedTemporaryFile(delete=False, suffix=".pem") as tmp_cert_file:
+        tmp_cert_file.write(AZURE_SSL)
+        AZURE_SSL_CA = tmp_cert_file.name
+else:
+    AZURE_SSL_CA = os.getenv("AZURE_SSL_CA")
 
-load_dotenv()
 # GROQ_API_KEY = os.getenv("GROQ_API_KEY")
 # NEWSAPI_KEY = os.getenv("NEWSAPI_KEY")
 # FINNHUB_API_KEY = os.getenv("FINNHUB_API_KEY")
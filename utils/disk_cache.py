@@ -0,0 +1,140 @@
+from pathlib import Path
+from typing import Any, Dict, Optional, Tuple
+from utils.logger import logger
+import json
+import sqlite3
+import threading
+import time
+import zlib
+
+# Default location for on-disk caches, relative to the project root
+CACHE_DIR = Path(__file__).resolve().parent.parent / ".cache"
+# Reads record LRU touches in memory; they are written with the next set() or once this many pile up
+TOUCH_FLUSH_SIZE = 256
+TOUCH_FLUSH_SECONDS = 30.0
+
+
+class DiskCache:
+    """
+    SQLite-backed key/value store with per-entry TTLs and least-recently-used eviction.
+    Values are JSON-serialized and zlib-compressed; entries live in named namespaces.
+    """
+
+    def __init__(self, path: Path, max_entries: int = 5000, max_bytes: int = 200 * 1024 * 1024):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._touched: Dict[Tuple[str, str], float] = {}
+        self._last_flush = time.time()
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS entries (
+                namespace TEXT NOT NULL,
+                key TEXT NOT NULL,
+                value BLOB NOT NULL,
+                meta TEXT,
+                size INTEGER NOT NULL,
+                created REAL NOT NULL,
+                expires REAL NOT NULL,
+                last_access REAL NOT NULL,
+                PRIMARY KEY (namespace, key)
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_entries_last_access ON entries (last_access)")
+        self._conn.commit()
+
+    def get(self, namespace: str, key: str) -> Optional[Tuple[Any, Dict]]:
+        """
+        Return (value, meta) for a live entry, or None. Reads don't write: the LRU touch is buffered
+        and expired entries are left for the next eviction pass.
+        """
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, meta, expires FROM entries WHERE namespace = ? AND key = ?", (namespace, key)
+            ).fetchone()
+            if row is None or row[2] < now:
+                return None
+            self._touched[(namespace, key)] = now
+            if len(self._touched) >= TOUCH_FLUSH_SIZE or now - self._last_flush >= TOUCH_FLUSH_SECONDS:
+                self._flush_touches(now)
+                self._conn.commit()
+        try:
+            return json.loads(zlib.decompress(row[0])), json.loads(row[1] or "{}")
+        except (zlib.error, ValueError) as e:
+            logger.error(f"Corrupt cache entry {namespace}/{key}: {str(e)}")
+            self.delete(namespace, key)
+            return None
+
+    def set(self, namespace: str, key: str, value: Any, ttl: float, meta: Optional[Dict] = None):
+        """Store a JSON-serializable value for `ttl` seconds."""
+        blob = zlib.compress(json.dumps(value, default=str).encode("utf-8"))
+        now = time.time()
+        with self._lock:
+            self._conn.execute("""
+                INSERT OR REPLACE INTO entries (namespace, key, value, meta, size, created, expires, last_access)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            """, (namespace, key, blob, json.dumps(meta or {}), len(blob), now, now + ttl, now))
+            self._touched.pop((namespace, key), None)
+            self._flush_touches(now)
+            self._evict(now)
+            self._conn.commit()
+
+    def delete(self, namespace: str, key: str):
+        with self._lock:
+            self._conn.execute("DELETE FROM entries WHERE namespace = ? AND key = ?", (namespace, key))
+            self._conn.commit()
+
+    def delete_prefix(self, namespace: str, prefix: str) -> int:
+        """Delete every entry in `namespace` whose key starts with `prefix`; returns how many."""
+        with self._lock:
+            for key in [key for ns, key in self._touched if ns == namespace and key.startswith(prefix)]:
+                del self._touched[(namespace, key)]
+            deleted = self._conn.execute(
+                "DELETE FROM entries WHERE namespace = ? AND substr(key, 1, ?) = ?", (namespace, len(prefix), prefix)
+            ).rowcount
+            self._conn.commit()
+        return deleted
+
+    def clear(self, namespace: Optional[str] = None):
+        with self._lock:
+            if namespace is None:
+                self._conn.execute("DELETE FROM entries")
+            else:
+                self._conn.execute("DELETE FROM entries WHERE namespace = ?", (namespace,))
+            self._conn.commit()
+
+    def _flush_touches(self, now: float):
+        """Write buffered LRU touches in one statement; the caller holds the lock and commits."""
+        if self._touched:
+            self._conn.executemany("UPDATE entries SET last_access = ? WHERE namespace = ? AND key = ?",
+                                   [(at, namespace, key) for (namespace, key), at in self._touched.items()])
+            self._touched.clear()
+        self._last_flush = now
+
+    def _evict(self, now: float):
+        """Drop expired entries, then least recently used ones until under the size limits."""
+        self._conn.execute("DELETE FROM entries WHERE expires < ?", (now,))
+        count, total = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries").fetchone()
+        if count <= self.max_entries and total <= self.max_bytes:
+            return
+        evicted = 0
+        for key_namespace, key, size in self._conn.execute(
+                "SELECT namespace, key, size FROM entries ORDER BY last_access").fetchall():
+            if count <= self.max_entries and total <= self.max_bytes:
+                break
+            self._conn.execute("DELETE FROM entries WHERE namespace = ? AND key = ?", (key_namespace, key))
+            count -= 1
+            total -= size
+            evicted += 1
+        logger.info(f"Evicted {evicted} least recently used entries from {self.path.name}")
+
+    def stats(self) -> Dict:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT namespace, COUNT(*), COALESCE(SUM(size), 0) FROM entries GROUP BY namespace"
+            ).fetchall()
+        return {namespace: {"entries": count, "bytes": size} for namespace, count, size in rows}
@@ -0,0 +1,158 @@
+from typing import Any, Iterator, Optional, Tuple
+import json
+
+_decoder = json.JSONDecoder()
+# Decode attempts first run on a window this long, so a failed candidate costs O(window) rather than O(text)
+_WINDOW = 8192
+
+
+class JSONExtractionError(ValueError):
+    """No JSON value of the expected type could be found in the text."""
+
+
+def strip_reasoning(text: str) -> str:
+    """Drop a <think>...</think> preamble emitted by reasoning models."""
+    end = text.rfind("</think>")
+    if end != -1:
+        return text[end + len("</think>"):]
+    start = text.find("<think>")
+    # An unclosed preamble means the answer never started
+    return text[:start] if start != -1 else text
+
+
+def _fenced_blocks(text: str) -> Iterator[str]:
+    """Contents of ``` fenced code blocks, in order."""
+    pos = 0
+    while True:
+        start = text.find("```", pos)
+        if start == -1:
+            return
+        body_start = text.find("\n", start)
+        end = text.find("```", start + 3)
+        if end == -1:
+            return
+        # Skip a language tag such as ```json on the opening line
+        if body_start == -1 or body_start > end:
+            body_start = start + 3
+        yield text[body_start:end]
+        pos = end + 3
+
+
+def _strip_trailing_commas(text: str) -> str:
+    """Remove commas directly before a closing bracket, outside strings, in one pass."""
+    out = []
+    in_string = False
+    escaped = False
+    pending_comma = None
+    for char in text:
+        if in_string:
+            out.append(char)
+            if escaped:
+                escaped = False
+            elif char == "\\":
+                escaped = True
+            elif char == '"':
+                in_string = False
+            continue
+        if pending_comma is not None:
+            if char in " \t\r\n":
+                pending_comma.append(char)
+                continue
+            if char not in "}]":
+                out.extend(pending_comma)
+            else:
+                out.extend(pending_comma[1:])
+            pending_comma = None
+        if char == ",":
+            pending_comma = [char]
+            continue
+        if char == '"':
+            in_string = True
+        out.append(char)
+    if pending_comma is not None:
+        out.extend(pending_comma)
+    return "".join(out)
+
+
+def _decode_at(text: str, start: int) -> Tuple[bool, Any, int]:
+    """
+    raw_decode at `start`, returning (ok, value, end) or (False, None, failure position).
+    JSONDecodeError counts lines up to the failure, which is linear in the text; decoding a
+    bounded window first keeps that cost constant for the usual early failures.
+    """
+    if len(text) - start > _WINDOW:
+        window = text[start:start + _WINDOW]
+        try:
+            value, end = _decoder.raw_decode(window)
+            return True, value, start + end
+        except json.JSONDecodeError as e:
+            truncated = e.pos >= len(window) - 1 or e.msg.startswith("Unterminated string")
+            if not truncated:
+                return False, None, start + e.pos
+    try:
+        value, end = _decoder.raw_decode(text, start)
+        return True, value, end
+    except json.JSONDecodeError as e:
+        return False, None, e.pos if not e.msg.startswith("Unterminated string") else start + 1
+
+
+def _scan(text: str, openers: str, expect: Optional[type]) -> Tuple[bool, Any]:
+    """
+    Try raw_decode at each candidate opener, left to right. After a failed attempt the search resumes
+    past the point where decoding failed, so each character is examined a bounded number of times.
+    """
+    pos = 0
+    length = len(text)
+    # Next occurrence of each opener; only refreshed once the scan moves past it
+    next_at = {ch: text.find(ch) for ch in openers}
+    while pos < length:
+        for ch in openers:
+            if next_at[ch] != -1 and next_at[ch] < pos:
+                next_at[ch] = text.find(ch, pos)
+        candidates = [i for i in next_at.values() if i != -1]
+        if not candidates:
+            break
+        start = min(candidates)
+        ok, value, end = _decode_at(text, start)
+        if not ok:
+            pos = max(start + 1, end)
+            continue
+        if expect is None or isinstance(value, expect):
+            return True, value
+        pos = end
+    return False, None
+
+
+def extract_json(text: str, expect: Optional[type] = None) -> Any:
+    """
+    Return the first JSON value in an LLM response, optionally requiring it to be a dict or list.
+    Tries, in order: the whole text, fenced code blocks, a scan for the first decodable value,
+    and the same scan with trailing commas removed. Raises JSONExtractionError if nothing parses.
+    """
+    if not isinstance(text, str):
+        raise JSONExtractionError(f"Expected a string, got {type(text).__name__}")
+    text = strip_reasoning(text)
+    openers = "{" if expect is dict else "[" if expect is list else "{["
+
+    stripped = text.strip()
+    if stripped and stripped[0] in openers:
+        try:
+            value = json.loads(stripped)
+            if expect is None or isinstance(value, expect):
+                return value
+        except json.JSONDecodeError:
+            pass
+
+    for block in _fenced_blocks(text):
+        found, value = _scan(block, openers, expect)
+        if found:
+            return value
+
+    found, value = _scan(text, openers, expect)
+    if found:
+        return value
+
+    found, value = _scan(_strip_trailing_commas(text), openers, expect)
+    if found:
+        return value
+    raise JSONExtractionError("No valid JSON value found in response")
@@ -0,0 +1,131 @@
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Hashable, Iterator, Optional
+from utils.logger import logger
+import contextvars
+import copy
+import threading
+
+# Runs the shared producer of a coalesced stream, so it finishes even if its first consumer goes away
+_producer_pool = ThreadPoolExecutor(max_workers=8, thread_name_prefix="single-flight")
+
+
+class _Flight:
+    def __init__(self):
+        self.cond = threading.Condition()
+        self.events = []
+        self.done = False
+        self.result = None
+        self.error: Optional[BaseException] = None
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls with the same key: the first caller runs the work and every caller
+    that arrives while it is in flight receives the same result (or exception). Results are deep
+    copied for each waiter so callers can't mutate each other's data. A key of None disables coalescing.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._lock = threading.Lock()
+        self._flights: Dict[Hashable, _Flight] = {}
+        self.calls = 0
+        self.executed = 0
+        self.coalesced = 0
+
+    def _join(self, key: Hashable):
+        with self._lock:
+            self.calls += 1
+            flight = self._flights.get(key)
+            if flight is not None:
+                self.coalesced += 1
+                logger.info(f"{self.name}: joining in-flight request {key}")
+                return flight, False
+            flight = _Flight()
+            self._flights[key] = flight
+            self.executed += 1
+            return flight, True
+
+    def _finish(self, key: Hashable, flight: _Flight):
+        with self._lock:
+            if self._flights.get(key) is flight:
+                del self._flights[key]
+        with flight.cond:
+            flight.done = True
+            flight.cond.notify_all()
+
+    def do(self, key: Optional[Hashable], fn: Callable[[], Any]) -> Any:
+        """Return fn(), sharing one execution among concurrent callers with the same key."""
+        if key is None:
+            with self._lock:
+                self.calls += 1
+                self.executed += 1
+            return fn()
+        flight, leader = self._join(key)
+        if leader:
+            try:
+                flight.result = fn()
+                return flight.result
+            except BaseException as e:
+                flight.error = e
+                raise
+            finally:
+                self._finish(key, flight)
+        with flight.cond:
+            while not flight.done:
+                flight.cond.wait()
+        if flight.error is not None:
+            raise flight.error
+        return copy.deepcopy(flight.result)
+
+    def stream(self, key: Optional[Hashable], fn: Callable[[], Iterator[Any]]) -> Iterator[Any]:
+        """
+        Yield the items of fn(), sharing one producer among concurrent callers with the same key.
+        The producer runs on a pool thread and buffers its items; every caller replays the buffer
+        from the start, so late joiners still see the whole sequence.
+        """
+        if key is None:
+            with self._lock:
+                self.calls += 1
+                self.executed += 1
+            yield from fn()
+            return
+        flight, leader = self._join(key)
+        if leader:
+            _producer_pool.submit(contextvars.copy_context().run, self._produce, key, flight, fn)
+
+        index = 0
+        while True:
+            with flight.cond:
+                while index >= len(flight.events) and not flight.done:
+                    flight.cond.wait()
+                batch = flight.events[index:]
+                finished = flight.done
+            index += len(batch)
+            for item in batch:
+                yield copy.deepcopy(item)
+            if finished and index >= len(flight.events):
+                if flight.error is not None:
+                    raise flight.error
+                return
+
+    def _produce(self, key: Hashable, flight: _Flight, fn: Callable[[], Iterator[Any]]):
+        try:
+            for item in fn():
+                with flight.cond:
+                    flight.events.append(item)
+                    flight.cond.notify_all()
+        except BaseException as e:
+            logger.error(f"{self.name}: shared request {key} failed: {str(e)}")
+            flight.error = e
+        finally:
+            self._finish(key, flight)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "calls": self.calls,
+                "executed": self.executed,
+                "coalesced": self.coalesced,
+                "in_flight": len(self._flights)
+            }